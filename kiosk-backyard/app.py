@@ -4,14 +4,31 @@ Smart Roadster Kiosk API Server
 Flask-based JSON API server for the kiosk system
 """
 
+import os
+import sys
+
+# 本番モードは eventlet で動かす（他のモジュールより先にモンキーパッチする）
+# 合成ワーカーは compositor_worker から起動するため、このファイルはワーカーでは読み込まれない
+PRODUCTION = os.getenv('KIOSK_SERVER_MODE') == 'production' or '--production' in sys.argv
+if PRODUCTION:
+    import eventlet
+    eventlet.monkey_patch()
+
+# 起動プロファイル（--profile-startup）のため最初に読み込む
+from startup_profiler import StartupProfiler
+startup_profiler = StartupProfiler()
+startup_profiler.start('imports')
+
 from flask import Flask, jsonify, request, send_file
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
-import sys
-import os
+import signal
+import socket
+import time
+import argparse
 import json
+import logging
 from datetime import datetime
-import random
 import requests
 import threading
 import queue
@@ -20,19 +37,55 @@ import base64
 import io
 import yaml
 import re
+import random
+from collections import OrderedDict, deque
 from concurrent.futures import ThreadPoolExecutor
-import ollama
-import anthropic
-from zundamon_compositor import ZundamonCompositor
+# ollama / anthropic / numpy（合成器・雨予測）は初回利用時に読み込む
+from lipsync import build_mouth_timeline
+from kiosk_logging import get_logger, setup_logging
+from llm_router import LLMBackend, LLMRouter
+from sensor_push import ChangeThrottle, position_changed
+from shutdown_coordinator import ShutdownCoordinator
 import hashlib
 from pathlib import Path
 
 # 既存モジュールのパスを追加
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
+from sensors.gps_reader import GPSReader
+from sensors.reverse_geocoder import MunicipalityIndex, MunicipalityTracker
+from sensors.weather_checker import WeatherChecker
+from sensors.weather_service import WeatherDataService
+from voice.speak import ZundamonSpeaker
+
+startup_profiler.stop('imports')
+
+# 設定ファイル
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SETTINGS_PATH = Path(os.getenv('KIOSK_SETTINGS', PROJECT_ROOT / 'config' / 'settings.yaml'))
+GPS_SAMPLE_LOG = PROJECT_ROOT / 'sensors' / 'samples' / 'tokyo_station_east.nmea'
+
+def load_settings():
+    """config/settings.yaml を読み込む"""
+    try:
+        with open(SETTINGS_PATH, 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f) or {}
+    except Exception as e:
+        print(f"設定ファイル読み込みエラー: {e}")
+        return {}
+
+settings = load_settings()
+
+# 構造化ログ
+setup_logging(settings.get('logging', {}))
+voice_log = get_logger('voice')
+llm_log = get_logger('llm')
+mandan_log = get_logger('mandan')
+socket_log = get_logger('socket')
+
 app = Flask(__name__)
 CORS(app)  # フロントエンドからのアクセスを許可
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet' if PRODUCTION else 'threading')
 
 # グローバル変数（簡易的な状態管理）
 voice_status = {
@@ -43,8 +96,42 @@ voice_status = {
 # 音声合成キュー
 voice_queue = queue.Queue()
 
-# ずんだもん画像合成器を初期化
+# ずんだもん画像合成器と合成ワーカープールを初期化
 zundamon_compositor = None
+compositor_pool = None
+mandan_store = None
+
+# GPSリーダーと市区町村の出入り検出（init_gpsで初期化）
+gps_reader = None
+municipality_tracker = None
+
+# 定型文（voice/zundamon.json）
+zundamon_speaker = ZundamonSpeaker()
+
+# 天気情報（init_weatherで初期化）と最新スナップショット
+weather_service = None
+weather_snapshot = None
+
+# センサーデータのプッシュ判定（変化しきい値・レート制限）
+gps_push_throttle = ChangeThrottle(
+    settings.get('gps', {}).get('push_min_interval', 1.0),
+    position_changed(settings.get('gps', {}).get('location_change_threshold', 0.001))
+)
+weather_push_throttle = ChangeThrottle(settings.get('weather', {}).get('push_min_interval', 60))
+
+# シャットダウン時に保存し、次回起動時に復元する状態
+shutdown_settings = settings.get('shutdown', {})
+shutdown_coordinator = ShutdownCoordinator(
+    shutdown_settings.get('state_dir', '/app/cache/state'),
+    shutdown_settings.get('flush_budget', 3.0)
+)
+
+# 生成済み漫談の履歴（LLMが使えない時のフォールバックにも使う）
+mandan_history = deque(maxlen=shutdown_settings.get('mandan_history_size', 50))
+
+# 診断用エンドポイント（/api/debug/*）とサンプリングプロファイラ（初回利用時に生成）
+debug_settings = settings.get('debug', {})
+sampling_profiler = None
 
 class VoicevoxClient:
     """VOICEVOX ENGINEクライアント"""
@@ -55,14 +142,27 @@ class VoicevoxClient:
         self.cache_dir = Path("/app/cache/voice/")
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.max_cache_size = 512 * 1024 * 1024  # 512MB
+        # 接続確認の結果キャッシュ（タスクごとに /version を叩かない）
+        self.availability_ttl = 10
+        self._available = False
+        self._available_checked_at = float('-inf')
+        # キャッシュ索引（ファイル名 → サイズ、古い順）。初回利用時にディレクトリを走査する
+        self._cache_index = None
+        self._cache_size = 0
+        self._cache_lock = threading.Lock()
 
     def is_available(self):
-        """VOICEVOX ENGINEが利用可能かチェック"""
+        """VOICEVOX ENGINEが利用可能かチェック（結果は availability_ttl 秒キャッシュ）"""
+        now = time.monotonic()
+        if now - self._available_checked_at < self.availability_ttl:
+            return self._available
         try:
             response = requests.get(f"{self.base_url}/version", timeout=5)
-            return response.status_code == 200
+            self._available = response.status_code == 200
         except Exception:
-            return False
+            self._available = False
+        self._available_checked_at = now
+        return self._available
 
     def get_speakers(self):
         """利用可能な話者一覧を取得"""
@@ -79,101 +179,182 @@ class VoicevoxClient:
         key_string = f"{text}_{speaker_id}"
         return hashlib.md5(key_string.encode('utf-8')).hexdigest()
 
-    def _get_cache_size(self):
-        """現在のキャッシュサイズを取得"""
-        total_size = 0
-        try:
-            for cache_file in self.cache_dir.glob("*.wav"):
-                total_size += cache_file.stat().st_size
-        except Exception as e:
-            print(f"キャッシュサイズ取得エラー: {e}")
-        return total_size
+    def _get_lipsync_cache_file(self, cache_file):
+        """音声キャッシュに対応する口形状タイムラインのキャッシュファイル"""
+        return cache_file.with_suffix('.lipsync.json')
 
-    def _cleanup_cache(self):
-        """キャッシュサイズが上限を超えた場合、古いファイルを削除"""
+    def _ensure_cache_index(self):
+        """キャッシュ索引がなければディレクトリを走査して作成（ロック内で呼ぶ）"""
+        if self._cache_index is not None:
+            return
+        entries = []
         try:
-            current_size = self._get_cache_size()
-            if current_size <= self.max_cache_size:
-                return
-
-            # ファイルを最終アクセス時刻でソート（古い順）
-            cache_files = []
             for cache_file in self.cache_dir.glob("*.wav"):
                 try:
                     stat = cache_file.stat()
-                    cache_files.append((cache_file, stat.st_atime, stat.st_size))
+                    entries.append((cache_file.name, stat.st_atime, stat.st_size))
                 except Exception:
                     continue
+        except Exception as e:
+            print(f"キャッシュ索引作成エラー: {e}")
+        entries.sort(key=lambda x: x[1])  # アクセス時刻でソート
+        self._set_cache_index((name, size) for name, _, size in entries)
+
+    def _set_cache_index(self, entries):
+        self._cache_index = OrderedDict(entries)
+        self._cache_size = sum(self._cache_index.values())
+
+    def _touch_cache_entry(self, cache_file, size=None):
+        """キャッシュ索引のエントリを最新にする（sizeを渡すと追加・更新）"""
+        with self._cache_lock:
+            self._ensure_cache_index()
+            if size is not None:
+                self._cache_size += size - self._cache_index.get(cache_file.name, 0)
+                self._cache_index[cache_file.name] = size
+            if cache_file.name in self._cache_index:
+                self._cache_index.move_to_end(cache_file.name)
+
+    def _remove_cache_entry(self, cache_file):
+        with self._cache_lock:
+            self._ensure_cache_index()
+            self._cache_size -= self._cache_index.pop(cache_file.name, 0)
 
-            cache_files.sort(key=lambda x: x[1])  # アクセス時刻でソート
+    def _get_cache_size(self):
+        """現在のキャッシュサイズを取得"""
+        with self._cache_lock:
+            self._ensure_cache_index()
+            return self._cache_size
 
-            # 上限以下になるまで古いファイルを削除
-            for cache_file, _, file_size in cache_files:
-                if current_size <= self.max_cache_size:
-                    break
-                try:
-                    cache_file.unlink()
-                    current_size -= file_size
-                    print(f"キャッシュファイル削除: {cache_file.name}")
-                except Exception as e:
-                    print(f"キャッシュファイル削除エラー: {e}")
+    def _cleanup_cache(self):
+        """キャッシュサイズが上限を超えた場合、古いファイルを削除"""
+        try:
+            with self._cache_lock:
+                self._ensure_cache_index()
+                # 上限以下になるまで古いファイルを削除
+                while self._cache_size > self.max_cache_size and self._cache_index:
+                    name, file_size = self._cache_index.popitem(last=False)
+                    self._cache_size -= file_size
+                    cache_file = self.cache_dir / name
+                    try:
+                        cache_file.unlink(missing_ok=True)
+                        self._get_lipsync_cache_file(cache_file).unlink(missing_ok=True)
+                        print(f"キャッシュファイル削除: {name}")
+                    except Exception as e:
+                        print(f"キャッシュファイル削除エラー: {e}")
 
         except Exception as e:
             print(f"キャッシュクリーンアップエラー: {e}")
 
-    def synthesize(self, text, speaker_id=3):
-        """音声合成を実行"""
+    def save_cache_index(self, state_dir):
+        """キャッシュ索引を保存（シャットダウン時）"""
+        with self._cache_lock:
+            entries = list(self._cache_index.items()) if self._cache_index is not None else None
+        if entries is not None:
+            (state_dir / 'index.json').write_text(json.dumps(entries), encoding='utf-8')
+
+    def restore_cache_index(self, state_dir):
+        """保存済みの索引を読み込み、ディレクトリの走査を省略（起動時）"""
+        entries = json.loads((state_dir / 'index.json').read_text(encoding='utf-8'))
+        with self._cache_lock:
+            # 前回のシャットダウン後に消えたファイルは除外
+            self._set_cache_index((name, size) for name, size in entries if (self.cache_dir / name).exists())
+        print(f"[キャッシュ] 音声キャッシュ索引を復元: {len(self._cache_index)}件")
+
+    def audio_query(self, text, speaker_id=3):
+        """音声クエリ（モーラ・音素タイミングを含む）を生成"""
+        query_response = requests.post(
+            f"{self.base_url}/audio_query",
+            params={"text": text, "speaker": speaker_id},
+            timeout=10
+        )
+        query_response.raise_for_status()
+        return query_response.json()
+
+    def synthesize(self, text, speaker_id=3, with_lipsync=False):
+        """
+        音声合成を実行
+
+        with_lipsync=True の場合は (音声データ, 口形状タイムライン) を返す
+        """
         try:
             # 1. 音声クエリを生成
-            query_response = requests.post(
-                f"{self.base_url}/audio_query",
-                params={"text": text, "speaker": speaker_id},
-                timeout=10
-            )
-            query_response.raise_for_status()
+            query = self.audio_query(text, speaker_id)
 
             # 2. 音声合成を実行
             synthesis_response = requests.post(
                 f"{self.base_url}/synthesis",
                 params={"speaker": speaker_id},
-                json=query_response.json(),
+                json=query,
                 timeout=30
             )
             synthesis_response.raise_for_status()
 
+            if with_lipsync:
+                return synthesis_response.content, build_mouth_timeline(query)
             return synthesis_response.content
 
         except Exception as e:
-            print(f"音声合成エラー: {e}")
+            voice_log.event('synthesize_error', logging.ERROR, error=str(e), chars=len(text))
             raise
 
-    def synthesize_with_cache(self, text, speaker_id=3, cache_mode='use'):
-        """キャッシュ機能付き音声合成"""
+    def _load_cached_lipsync(self, cache_file, text, speaker_id):
+        """キャッシュ済み口形状タイムラインを取得（なければaudio_queryのみで再生成）"""
+        lipsync_file = self._get_lipsync_cache_file(cache_file)
+        try:
+            if lipsync_file.exists():
+                return json.loads(lipsync_file.read_text(encoding='utf-8'))
+        except Exception as e:
+            voice_log.event('lipsync_load_error', logging.WARNING, error=str(e))
+
+        lipsync = build_mouth_timeline(self.audio_query(text, speaker_id))
+        self._save_lipsync(lipsync_file, lipsync)
+        return lipsync
+
+    def _save_lipsync(self, lipsync_file, lipsync):
+        """口形状タイムラインをキャッシュに保存"""
+        try:
+            lipsync_file.write_text(json.dumps(lipsync, ensure_ascii=False), encoding='utf-8')
+        except Exception as e:
+            voice_log.event('lipsync_save_error', logging.WARNING, error=str(e))
+
+    def synthesize_with_cache(self, text, speaker_id=3, cache_mode='use', with_lipsync=False):
+        """
+        キャッシュ機能付き音声合成
+
+        with_lipsync=True の場合は (音声データ, 口形状タイムライン) を返す
+        """
         try:
             cache_key = self._generate_cache_key(text, speaker_id)
             cache_file = self.cache_dir / f"{cache_key}.wav"
+            lipsync_file = self._get_lipsync_cache_file(cache_file)
 
             # bypassモード: キャッシュを使わず、保存もしない
             if cache_mode == 'bypass':
-                print(f"[キャッシュ] bypass モード: {text[:30]}...")
-                return self.synthesize(text, speaker_id)
+                with voice_log.timed('cache_bypass', chars=len(text), speaker=speaker_id):
+                    return self.synthesize(text, speaker_id, with_lipsync)
 
             # invalidateモード: キャッシュファイルを削除
             if cache_mode == 'invalidate':
                 if cache_file.exists():
                     cache_file.unlink()
-                    print(f"[キャッシュ] invalidate: {cache_file.name}")
+                    self._remove_cache_entry(cache_file)
+                    voice_log.event('cache_invalidate', file=cache_file.name)
+                lipsync_file.unlink(missing_ok=True)
 
             # useモード: キャッシュがあれば使用
             if cache_mode in ['use', 'invalidate'] and cache_file.exists():
-                print(f"[キャッシュ] ヒット: {cache_file.name}")
-                # ファイルのアクセス時刻を更新（LRU用）
+                voice_log.event('cache_hit', logging.DEBUG, file=cache_file.name)
+                # ファイルのアクセス時刻と索引を更新（LRU用）
                 cache_file.touch()
-                return cache_file.read_bytes()
+                self._touch_cache_entry(cache_file)
+                audio_data = cache_file.read_bytes()
+                if with_lipsync:
+                    return audio_data, self._load_cached_lipsync(cache_file, text, speaker_id)
+                return audio_data
 
             # キャッシュがない場合は音声合成を実行
-            print(f"[キャッシュ] ミス: {text[:30]}...")
-            audio_data = self.synthesize(text, speaker_id)
+            with voice_log.timed('cache_miss', chars=len(text), speaker=speaker_id):
+                audio_data, lipsync = self.synthesize(text, speaker_id, with_lipsync=True)
 
             # bypassモード以外はキャッシュに保存
             if cache_mode != 'bypass':
@@ -183,14 +364,18 @@ class VoicevoxClient:
 
                     # キャッシュファイルに保存
                     cache_file.write_bytes(audio_data)
-                    print(f"[キャッシュ] 保存: {cache_file.name}")
+                    self._touch_cache_entry(cache_file, len(audio_data))
+                    self._save_lipsync(lipsync_file, lipsync)
+                    voice_log.event('cache_save', logging.DEBUG, file=cache_file.name, bytes=len(audio_data))
                 except Exception as e:
-                    print(f"[キャッシュ] 保存エラー: {e}")
+                    voice_log.event('cache_save_error', logging.ERROR, error=str(e))
 
+            if with_lipsync:
+                return audio_data, lipsync
             return audio_data
 
         except Exception as e:
-            print(f"キャッシュ付き音声合成エラー: {e}")
+            voice_log.event('synthesize_with_cache_error', logging.ERROR, error=str(e), cache_mode=cache_mode)
             raise
 
 # VOICEVOX クライアントを初期化
@@ -199,9 +384,22 @@ voicevox_client = VoicevoxClient()
 class OllamaClient:
     """Ollama LLMクライアント"""
 
-    def __init__(self, base_url=None):
+    def __init__(self, base_url=None, keep_alive=None):
         self.base_url = base_url or os.getenv('OLLAMA_URL', 'http://ollama:11434')
-        self.client = ollama.Client(host=self.base_url)
+        self._client = None
+        # モデルをメモリに残す時間（Ollamaの既定は5分で、アイドル後の最初の漫談でモデルの読み込みを待つ）
+        self.keep_alive = keep_alive
+        # モデル名 → 処理させたシステムプロンプト
+        self._sessions = {}
+        self._session_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """ollama.Client（初回利用時に生成）"""
+        if self._client is None:
+            import ollama
+            self._client = ollama.Client(host=self.base_url)
+        return self._client
 
     def is_available(self):
         """Ollamaが利用可能かチェック"""
@@ -229,32 +427,128 @@ class OllamaClient:
 
     def generate(self, model, prompt, **kwargs):
         """テキスト生成"""
+        if self.keep_alive is not None:
+            kwargs.setdefault('keep_alive', self.keep_alive)
         try:
             response = self.client.generate(
                 model=model,
                 prompt=prompt,
                 **kwargs
             )
+            self._log_timings(model, response)
             return response['response']
         except Exception as e:
             print(f"テキスト生成エラー: {e}")
             raise
 
+    def _log_timings(self, model, response):
+        """モデル読み込み・プロンプト処理・生成の所要時間を記録"""
+        try:
+            llm_log.event(
+                'ollama_timings', model=model,
+                load_ms=round((response.get('load_duration') or 0) / 1e6),
+                prompt_tokens=response.get('prompt_eval_count') or 0,
+                prompt_ms=round((response.get('prompt_eval_duration') or 0) / 1e6),
+                eval_tokens=response.get('eval_count') or 0,
+                eval_ms=round((response.get('eval_duration') or 0) / 1e6)
+            )
+        except Exception:
+            pass
+
+    def start_session(self, model, system_prompt):
+        """モデルを読み込んでシステムプロンプトだけを処理させておく
+
+        Ollama は直前と同じ先頭部分の処理結果（KVキャッシュ）を使い回すため、
+        以降の生成では同じシステムメッセージから始まる会話を送ればプレフィックスの再処理を省ける。
+        """
+        started = time.time()
+        response = self.client.chat(
+            model=model,
+            messages=[{'role': 'system', 'content': system_prompt}],
+            keep_alive=self.keep_alive,
+            options={'num_predict': 1}
+        )
+        with self._session_lock:
+            self._sessions[model] = system_prompt
+        print(f"✅ Ollama {model} を準備しました（{time.time() - started:.2f}秒, "
+              f"プロンプト{response.get('prompt_eval_count') or 0}トークン）")
+
+    def _session_messages(self, model, system_prompt, prompt):
+        """システムプロンプトから始まる会話（モデルが未準備なら先に準備する）"""
+        with self._session_lock:
+            ready = self._sessions.get(model) == system_prompt
+        if not ready:
+            try:
+                self.start_session(model, system_prompt)
+            except Exception as e:
+                print(f"Ollamaセッション準備エラー: {e}")
+        return [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': prompt}
+        ]
+
+    def generate_in_session(self, model, system_prompt, prompt, **kwargs):
+        """処理済みのシステムプロンプトに続けて生成（プレフィックスの再処理を省く）"""
+        if self.keep_alive is not None:
+            kwargs.setdefault('keep_alive', self.keep_alive)
+        response = self.client.chat(model=model, messages=self._session_messages(model, system_prompt, prompt),
+                                    **kwargs)
+        self._log_timings(model, response)
+        return response['message']['content']
+
+    def stream(self, model, prompt, **kwargs):
+        """テキストを生成しながら少しずつ返す"""
+        if self.keep_alive is not None:
+            kwargs.setdefault('keep_alive', self.keep_alive)
+        for part in self.client.generate(model=model, prompt=prompt, stream=True, **kwargs):
+            if part.get('done'):
+                self._log_timings(model, part)
+            yield part['response']
+
+    def stream_in_session(self, model, system_prompt, prompt, **kwargs):
+        """generate_in_session のストリーミング版"""
+        if self.keep_alive is not None:
+            kwargs.setdefault('keep_alive', self.keep_alive)
+        messages = self._session_messages(model, system_prompt, prompt)
+        for part in self.client.chat(model=model, messages=messages, stream=True, **kwargs):
+            if part.get('done'):
+                self._log_timings(model, part)
+            yield part['message']['content']
+
 # Ollama クライアントを初期化
-ollama_client = OllamaClient()
+ollama_settings = settings.get('ollama', {})
+ollama_client = OllamaClient(keep_alive=ollama_settings.get('keep_alive'))
+
+mandan_settings = settings.get('mandan', {})
+
+def mandan_num_predict(maxlength):
+    """最大文字数から生成トークン数の上限を決める（YAMLの項目分を上乗せ）"""
+    tokens_per_char = ollama_settings.get('tokens_per_char', 2.0)
+    reserve = ollama_settings.get('reserve_tokens', 300)
+    return int(int(maxlength) * tokens_per_char) + reserve
 
 class ClaudeClient:
     """Claude API クライアント"""
 
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, base_url=None):
         self.api_key = api_key or os.getenv('CLAUDE_API_KEY')
-        self.client = None
-        if self.api_key:
+        # テスト時は benchmarks/llm_stub.py などに向ける
+        self.base_url = base_url or os.getenv('CLAUDE_BASE_URL')
+        self.model = "claude-3-haiku-20240307"
+        self._client = None
+        self._init_failed = False
+
+    @property
+    def client(self):
+        """anthropic.Anthropic（初回利用時に生成）"""
+        if self._client is None and self.api_key and not self._init_failed:
             try:
-                self.client = anthropic.Anthropic(api_key=self.api_key)
+                import anthropic
+                self._client = anthropic.Anthropic(api_key=self.api_key, base_url=self.base_url)
             except Exception as e:
                 print(f"Claude APIクライアント初期化エラー: {e}")
-                self.client = None
+                self._init_failed = True
+        return self._client
 
     def is_available(self):
         """Claude APIが利用可能かチェック"""
@@ -267,33 +561,74 @@ class ClaudeClient:
         except Exception:
             return False
 
-    def generate(self, prompt, max_tokens=1000):
+    def _request(self, prompt, max_tokens, system=None):
+        """messages API の引数（system は毎回同じ固定の指示として、キャッシュ可能なプレフィックスにする）
+
+        キャッシュするのは system の固定の指示だけで、トピックなど毎回変わる内容は messages に入れる。
+        """
+        request = {
+            'model': self.model,
+            'max_tokens': max_tokens,
+            'messages': [
+                {"role": "user", "content": prompt}
+            ]
+        }
+        if system:
+            request['system'] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        return request
+
+    def _log_usage(self, usage):
+        """入力トークンのうちキャッシュから読んだ・書いた分を記録"""
+        try:
+            llm_log.event(
+                'claude_usage', model=self.model,
+                input_tokens=usage.input_tokens,
+                cache_read_tokens=getattr(usage, 'cache_read_input_tokens', 0) or 0,
+                cache_write_tokens=getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+                output_tokens=usage.output_tokens
+            )
+        except Exception:
+            pass
+
+    def generate(self, prompt, max_tokens=1000, system=None):
         """テキスト生成"""
         try:
             if not self.client:
                 raise Exception("Claude APIクライアントが初期化されていません")
 
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=max_tokens,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            response = self.client.messages.create(**self._request(prompt, max_tokens, system))
+            self._log_usage(response.usage)
 
             return response.content[0].text
         except Exception as e:
             print(f"Claude API テキスト生成エラー: {e}")
             raise
 
+    def stream(self, prompt, max_tokens=1000, system=None):
+        """テキストを生成しながら少しずつ返す"""
+        if not self.client:
+            raise Exception("Claude APIクライアントが初期化されていません")
+
+        with self.client.messages.stream(**self._request(prompt, max_tokens, system)) as stream:
+            yield from stream.text_stream
+            self._log_usage(stream.get_final_message().usage)
+
 # Claude クライアントを初期化
 claude_client = ClaudeClient()
 
-# 漫談生成用のプロンプトテンプレート
-MANDAN_PROMPT = """あなたはずんだもんです。与えられたトピックについて、ずんだもんらしい短い漫談を作ってください。
+# 漫談生成のLLM選択（レイテンシ・エラー率の記録とヘッジ）
+router_settings = settings.get('llm_router', {})
+llm_router = LLMRouter(
+    slo_ms=router_settings.get('slo_ms', 4000),
+    hedge_after_ms=router_settings.get('hedge_after_ms', 2500),
+    max_error_rate=router_settings.get('max_error_rate', 0.5),
+    window=router_settings.get('window', 20),
+    cooldown=router_settings.get('cooldown', 60),
+    timeout=router_settings.get('timeout', 120)
+)
 
-トピック: {topic}
-最大文字数: {maxlength}
+# 漫談生成用のプロンプト（固定の指示。OllamaではKVキャッシュ、Claudeではプロンプトキャッシュで処理を使い回す）
+MANDAN_SYSTEM_PROMPT = """あなたはずんだもんです。与えられたトピックについて、ずんだもんらしい短い漫談を作ってください。
 
 以下の YAML 形式で厳密に出力してください：
 
@@ -310,7 +645,7 @@ zundamonImage:
 --- ← YAMLドキュメントの終了を示す
 
 注意：
-- 漫談は{maxlength}文字以内
+- 漫談は指定された最大文字数以内
 - ずんだもんの口調（のだ）を使用
 - zundamonImageのすべての項目は必須
 - 値は必ず指定された候補から1つを厳密に選ぶこと
@@ -319,6 +654,20 @@ zundamonImage:
 - YAML 以外の内容は絶対に出力しないこと
 - 楽しく親しみやすい内容にする"""
 
+# 漫談ごとに変わる部分
+MANDAN_TOPIC_PROMPT = """トピック: {topic}
+最大文字数: {maxlength}"""
+
+# 複数のトピックの漫談を1回の生成でまとめて作る
+MANDAN_BATCH_PROMPT = """以下のトピックそれぞれについて漫談を作ってください。
+
+トピック:
+{topic_list}
+最大文字数: {maxlength}（1つの漫談あたり）
+
+トピックごとに上の YAML 形式のドキュメントを1つずつ、トピックの順に出力してください。
+各ドキュメントの sentence の前に topic: としてトピックをそのまま記述すること。"""
+
 # デフォルトのずんだもんパラメータ
 DEFAULT_ZUNDAMON_PARAMS = {
     'head_direction': '正面向き',
@@ -338,24 +687,127 @@ def extract_yaml_from_response(response_text: str) -> str:
     else:
         raise ValueError("YAML形式が見つかりません")
 
+def validate_zundamon_params(value) -> dict:
+    """LLMが出力した zundamonImage を合成に使えるパラメータにする（使えなければデフォルト）
+
+    辞書でないもの、知らないキー、文字列にできない値は捨てる。
+    """
+    if not isinstance(value, dict):
+        return dict(DEFAULT_ZUNDAMON_PARAMS)
+    params = {key: str(value[key]) for key in ZUNDAMON_PARAM_KEYS + ['something_like_shippo']
+              if isinstance(value.get(key), (str, int, float, bool))}
+    return params or dict(DEFAULT_ZUNDAMON_PARAMS)
+
+def split_mandan_documents(response_text: str, topics: list) -> list:
+    """複数の漫談を含むレスポンスをトピックごとに分ける（見つからないトピックは None）
+
+    --- の行で区切って1つずつ読むので、崩れたドキュメントがあっても他の結果は使える。
+    ```yaml のようなコードブロックの行は YAML として読めないので先に取り除く。
+    """
+    response_text = re.sub(r'^\s*```.*$', '', response_text, flags=re.MULTILINE)
+    documents = []
+    for chunk in re.split(r'^---.*$', response_text, flags=re.MULTILINE):
+        try:
+            data = yaml.safe_load(chunk)
+        except yaml.YAMLError:
+            continue
+        if isinstance(data, dict) and data.get('sentence'):
+            documents.append(data)
+
+    results = {}
+    unmatched = []
+    for document in documents:
+        topic = str(document.get('topic', '')).strip()
+        if topic in topics and topic not in results:
+            results[topic] = document
+        else:
+            unmatched.append(document)
+    # topic が書かれていない・崩れているものは順番で割り当てる
+    for topic in topics:
+        if topic not in results and unmatched:
+            results[topic] = unmatched.pop(0)
+    return [results.get(topic) for topic in topics]
+
+def find_reusable_mandan(topic):
+    """LLMを呼ばずに使える保存済み漫談（新しさ・繰り返しの条件を満たすもの）
+
+    regenerate_ratio の割合で見つかっても使わず、新しく生成して内容を入れ替えていく。
+    """
+    if not mandan_store or random.random() < mandan_settings.get('regenerate_ratio', 0.3):
+        return None
+    return mandan_store.lookup(
+        topic,
+        max_age=mandan_settings.get('reuse_max_age', 86400),
+        repeat_interval=mandan_settings.get('repeat_interval', 1800)
+    )
+
+def mandan_backends(model, prompt, max_tokens, num_predict):
+    """漫談生成の候補（固定の指示は Ollama・Claude ともに毎回同じシステムプロンプトとして送り、先頭部分の処理を使い回す）"""
+    return [
+        LLMBackend(
+            'ollama', model,
+            lambda: ollama_client.stream_in_session(
+                model, MANDAN_SYSTEM_PROMPT, prompt, options={'num_predict': num_predict}
+            ),
+            ollama_client.is_available
+        ),
+        LLMBackend(
+            'claude', claude_client.model,
+            lambda: claude_client.stream(prompt, max_tokens=max_tokens, system=MANDAN_SYSTEM_PROMPT),
+            claude_client.is_available
+        )
+    ]
+
+def zundamon_content_url(content_key: str, format_type: str = 'PNG') -> str:
+    """内容のハッシュで決まる画像URL（内容が変わらないのでブラウザ・nginxで長期キャッシュできる）"""
+    return f"/api/zundamon/img/{content_key}.{'png' if format_type.upper() == 'PNG' else 'jpg'}"
+
 def generate_zundamon_image_url(params: dict) -> str:
     """ずんだもん画像のURLを生成"""
     if not zundamon_compositor:
         return '/api/zundamon/generate'
 
     try:
-        # 画像を生成してBase64データURLとして返す
-        img_buffer = zundamon_compositor.compose_image(params, 'PNG')
-        img_b64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
-        return f"data:image/png;base64,{img_b64}"
+        # 先に合成してキャッシュに載せておき、Base64データURLの代わりに短い不変URLを返す
+        compose_zundamon_image(params, 'PNG')
+        return zundamon_content_url(zundamon_compositor.register_content(params, 'PNG'))
     except Exception as e:
         print(f"ずんだもん画像生成エラー: {e}")
         return '/api/zundamon/generate'
 
+def run_blocking(func, *args, **kwargs):
+    """CPUを使う処理を実行（本番モードではOSスレッドで実行し、eventletのハブを止めない）"""
+    if PRODUCTION:
+        from eventlet import tpool
+        return tpool.execute(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+def compose_zundamon_image(params, format_type='PNG'):
+    """ずんだもん画像を合成（合成ワーカープールがあればそちらで実行）"""
+    if compositor_pool:
+        # ワーカーとの通信はパイプの読み書きだけなのでそのまま呼ぶ（eventletでも協調的に待つ）
+        return io.BytesIO(compositor_pool.compose(params, format_type))
+    return run_blocking(zundamon_compositor.compose_image, params, format_type)
+
+def compose_zundamon_patch(previous, params, format_type='PNG'):
+    """ずんだもんの差分画像を合成（合成ワーカープールがあれば範囲の合成はそちらで実行）"""
+    if compositor_pool:
+        return compositor_pool.compose_patch(previous, params, format_type)
+    return run_blocking(zundamon_compositor.compose_patch, previous, params, format_type)
+
+def start_voice_workers():
+    """音声合成キューのワーカーを起動（起動時に1回だけ）"""
+    workers = settings.get('voice', {}).get('synthesis_workers', 2)
+    for _ in range(workers):
+        socketio.start_background_task(process_voice_queue)
+    print(f"✅ 音声合成ワーカーを{workers}個起動しました")
+
 def process_voice_queue():
-    """音声合成キューを処理"""
-    while not voice_queue.empty():
+    """音声合成キューを処理（キューが空の間は待機）"""
+    while True:
         task = voice_queue.get()
+        started = time.perf_counter()
+        wait_ms = round((datetime.now() - datetime.fromisoformat(task['timestamp'])).total_seconds() * 1000, 1)
 
         # 処理開始通知
         socketio.emit('voice_processing', {
@@ -367,21 +819,40 @@ def process_voice_queue():
             # VOICEVOX で音声合成（キャッシュ機能付き）
             if voicevox_client.is_available():
                 cache_mode = task.get('cache_mode', 'use')
-                audio_data = voicevox_client.synthesize_with_cache(
-                    task['text'],
-                    task['speaker_id'],
-                    cache_mode
-                )
+                lipsync = None
+                if task.get('lipsync'):
+                    audio_data, lipsync = voicevox_client.synthesize_with_cache(
+                        task['text'],
+                        task['speaker_id'],
+                        cache_mode,
+                        with_lipsync=True
+                    )
+                else:
+                    audio_data = voicevox_client.synthesize_with_cache(
+                        task['text'],
+                        task['speaker_id'],
+                        cache_mode
+                    )
 
                 # 音声データをBase64エンコードして送信
                 audio_b64 = base64.b64encode(audio_data).decode('utf-8')
 
-                socketio.emit('voice_ready', {
+                ready_data = {
                     'task_id': task['task_id'],
                     'audio_data': audio_b64,
                     'format': 'wav',
                     'text': task['text']
-                }, room=task['client_id'])
+                }
+                if lipsync:
+                    ready_data['lipsync'] = lipsync
+
+                socketio.emit('voice_ready', ready_data, room=task['client_id'])
+                voice_log.event(
+                    'task', chars=len(task['text']), cache_mode=cache_mode,
+                    wait_ms=wait_ms,
+                    duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                    queue_size=voice_queue.qsize()
+                )
 
                 # ステータス更新
                 global voice_status
@@ -397,7 +868,7 @@ def process_voice_queue():
                 }, room=task['client_id'])
 
         except Exception as e:
-            print(f"音声合成エラー: {e}")
+            voice_log.event('task_error', logging.ERROR, error=str(e), task_id=task['task_id'])
             socketio.emit('voice_error', {
                 'task_id': task['task_id'],
                 'error': str(e),
@@ -408,7 +879,7 @@ def process_voice_queue():
 @socketio.on('connect')
 def handle_connect():
     """クライアント接続時の処理"""
-    print(f'WebSocketクライアント接続: {request.sid}')
+    socket_log.event('connect', sid=request.sid)
 
     # 接続状態とシステム状態を送信
     emit('status', {
@@ -418,10 +889,17 @@ def handle_connect():
         'queue_size': voice_queue.qsize()
     })
 
+    # 最新のセンサーデータを接続したクライアントにだけ送信
+    gps_data = build_gps_payload()
+    if gps_data:
+        emit('gps_update', {'data': gps_data, 'timestamp': datetime.now().isoformat()})
+    if weather_snapshot:
+        emit('weather_update', {'data': weather_snapshot, 'timestamp': datetime.now().isoformat()})
+
 @socketio.on('disconnect')
 def handle_disconnect():
     """クライアント切断時の処理"""
-    print(f'WebSocketクライアント切断: {request.sid}')
+    socket_log.event('disconnect', sid=request.sid)
 
 @socketio.on('voice_synthesize')
 def handle_voice_synthesize(data):
@@ -431,6 +909,7 @@ def handle_voice_synthesize(data):
         speaker_id = data.get('speaker', 3)  # デフォルトはずんだもん
         priority = data.get('priority', 'normal')
         cache_mode = data.get('cache', 'use')  # キャッシュ制御パラメータ
+        lipsync = bool(data.get('lipsync', False))  # 口形状タイムラインを返すか
 
         if not text:
             emit('voice_error', {
@@ -448,6 +927,7 @@ def handle_voice_synthesize(data):
             'speaker_id': speaker_id,
             'priority': priority,
             'cache_mode': cache_mode,
+            'lipsync': lipsync,
             'client_id': request.sid,
             'timestamp': datetime.now().isoformat()
         })
@@ -463,11 +943,8 @@ def handle_voice_synthesize(data):
         global voice_status
         voice_status['isPlaying'] = True
 
-        # 音声合成処理を開始（別スレッド）
-        threading.Thread(target=process_voice_queue, daemon=True).start()
-
     except Exception as e:
-        print(f"音声合成リクエストエラー: {e}")
+        voice_log.event('request_error', logging.ERROR, error=str(e))
         emit('voice_error', {
             'error': str(e)
         })
@@ -511,10 +988,12 @@ def handle_generate_mandan(data):
         topic = data.get('topic', '日常の話')
         maxlength = data.get('maxlength', 1000)
         speaker_id = data.get('speaker', 3)  # デフォルトはずんだもん
-        model = data.get('model', 'mistral')
-        provider = data.get('provider', 'ollama')  # 'ollama' または 'claude'
+        model = data.get('model', ollama_settings.get('model', 'mistral'))
+        provider = data.get('provider', 'ollama')  # 優先するプロバイダー（'ollama' / 'claude' / 'auto'）
+        with_lipsync = bool(data.get('lipsync', False))
 
-        print(f"漫談生成開始: プロバイダー={provider}, トピック={topic}, 最大文字数={maxlength}")
+        started = time.perf_counter()
+        mandan_log.event('start', provider=provider, topic=topic, maxlength=maxlength)
 
         # 処理開始通知
         emit('mandan_processing', {
@@ -524,38 +1003,23 @@ def handle_generate_mandan(data):
         })
 
         def generate_text():
-            """テキスト生成"""
+            """テキスト生成（指定のプロバイダーが遅い・使えない場合は他の候補に切り替える）"""
             try:
-                prompt = MANDAN_PROMPT.format(topic=topic, maxlength=maxlength)
-
-                if provider == 'claude':
-                    if not claude_client.is_available():
-                        raise Exception("Claude APIが利用できません")
-
-                    response = claude_client.generate(prompt, max_tokens=1500)
-
-                    # デバッグ出力を追加
-                    print(f"=== Claudeレスポンス ===")
-                    print(f"レスポンス長: {len(response)}")
-                    print(f"レスポンス内容: {response}")
-                    print(f"=== レスポンス終了 ===")
-
-                    return response
-                else:  # ollama
-                    if not ollama_client.is_available():
-                        raise Exception("Ollamaサーバーに接続できません")
-
-                    response = ollama_client.generate(model, prompt)
-
-                    # デバッグ出力を追加
-                    print(f"=== Ollamaレスポンス ===")
-                    print(f"レスポンス長: {len(response)}")
-                    print(f"レスポンス内容: {response}")
-                    print(f"=== レスポンス終了 ===")
+                backends = mandan_backends(
+                    model,
+                    MANDAN_TOPIC_PROMPT.format(topic=topic, maxlength=maxlength),
+                    max_tokens=1500,
+                    num_predict=mandan_num_predict(maxlength)
+                )
+                with llm_log.timed('generate', preferred=provider) as fields:
+                    response, backend = llm_router.generate(backends, preferred=provider)
+                    fields.update(backend=backend.key, chars=len(response))
+                # レスポンス全文は DEBUG の時だけ
+                llm_log.event('response', logging.DEBUG, backend=backend.key, text=response)
 
-                    return response
+                return response, backend.key
             except Exception as e:
-                print(f"テキスト生成エラー ({provider}): {e}")
+                llm_log.event('generate_error', logging.ERROR, preferred=provider, error=str(e))
                 raise
 
         def generate_image_and_voice(sentence, zundamon_params):
@@ -564,64 +1028,80 @@ def handle_generate_mandan(data):
                 try:
                     return generate_zundamon_image_url(zundamon_params), zundamon_params
                 except Exception as e:
-                    print(f"画像生成エラー: {e}")
+                    mandan_log.event('image_error', logging.WARNING, error=str(e))
                     return '/api/zundamon/generate', DEFAULT_ZUNDAMON_PARAMS
 
             def generate_voice():
                 try:
                     if voicevox_client.is_available():
                         # 生成AIテキストはbypassモードで音声合成（キャッシュしない）
-                        return voicevox_client.synthesize_with_cache(sentence, speaker_id, 'bypass')
-                    return None
+                        return voicevox_client.synthesize_with_cache(sentence, speaker_id, 'bypass', with_lipsync=True)
+                    return None, None
                 except Exception as e:
-                    print(f"音声生成エラー: {e}")
-                    return None
+                    mandan_log.event('voice_error', logging.WARNING, error=str(e))
+                    return None, None
 
             with ThreadPoolExecutor(max_workers=2) as executor:
                 image_future = executor.submit(generate_image)
                 voice_future = executor.submit(generate_voice)
 
                 image_url, final_params = image_future.result()
-                audio_data = voice_future.result()
-
-                return image_url, final_params, audio_data
-
-        # 1. テキスト生成
-        try:
-            response_text = generate_text()
-            yaml_content = extract_yaml_from_response(response_text)
-            parsed_data = yaml.safe_load(yaml_content)
-
-            sentence = parsed_data.get('sentence', '')
-            zundamon_params = parsed_data.get('zundamonImage', DEFAULT_ZUNDAMON_PARAMS)
-
-            if not sentence:
-                raise ValueError("漫談テキストが生成されませんでした")
-
-        except Exception as e:
-            print(f"YAML解析エラー: {e}")
-            print(f"生のレスポンス（最初の500文字）: {response_text[:500]}...")
-            print(f"生のレスポンス（最後の500文字）: ...{response_text[-500:]}")
-
-            # YAML抽出の詳細デバッグ
+                audio_data, lipsync = voice_future.result()
+
+                return image_url, final_params, audio_data, lipsync
+
+        # 1. テキスト生成（同じ・近いトピックの保存済み漫談が使えればLLMを呼ばない）
+        response_text = ''
+        generated_by = None
+        stored = find_reusable_mandan(topic) if data.get('reuse', True) else None
+        if stored:
+            sentence = stored['sentence']
+            zundamon_params = stored['zundamonParams']
+            mandan_log.event('reuse', stored_topic=stored['topic'], similarity=stored['similarity'])
+        else:
             try:
+                response_text, generated_by = generate_text()
                 yaml_content = extract_yaml_from_response(response_text)
-                print(f"抽出されたYAML: {yaml_content}")
-            except Exception as yaml_error:
-                print(f"YAML抽出失敗: {yaml_error}")
+                parsed_data = yaml.safe_load(yaml_content)
+
+                sentence = parsed_data.get('sentence', '')
+                zundamon_params = validate_zundamon_params(parsed_data.get('zundamonImage'))
 
-            # フォールバック: シンプルな漫談を生成
-            sentence = f"{topic}について話すのだ！面白い話があるのだ〜"
-            zundamon_params = DEFAULT_ZUNDAMON_PARAMS
+                if not sentence:
+                    raise ValueError("漫談テキストが生成されませんでした")
+
+            except Exception as e:
+                # YAML抽出の詳細デバッグ
+                try:
+                    extracted = extract_yaml_from_response(response_text)
+                except Exception as yaml_error:
+                    extracted = f"YAML抽出失敗: {yaml_error}"
+                mandan_log.event('parse_error', logging.WARNING, error=str(e),
+                                 head=response_text[:500], tail=response_text[-500:], yaml=extracted)
+
+                # フォールバック: 保存済みの近いトピックの漫談（古くてもよい）、同じトピックの生成済み漫談、なければシンプルな漫談
+                generated_by = None
+                stored = mandan_store.lookup(topic) if mandan_store else None
+                past = [m for m in mandan_history if m['topic'] == topic]
+                if stored:
+                    sentence = stored['sentence']
+                    zundamon_params = stored['zundamonParams']
+                elif past:
+                    sentence = past[-1]['sentence']
+                    zundamon_params = past[-1]['zundamonParams']
+                else:
+                    sentence = f"{topic}について話すのだ！面白い話があるのだ〜"
+                    zundamon_params = DEFAULT_ZUNDAMON_PARAMS
 
         # 2. 画像と音声を並行生成
         try:
-            image_url, final_params, audio_data = generate_image_and_voice(sentence, zundamon_params)
+            image_url, final_params, audio_data, lipsync = generate_image_and_voice(sentence, zundamon_params)
         except Exception as e:
-            print(f"画像・音声生成エラー: {e}")
+            mandan_log.event('image_voice_error', logging.WARNING, error=str(e))
             image_url = '/api/zundamon/generate'
             final_params = DEFAULT_ZUNDAMON_PARAMS
             audio_data = None
+            lipsync = None
 
         # 3. レスポンス構築
         response_data = {
@@ -640,13 +1120,26 @@ def handle_generate_mandan(data):
                 'format': 'wav',
                 'speaker': speaker_id
             }
+            if with_lipsync and lipsync:
+                response_data['audio']['lipsync'] = lipsync
+
+        mandan_history.append({
+            'topic': topic,
+            'sentence': sentence,
+            'zundamonParams': final_params,
+            'generatedAt': response_data['generatedAt']
+        })
+        if generated_by and mandan_store:
+            mandan_store.add(topic, sentence, zundamon_params, generated_by)
 
         # 完了通知
         emit('mandan_ready', response_data)
-        print(f"漫談生成完了: {sentence[:50]}...")
+        mandan_log.event('done', duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                         source=generated_by or ('store' if stored else 'fallback'),
+                         chars=len(sentence), audio=bool(audio_data))
 
     except Exception as e:
-        print(f"漫談生成エラー: {e}")
+        mandan_log.event('error', logging.ERROR, error=str(e))
         emit('mandan_error', {
             'error': str(e),
             'topic': data.get('topic', ''),
@@ -673,6 +1166,15 @@ def handle_get_ollama_status():
             'timestamp': datetime.now().isoformat()
         })
 
+@socketio.on('get_llm_stats')
+def handle_get_llm_stats():
+    """漫談生成に使ったLLMのレイテンシ・エラー率"""
+    emit('llm_stats', {
+        'stats': llm_router.snapshot(),
+        'slo_ms': llm_router.slo * 1000,
+        'timestamp': datetime.now().isoformat()
+    })
+
 @socketio.on('get_claude_status')
 def handle_get_claude_status():
     """Claude APIシステム状態取得"""
@@ -683,7 +1185,7 @@ def handle_get_claude_status():
         emit('claude_status', {
             'available': available,
             'api_key_configured': api_key_configured,
-            'model': 'claude-3-haiku-20240307',
+            'model': claude_client.model,
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
@@ -694,15 +1196,313 @@ def handle_get_claude_status():
             'timestamp': datetime.now().isoformat()
         })
 
+def init_mandan_store():
+    """生成済み漫談のストアを開く"""
+    global mandan_store
+    if not mandan_settings.get('store_enabled', True):
+        return
+    from mandan_store import MandanStore
+    mandan_store = MandanStore(
+        mandan_settings.get('store_path', '/app/cache/mandan.sqlite3'),
+        similarity_threshold=mandan_settings.get('similarity_threshold', 0.7),
+        max_entries=mandan_settings.get('max_entries', 5000),
+        use_similarity=mandan_settings.get('use_similarity', True)
+    )
+    print("✅ 漫談ストアを開きました")
+
 def init_zundamon():
-    """ずんだもん合成器を初期化"""
-    global zundamon_compositor
+    """ずんだもん合成器を初期化
+
+    レイヤーの読み込みと共有メモリへの展開は run_blocking で行う（本番モードでハブを止めない）。
+    ワーカーの起動と準備完了の待ち合わせはパイプの読み書きなのでこのまま行う。
+    """
+    global zundamon_compositor, compositor_pool
+    compositor_settings = settings.get('compositor', {})
     try:
-        zundamon_compositor = ZundamonCompositor()
+        from zundamon_compositor import ZundamonCompositor
+        zundamon_compositor = run_blocking(
+            ZundamonCompositor,
+            max_rendered=compositor_settings.get('max_rendered', 64),
+            max_content_index=compositor_settings.get('max_content_index', 1024),
+            tile_threads=compositor_settings.get('tile_threads', 1)
+        )
         print("✅ ずんだもん画像合成器を初期化しました")
     except Exception as e:
         print(f"❌ ずんだもん画像合成器の初期化に失敗: {e}")
         zundamon_compositor = None
+        return
+
+    # 合成をワーカープロセスで行う（0ならこのプロセス内で合成）
+    workers = compositor_settings.get('workers', 3)
+    if workers > 0:
+        try:
+            from compositor_pool import CompositorPool, SharedLayerStore
+            store = run_blocking(SharedLayerStore.create, zundamon_compositor)
+            compositor_pool = CompositorPool(zundamon_compositor, workers, store=store)
+            compositor_pool.warm_up()
+            print(f"✅ 合成ワーカーを{workers}個起動しました")
+        except Exception as e:
+            print(f"⚠️  合成ワーカーを起動できません（このプロセスで合成します）: {e}")
+            compositor_pool = None
+
+def build_gps_payload():
+    """最新fixと住所からGPSペイロードを作成"""
+    position = gps_reader.get_current_location() if gps_reader else None
+    if not position:
+        return None
+
+    address = gps_reader.reverse_geocode(position['latitude'], position['longitude'])
+    return {**position, 'address': address['formatted_address']}
+
+def on_gps_fix(fix):
+    """新しいfixを受信したら、位置が変化していればgps_updateをプッシュ"""
+    if municipality_tracker:
+        municipality_tracker.update(fix['latitude'], fix['longitude'])
+
+    if not gps_push_throttle.offer(fix):
+        return
+
+    gps_data = build_gps_payload()
+    if gps_data:
+        socketio.emit('gps_update', {
+            'data': gps_data,
+            'timestamp': datetime.now().isoformat()
+        })
+
+def on_municipality_event(event):
+    """市区町村の出入りを通知し、入った時はlocation_changeの台本を読み上げる"""
+    municipality = event['municipality']
+    socketio.emit('location_change', {
+        'type': event['type'],
+        'municipality': municipality,
+        'timestamp': datetime.now().isoformat()
+    })
+
+    if event['type'] != 'enter' or event['initial']:
+        return
+
+    text = zundamon_speaker.format_script('location_change', city=municipality['city'])
+    if not text:
+        return
+
+    # 全クライアントに配信（client_id=None でブロードキャスト）
+    voice_queue.put({
+        'task_id': str(uuid.uuid4()),
+        'text': text,
+        'speaker_id': zundamon_speaker.config.get('voice_id', 3),
+        'priority': 'normal',
+        'cache_mode': 'use',
+        'lipsync': False,
+        'client_id': None,
+        'timestamp': datetime.now().isoformat()
+    })
+
+def load_municipality_index(gps_settings):
+    """市区町村ポリゴンデータセットを読み込む"""
+    dataset = gps_settings.get('municipality_dataset')
+    if not dataset:
+        return None
+
+    dataset_path = Path(dataset)
+    if not dataset_path.is_absolute():
+        dataset_path = PROJECT_ROOT / dataset_path
+    try:
+        return MunicipalityIndex.from_geojson(dataset_path)
+    except Exception as e:
+        print(f"⚠️  市区町村データの読み込みに失敗: {e}")
+        return None
+
+# WeatherChecker の天候コード → 表示用の天候
+WEATHER_CONDITION_LABELS = {
+    'sunny': '晴れ',
+    'partly_cloudy': '晴れ時々曇り',
+    'cloudy': '曇り',
+    'rainy': '雨'
+}
+
+def current_weather_position():
+    """天気取得に使う位置と進行方向（GPSがなければ設定のデフォルト位置）"""
+    position = gps_reader.read_position() if gps_reader else None
+    if position:
+        return position['latitude'], position['longitude'], position['heading'], position['speed']
+
+    default_location = settings.get('weather', {}).get('location', {})
+    return default_location.get('latitude', 35.6812), default_location.get('longitude', 139.7671), None, None
+
+def build_weather_payload(snapshot):
+    """天気スナップショットをフロントエンド向けの形式に変換"""
+    current = snapshot['current']['current']
+    alert = snapshot['rain_alert']['alert']
+    hours_until_rain = alert.get('hours_until_rain')
+    return {
+        'temperature': round(current['temperature']),
+        'condition': WEATHER_CONDITION_LABELS.get(current['condition'], current['condition']),
+        'humidity': round(current['humidity']),
+        'rainAlert': alert['is_rain_expected'],
+        'minutesUntilRain': round(hours_until_rain * 60) if alert['is_rain_expected'] and hours_until_rain is not None else None,
+        'rainIntensity': alert.get('intensity') if alert['is_rain_expected'] else None,
+        'recommendation': snapshot['summary']['recommendation'],
+        'forecast': snapshot['forecast']['forecast'],
+        'stale': snapshot.get('stale', False)
+    }
+
+def on_weather_snapshot(snapshot):
+    """天気スナップショットが更新されたら、変化があればweather_updateをプッシュ"""
+    global weather_snapshot
+    weather_snapshot = build_weather_payload(snapshot)
+    if weather_push_throttle.offer(weather_snapshot):
+        socketio.emit('weather_update', {
+            'data': weather_snapshot,
+            'timestamp': datetime.now().isoformat()
+        })
+
+def weather_loop():
+    """現在位置の天気を定期的に再取得（取得中の同じセルへのリクエストはまとめられる）"""
+    update_interval = settings.get('weather', {}).get('update_interval', 300)
+    while True:
+        try:
+            weather_service.refresh(*current_weather_position())
+        except Exception as e:
+            print(f"天気情報更新エラー: {e}")
+        socketio.sleep(update_interval)
+
+def init_weather():
+    """天気情報の定期更新を開始"""
+    global weather_service
+    weather_settings = settings.get('weather', {})
+    if not weather_settings.get('enabled', True):
+        print("⚠️  天気予報は設定で無効化されています")
+        return
+
+    rain_settings = weather_settings.get('rain_prediction', {})
+    rain_predictor = None
+    if rain_settings.get('enabled', True):
+        from sensors.rain_predictor import OpenMeteoTileSource, RainArrivalPredictor
+        rain_predictor = RainArrivalPredictor(
+            OpenMeteoTileSource(os.getenv('RAIN_FORECAST_URL', rain_settings.get('api_url', 'https://api.open-meteo.com'))),
+            tile_size_deg=rain_settings.get('tile_size_deg', 1.0),
+            grid_step_deg=rain_settings.get('grid_step_deg', 0.1),
+            ttl=rain_settings.get('cache_ttl', 600),
+            threshold_mm=rain_settings.get('threshold_mm', 0.5),
+            horizon_hours=weather_settings.get('rain_alert_hours', 3),
+            step_minutes=rain_settings.get('step_minutes', 5)
+        )
+    weather_checker = WeatherChecker(weather_settings.get('api_key'), rain_predictor=rain_predictor)
+
+    # 現在の天気・予報・雨アラートを1つのスナップショットとしてキャッシュ
+    weather_service = WeatherDataService(
+        weather_checker,
+        cell_deg=weather_settings.get('cache_cell_deg', 0.05),
+        fresh_ttl=weather_settings.get('update_interval', 300),
+        stale_ttl=weather_settings.get('stale_ttl', 3600),
+        rain_alert_hours=weather_settings.get('rain_alert_hours', 3)
+    )
+    weather_service.add_listener(on_weather_snapshot)
+
+    socketio.start_background_task(weather_loop)
+    print("✅ 天気情報の定期更新を開始しました")
+
+def init_gps():
+    """GPSリーダーを初期化し、バックグラウンド読み取りを開始"""
+    global gps_reader, municipality_tracker
+    gps_settings = settings.get('gps', {})
+    if not gps_settings.get('enabled', True):
+        print("⚠️  GPSは設定で無効化されています")
+        return
+
+    replay_file = os.getenv('GPS_REPLAY_FILE') or gps_settings.get('replay_file')
+    if not replay_file and settings.get('development', {}).get('mock_gps', False):
+        replay_file = str(GPS_SAMPLE_LOG)
+
+    municipality_index = load_municipality_index(gps_settings)
+    if municipality_index:
+        municipality_tracker = MunicipalityTracker(
+            municipality_index,
+            confirm_count=gps_settings.get('municipality_confirm_count', 3)
+        )
+        municipality_tracker.add_listener(on_municipality_event)
+
+    gps_reader = GPSReader(
+        device_path=os.getenv('GPS_DEVICE', gps_settings.get('device', '/dev/ttyUSB0')),
+        baudrate=gps_settings.get('baudrate', 9600),
+        buffer_size=gps_settings.get('buffer_size', 600),
+        replay_path=replay_file,
+        replay_speed=gps_settings.get('replay_speed', 1.0),
+        municipality_index=municipality_index
+    )
+    gps_reader.add_listener(on_gps_fix)
+    if gps_reader.start():
+        print("✅ GPS読み取りを開始しました")
+    else:
+        print("⚠️  GPSデバイスを開けません（位置情報は利用できません）")
+
+def save_gps_state(state_dir):
+    """最終fixを保存"""
+    fix = gps_reader.buffer.latest() if gps_reader else None
+    if fix:
+        (state_dir / 'last_fix.json').write_text(json.dumps(fix), encoding='utf-8')
+
+def restore_gps_state(state_dir):
+    """最終fixを復元（起動直後でも最後にいた場所を返せるように）"""
+    fix_file = state_dir / 'last_fix.json'
+    if gps_reader and fix_file.exists():
+        gps_reader.seed_fix(json.loads(fix_file.read_text(encoding='utf-8')))
+
+def save_mandan_history(state_dir):
+    """生成済み漫談の履歴を保存"""
+    (state_dir / 'history.json').write_text(json.dumps(list(mandan_history), ensure_ascii=False), encoding='utf-8')
+
+def restore_mandan_history(state_dir):
+    """生成済み漫談の履歴を復元"""
+    mandan_history.extend(json.loads((state_dir / 'history.json').read_text(encoding='utf-8')))
+
+def save_render_cache(state_dir):
+    if zundamon_compositor:
+        zundamon_compositor.save_render_cache(state_dir)
+
+def restore_render_cache(state_dir):
+    if zundamon_compositor:
+        zundamon_compositor.load_render_cache(state_dir)
+
+def handle_shutdown_signal(signum, frame):
+    """SIGTERM/SIGINTで状態を保存してから終了"""
+    if PRODUCTION:
+        # eventletではハブの中で呼ばれてブロックできないため、サーバーを止めて socketio.run の後で保存する
+        raise SystemExit(0)
+    shutdown_coordinator.flush(f'signal {signum}')
+    sys.exit(0)
+
+def stop_gps():
+    if gps_reader:
+        gps_reader.disconnect()
+
+def stop_compositor_pool():
+    if compositor_pool:
+        compositor_pool.shutdown()
+
+def stop_mandan_store():
+    if mandan_store:
+        mandan_store.close()
+
+def stop_weather():
+    if weather_service:
+        weather_service.shutdown()
+
+def init_shutdown():
+    """シャットダウン時の状態保存を登録（復元は run_startup_phase で行う）"""
+    shutdown_coordinator.add_stop_hook('gps', stop_gps)
+    shutdown_coordinator.add_stop_hook('weather', stop_weather)
+    shutdown_coordinator.add_stop_hook('compositor', stop_compositor_pool)
+    shutdown_coordinator.add_stop_hook('mandan_store', stop_mandan_store)
+
+    shutdown_coordinator.register('voice_cache', voicevox_client.save_cache_index, voicevox_client.restore_cache_index)
+    shutdown_coordinator.register('rendered_images', save_render_cache, restore_render_cache)
+    shutdown_coordinator.register('gps', save_gps_state, restore_gps_state)
+    shutdown_coordinator.register('mandan', save_mandan_history, restore_mandan_history)
+
+    signal.signal(signal.SIGTERM, handle_shutdown_signal)
+    signal.signal(signal.SIGINT, handle_shutdown_signal)
+    print("✅ シャットダウン時の状態保存を登録しました")
 
 @app.route('/')
 def index():
@@ -718,30 +1518,14 @@ def index():
 def get_gps():
     """GPS位置情報を取得"""
     try:
-        # 既存のGPSモジュールを使用する予定だが、現在はサンプルデータ
-        # from sensors.gps_reader import get_current_position
-        # position = get_current_position()
-
-        # サンプルデータ（東京駅周辺）
-        sample_positions = [
-            {
-                'latitude': 35.681236,
-                'longitude': 139.767125,
-                'address': '東京都千代田区丸の内1丁目'
-            },
-            {
-                'latitude': 35.658034,
-                'longitude': 139.701636,
-                'address': '東京都渋谷区渋谷2丁目'
-            },
-            {
-                'latitude': 35.689487,
-                'longitude': 139.691706,
-                'address': '東京都新宿区新宿3丁目'
-            }
-        ]
-
-        position = random.choice(sample_positions)
+        # リングバッファの最新fixを返す
+        position = build_gps_payload()
+        if not position:
+            return jsonify({
+                'success': False,
+                'error': 'GPS測位データがありません',
+                'timestamp': datetime.now().isoformat()
+            }), 503
 
         return jsonify({
             'success': True,
@@ -758,25 +1542,17 @@ def get_gps():
 
 @app.route('/api/weather')
 def get_weather():
-    """天気予報情報を取得"""
+    """天気予報情報を取得（キャッシュ済みスナップショットを返し、ネットワークを待たない）"""
     try:
-        # 既存の天気モジュールを使用する予定だが、現在はサンプルデータ
-        # from sensors.weather_checker import get_weather_forecast
-        # forecast = get_weather_forecast()
-
-        # サンプルデータ
-        weather_conditions = ['晴れ', '曇り', '小雨', '雨', '雪']
-        condition = random.choice(weather_conditions)
-
-        # Smart Roadster用の雨アラート
-        rain_alert = condition in ['小雨', '雨']
-
-        weather_data = {
-            'temperature': random.randint(15, 30),
-            'condition': condition,
-            'humidity': random.randint(40, 80),
-            'rainAlert': rain_alert
-        }
+        snapshot = weather_service.get_snapshot(*current_weather_position()) if weather_service else None
+        weather_data = build_weather_payload(snapshot) if snapshot else weather_snapshot
+
+        if not weather_data:
+            return jsonify({
+                'success': False,
+                'error': '天気情報を取得中です',
+                'timestamp': datetime.now().isoformat()
+            }), 503
 
         return jsonify({
             'success': True,
@@ -882,6 +1658,72 @@ def get_zundamon_options():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+# /api/zundamon/img/<ハッシュ> は内容が変わらない。パラメータ指定のURLは ETag で毎回確認させる
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+ZUNDAMON_IMAGE_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG'}
+
+ZUNDAMON_PARAM_KEYS = ['head_direction', 'right_arm', 'left_arm', 'edamame',
+                       'face_color', 'expression_mouth', 'expression_eyes', 'expression_eyebrows']
+
+def zundamon_params_from_args():
+    """URLパラメータからずんだもんのパラメータを取得"""
+    return {key: request.args[key] for key in ZUNDAMON_PARAM_KEYS if request.args.get(key)}
+
+def send_zundamon_image(params, format_type, cache_control, content_key=None):
+    """合成画像を ETag（内容のハッシュ）付きで返す。If-None-Match が一致すれば合成せずに304"""
+    content_key = content_key or zundamon_compositor.register_content(params, format_type)
+    if request.if_none_match.contains_weak(content_key):
+        response = app.response_class(status=304)
+        response.set_etag(content_key)
+    else:
+        response = send_file(
+            compose_zundamon_image(params, format_type),
+            mimetype='image/png' if format_type.upper() == 'PNG' else 'image/jpeg',
+            as_attachment=False,
+            download_name=f'zundamon.{format_type.lower()}',
+            etag=content_key,
+            conditional=False
+        )
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Content-Location'] = zundamon_content_url(content_key, format_type)
+    return response
+
+@app.route('/api/zundamon/img/<content_key>.<ext>')
+def get_zundamon_image(content_key, ext):
+    """内容のハッシュで指定した合成画像（generate_mandan の zundamonImageUrl などで使う）"""
+    try:
+        if not zundamon_compositor:
+            return jsonify({
+                'success': False,
+                'error': 'ずんだもん画像合成器が初期化されていません',
+                'timestamp': datetime.now().isoformat()
+            }), 503
+
+        format_type = ZUNDAMON_IMAGE_FORMATS.get(ext.lower())
+        entry = zundamon_compositor.lookup_content(content_key)
+        if format_type and request.if_none_match.contains_weak(content_key):
+            # 同じURLの内容は変わらないので、索引になくても304でよい
+            response = app.response_class(status=304)
+            response.set_etag(content_key)
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            return response
+        if not format_type or not entry or entry[1] != format_type:
+            return jsonify({
+                'success': False,
+                'error': '画像が見つかりません（/api/zundamon/generate にパラメータを指定して取得してください）',
+                'timestamp': datetime.now().isoformat()
+            }), 404
+
+        return send_zundamon_image(entry[0], format_type, IMMUTABLE_CACHE_CONTROL, content_key)
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
 @app.route('/api/zundamon/generate', methods=['POST'])
 def generate_zundamon():
     """ずんだもん画像を生成"""
@@ -898,18 +1740,8 @@ def generate_zundamon():
         params = data.get('params', {})
         format_type = data.get('format', 'PNG')
 
-        # 画像を合成
-        img_buffer = zundamon_compositor.compose_image(params, format_type)
-
-        # Content-Typeを設定
-        mimetype = 'image/png' if format_type.upper() == 'PNG' else 'image/jpeg'
-
-        return send_file(
-            img_buffer,
-            mimetype=mimetype,
-            as_attachment=False,
-            download_name=f'zundamon.{format_type.lower()}'
-        )
+        # 画像を合成（同じ画像をすでに持っているクライアントには304）
+        return send_zundamon_image(params, format_type, REVALIDATE_CACHE_CONTROL)
 
     except Exception as e:
         return jsonify({
@@ -930,28 +1762,275 @@ def generate_zundamon_get():
             }), 503
 
         # URLパラメータから設定を取得
-        params = {}
-        for key in ['head_direction', 'right_arm', 'left_arm', 'edamame',
-                   'face_color', 'expression_mouth', 'expression_eyes', 'expression_eyebrows']:
-            value = request.args.get(key)
-            if value:
-                params[key] = value
-
+        params = zundamon_params_from_args()
         format_type = request.args.get('format', 'PNG')
 
-        # 画像を合成
-        img_buffer = zundamon_compositor.compose_image(params, format_type)
+        # 画像を合成（同じ画像をすでに持っているクライアントには304）
+        return send_zundamon_image(params, format_type, REVALIDATE_CACHE_CONTROL)
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+def send_zundamon_patch(previous, params, format_type):
+    """前の画像（ハッシュかパラメータ）から変わった範囲だけの画像を返す
 
-        # Content-Typeを設定
-        mimetype = 'image/png' if format_type.upper() == 'PNG' else 'image/jpeg'
+    ヘッダー X-Patch-Rect（x,y,幅,高さ）の範囲をクリアしてから描けば新しい画像になる。
+    変化がなければ204。前の画像がわからなければキャンバス全体を返す。
+    """
+    if isinstance(previous, str):
+        entry = zundamon_compositor.lookup_content(previous)
+        previous = entry[0] if entry and entry[1] == format_type.upper() else None
 
-        return send_file(
-            img_buffer,
-            mimetype=mimetype,
-            as_attachment=False,
-            download_name=f'zundamon.{format_type.lower()}'
+    if previous is None:
+        content_key = zundamon_compositor.register_content(params, format_type)
+        width, height = zundamon_compositor.canvas_size
+        patch = {'rect': (0, 0, width, height), 'from_key': None, 'content_key': content_key}
+    else:
+        patch = compose_zundamon_patch(previous, params, format_type)
+    content_key = patch['content_key']
+    etag = f"{patch['from_key']}.{content_key}" if patch['from_key'] else content_key
+
+    if patch['rect'] is None:
+        response = app.response_class(status=204)
+    elif request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        data = patch.get('data') or compose_zundamon_image(params, format_type).getvalue()
+        response = app.response_class(data, mimetype='image/png' if format_type.upper() == 'PNG' else 'image/jpeg')
+        response.headers['X-Patch-Rect'] = ','.join(map(str, patch['rect']))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    response.headers['X-Canvas-Size'] = ','.join(map(str, zundamon_compositor.canvas_size))
+    response.headers['X-Content-Key'] = content_key
+    response.headers['Content-Location'] = zundamon_content_url(content_key, format_type)
+    response.headers['Access-Control-Expose-Headers'] = 'X-Patch-Rect, X-Canvas-Size, X-Content-Key, ETag'
+    return response
+
+@app.route('/api/zundamon/patch', methods=['GET', 'POST'])
+def get_zundamon_patch():
+    """表情の差分画像（変わったレイヤーの範囲だけ）
+
+    GET: from=<前の画像のハッシュ（X-Content-Key）> と /api/zundamon/generate と同じパラメータ
+    POST: {"from": ハッシュ または パラメータ, "params": {...}, "format": "PNG"}
+    """
+    try:
+        if not zundamon_compositor:
+            return jsonify({
+                'success': False,
+                'error': 'ずんだもん画像合成器が初期化されていません',
+                'timestamp': datetime.now().isoformat()
+            }), 503
+
+        if request.method == 'POST':
+            data = request.get_json() if request.is_json else {}
+            previous = data.get('from')
+            params = data.get('params', {})
+            format_type = data.get('format', 'PNG')
+        else:
+            previous = request.args.get('from')
+            params = zundamon_params_from_args()
+            format_type = request.args.get('format', 'PNG')
+
+        return send_zundamon_patch(previous, params, format_type)
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+def zundamon_layer_url(file_key: str) -> str:
+    """レイヤー画像のURL（ファイルの内容のハッシュなので長期キャッシュできる）"""
+    return f"/api/zundamon/layer/{file_key}.png"
+
+@app.route('/api/zundamon/layers')
+def get_zundamon_layers():
+    """ブラウザで合成するためのレイヤー一覧（各レイヤーの画像URL・位置・重ね順）
+
+    compositor.client_compositing が無効なら、レイヤー一覧は作らず（全レイヤー画像のハッシュを計算しない）
+    clientCompositing: false だけを返す。ETag には合成する場所も含めるので、設定を切り替えると取り直される。
+    """
+    try:
+        if not zundamon_compositor:
+            return jsonify({
+                'success': False,
+                'error': 'ずんだもん画像合成器が初期化されていません',
+                'timestamp': datetime.now().isoformat()
+            }), 503
+
+        client_compositing = bool(settings.get('compositor', {}).get('client_compositing', False))
+        etag = f"{zundamon_compositor.metadata_fingerprint}.{'client' if client_compositing else 'server'}"
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        elif not client_compositing:
+            response = jsonify({
+                'success': True,
+                'data': {'clientCompositing': False},
+                'timestamp': datetime.now().isoformat()
+            })
+        else:
+            manifest = run_blocking(zundamon_compositor.layer_manifest)
+            layers = {
+                layer_name: {**layer, 'url': zundamon_layer_url(layer['key'])}
+                for layer_name, layer in manifest['layers'].items()
+            }
+            response = jsonify({
+                'success': True,
+                'data': {**manifest, 'layers': layers, 'clientCompositing': True},
+                'timestamp': datetime.now().isoformat()
+            })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+        return response
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/zundamon/layers/resolve', methods=['GET', 'POST'])
+def resolve_zundamon_layers():
+    """パラメータから重ねるレイヤー名（下から順）を解決（解決はサーバーだけで行う）
+
+    GET: /api/zundamon/generate と同じパラメータ
+    POST: {"params": {...}}
+    """
+    try:
+        if not zundamon_compositor:
+            return jsonify({
+                'success': False,
+                'error': 'ずんだもん画像合成器が初期化されていません',
+                'timestamp': datetime.now().isoformat()
+            }), 503
+
+        if request.method == 'POST':
+            data = request.get_json() if request.is_json else {}
+            params = data.get('params', {})
+        else:
+            params = zundamon_params_from_args()
+        params = zundamon_compositor.with_defaults(dict(params))
+        layer_names = zundamon_compositor.composition_sequence(zundamon_compositor.resolve_layer_names(params))
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'layers': layer_names,
+                'fingerprint': zundamon_compositor.metadata_fingerprint,
+                'contentKey': zundamon_compositor.register_content(params, 'PNG')
+            },
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/zundamon/layer/<file_key>.png')
+def get_zundamon_layer(file_key):
+    """レイヤー画像（/api/zundamon/layers の url）"""
+    try:
+        if not zundamon_compositor:
+            return jsonify({
+                'success': False,
+                'error': 'ずんだもん画像合成器が初期化されていません',
+                'timestamp': datetime.now().isoformat()
+            }), 503
+
+        if request.if_none_match.contains_weak(file_key):
+            response = app.response_class(status=304)
+            response.set_etag(file_key)
+        else:
+            image_path = zundamon_compositor.lookup_layer_file(file_key)
+            if not image_path:
+                return jsonify({
+                    'success': False,
+                    'error': 'レイヤーが見つかりません',
+                    'timestamp': datetime.now().isoformat()
+                }), 404
+            response = send_file(image_path, mimetype='image/png', etag=file_key, conditional=False)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+def generate_mandan_batch(topics, maxlength, model, provider):
+    """複数トピックの漫談を batch_size 件ずつまとめて生成し、漫談履歴・保存済み漫談に追加"""
+    batch_size = max(1, mandan_settings.get('batch_size', 5))
+    results = []
+    for start in range(0, len(topics), batch_size):
+        chunk = topics[start:start + batch_size]
+        prompt = MANDAN_BATCH_PROMPT.format(
+            topic_list='\n'.join(f"- {topic}" for topic in chunk),
+            maxlength=maxlength
         )
+        try:
+            backends = mandan_backends(
+                model, prompt,
+                max_tokens=mandan_settings.get('batch_max_tokens', 4096),
+                num_predict=mandan_num_predict(maxlength) * len(chunk)
+            )
+            response, backend = llm_router.generate(backends, preferred=provider)
+            documents = split_mandan_documents(response, chunk)
+        except Exception as e:
+            print(f"漫談一括生成エラー: {e}")
+            results.extend({'topic': topic, 'success': False, 'error': str(e)} for topic in chunk)
+            continue
+
+        for topic, document in zip(chunk, documents):
+            if document is None:
+                results.append({'topic': topic, 'success': False, 'error': '応答に漫談が見つかりません'})
+                continue
+            mandan = {
+                'topic': topic,
+                'sentence': str(document['sentence']),
+                'zundamonParams': validate_zundamon_params(document.get('zundamonImage')),
+                'generatedAt': datetime.now().isoformat()
+            }
+            mandan_history.append(mandan)
+            if mandan_store:
+                mandan_store.add(topic, mandan['sentence'], mandan['zundamonParams'], backend.key)
+            results.append({'success': True, 'provider': backend.key, **mandan})
+    return results
+
+@app.route('/api/mandan/batch', methods=['POST'])
+def generate_mandan_batch_api():
+    """複数トピックの漫談をまとめて事前生成（テキストのみ。以降の同じ・近いトピックの漫談に使われる）"""
+    try:
+        data = request.get_json() or {}
+        topics = [str(topic) for topic in data.get('topics', []) if str(topic).strip()]
+        if not topics:
+            return jsonify({
+                'success': False,
+                'error': 'topics を指定してください',
+                'timestamp': datetime.now().isoformat()
+            }), 400
 
+        results = generate_mandan_batch(
+            topics,
+            data.get('maxlength', 200),
+            data.get('model', ollama_settings.get('model', 'mistral')),
+            data.get('provider', 'claude')
+        )
+        return jsonify({
+            'success': any(result['success'] for result in results),
+            'data': results,
+            'timestamp': datetime.now().isoformat()
+        })
     except Exception as e:
         return jsonify({
             'success': False,
@@ -992,6 +2071,98 @@ def get_system_info():
             'timestamp': datetime.now().isoformat()
         })
 
+@app.route('/api/system/prepare-shutdown', methods=['POST'])
+def prepare_shutdown():
+    """電源断の前に状態を保存（GPIOシャットダウン監視から呼ばれる）
+
+    停止処理は行わない（電源が切られるまで、または取り消されても動き続けられるように）。
+    GPS・天気・合成ワーカー・漫談ストアの停止は SIGTERM・終了時の flush で行う。
+    """
+    report = shutdown_coordinator.save_state('prepare-shutdown')
+    return jsonify({
+        'success': all(result == 'ok' for result in report['results'].values()),
+        'data': report,
+        'timestamp': datetime.now().isoformat()
+    })
+
+def debug_endpoints_enabled():
+    """診断用エンドポイントは設定で有効にした時だけ使える"""
+    return bool(debug_settings.get('endpoints_enabled', False))
+
+def debug_disabled_response():
+    return jsonify({
+        'success': False,
+        'error': '診断用エンドポイントは無効です（config/settings.yaml の debug.endpoints_enabled）',
+        'timestamp': datetime.now().isoformat()
+    }), 404
+
+@app.route('/api/debug/profile')
+def debug_profile():
+    """全スレッドのスタックを seconds 秒間サンプリングし、collapsed stack 形式（flamegraph.pl / speedscope 用）で返す"""
+    if not debug_endpoints_enabled():
+        return debug_disabled_response()
+
+    global sampling_profiler
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        hz = request.args.get('hz', type=float)
+        if sampling_profiler is None:
+            from sampling_profiler import SamplingProfiler
+            sampling_profiler = SamplingProfiler(
+                hz=debug_settings.get('profile_hz', 100),
+                max_seconds=debug_settings.get('profile_max_seconds', 60)
+            )
+        print(f"🔍 プロファイル開始: {seconds}秒")
+        result = sampling_profiler.profile(seconds, hz)
+        print(f"🔍 プロファイル終了: 標本{result['samples']}回（{result['hz']}Hz、負荷{result['overhead_ratio']:.1%}）")
+
+        if request.args.get('format') == 'json':
+            return jsonify({
+                'success': True,
+                'data': result,
+                'timestamp': datetime.now().isoformat()
+            })
+        return send_file(
+            io.BytesIO(result['collapsed'].encode('utf-8')),
+            mimetype='text/plain',
+            as_attachment=True,
+            download_name=f"kiosk-profile-{datetime.now():%Y%m%d-%H%M%S}.collapsed"
+        )
+
+    except RuntimeError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 409
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/debug/threads')
+def debug_threads():
+    """全スレッド（本番モードではグリーンスレッドも）の現在のスタック"""
+    if not debug_endpoints_enabled():
+        return debug_disabled_response()
+
+    try:
+        from sampling_profiler import dump_threads
+        return jsonify({
+            'success': True,
+            'data': dump_threads(),
+            'timestamp': datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
 @app.errorhandler(404)
 def not_found(error):
     """404エラーハンドラー"""
@@ -1010,17 +2181,8 @@ def internal_error(error):
         'timestamp': datetime.now().isoformat()
     }), 500
 
-if __name__ == '__main__':
-    print("🚗 Smart Roadster Kiosk API Server")
-    print("=" * 40)
-    print("サーバーを起動中...")
-    print("URL: http://localhost:8000")
-    print("WebSocket: ws://localhost:8000")
-    print("=" * 40)
-
-    # ずんだもん合成器を初期化
-    init_zundamon()
-
+def check_services():
+    """外部サービスの接続確認"""
     # VOICEVOX接続確認
     if voicevox_client.is_available():
         print("✅ VOICEVOX ENGINE接続確認済み")
@@ -1045,18 +2207,114 @@ if __name__ == '__main__':
     # Claude API接続確認
     if claude_client.is_available():
         print("✅ Claude API接続確認済み")
-        print(f"   利用モデル: claude-3-haiku-20240307")
+        print(f"   利用モデル: {claude_client.model}")
     else:
         if not claude_client.api_key:
             print("⚠️  Claude APIキーが設定されていません（.envrcファイルでCLAUDE_API_KEYを設定してください）")
         else:
             print("⚠️  Claude APIに接続できません（APIキーを確認してください）")
 
+def warm_up_providers():
+    """LLMクライアントのモジュールを先に読み込み、最初の漫談生成で待たないようにする"""
+    ollama_client.client
+    claude_client.client
+
+    # 漫談用モデルを読み込んでシステムプロンプトを処理させておく
+    if ollama_settings.get('warm_up', True) and ollama_client.is_available():
+        ollama_client.start_session(ollama_settings.get('model', 'mistral'), MANDAN_SYSTEM_PROMPT)
+
+def run_startup_phase():
+    """ポートを開いた後にバックグラウンドで行う起動処理（1つ失敗しても残りは続ける）
+
+    本番モードではグリーンスレッドで動くため、ディスク・CPUを使う処理（blocking=True）は
+    run_blocking でOSスレッドに任せ、その間もリクエストに応答できるようにする。
+    """
+    steps = [
+        # (名前, 処理, ブロックする処理か)
+        ('init_zundamon', init_zundamon, False),  # 重い部分は中で run_blocking を使う
+        ('init_mandan_store', init_mandan_store, True),
+        ('init_weather', init_weather, False),
+        ('restore_state', shutdown_coordinator.restore_all, True),
+        ('warm_up_providers', warm_up_providers, False),
+        ('check_services', check_services, False)
+    ]
+    for name, step, blocking in steps:
+        with startup_profiler.phase(name):
+            try:
+                if blocking:
+                    run_blocking(step)
+                else:
+                    step()
+            except Exception as e:
+                print(f"❌ 起動処理エラー ({name}): {e}")
+    startup_profiler.mark('startup_complete')
+    print("✅ 起動処理が完了しました")
+
+def profile_first_request(port):
+    """ポートが開くのを待って最初のリクエストを送り、起動プロファイルを表示"""
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.01)
+    startup_profiler.mark('listening')
+    requests.get(f'http://127.0.0.1:{port}/', timeout=10)
+
+    while 'startup_complete' not in startup_profiler.marks:
+        time.sleep(0.1)
+    print(startup_profiler.report())
+
+def mark_first_response(response):
+    startup_profiler.mark('first_response')
+    return response
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Smart Roadster Kiosk API Server')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--profile-startup', action='store_true', help='起動から最初のリクエストまでの内訳を表示')
+    parser.add_argument('--production', action='store_true', help='eventletで起動（KIOSK_SERVER_MODE=productionと同じ）')
+    args = parser.parse_args()
+
+    # 本番モードと計測時はデバッグ・リローダーを使わない
+    debug = os.getenv('FLASK_DEBUG', '1') == '1' and not args.profile_startup and not PRODUCTION
+    if debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        # リローダーの監視プロセスはサーバーを起動しないため初期化しない
+        socketio.run(app, host='0.0.0.0', port=args.port, debug=True, allow_unsafe_werkzeug=True)
+        sys.exit(0)
+
+    print("🚗 Smart Roadster Kiosk API Server")
+    print("=" * 40)
+    print(f"サーバーを起動中...（{'本番モード: eventlet' if PRODUCTION else '開発モード: Werkzeug'}）")
+    print(f"URL: http://localhost:{args.port}")
+    print(f"WebSocket: ws://localhost:{args.port}")
+    print("=" * 40)
+
+    # ポートを開く前に行うのは軽い処理のみ
+    with startup_profiler.phase('init_gps'):
+        init_gps()
+    with startup_profiler.phase('init_shutdown'):
+        init_shutdown()
+    start_voice_workers()
+
+    # 合成器・天気・状態復元・接続確認はポートを開いた後にバックグラウンドで実行
+    socketio.start_background_task(run_startup_phase)
+
+    if args.profile_startup:
+        app.after_request(mark_first_response)
+        threading.Thread(target=profile_first_request, args=(args.port,), daemon=True).start()
+
     # SocketIOサーバーを起動
-    socketio.run(
-        app,
-        host='0.0.0.0',
-        port=8000,
-        debug=True,
-        allow_unsafe_werkzeug=True
-    )
+    startup_profiler.mark('server_start')
+    if PRODUCTION:
+        socketio.run(app, host='0.0.0.0', port=args.port)
+        shutdown_coordinator.flush('server stopped')
+    else:
+        socketio.run(
+            app,
+            host='0.0.0.0',
+            port=args.port,
+            debug=debug,
+            use_reloader=debug,
+            allow_unsafe_werkzeug=True
+        )
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+LLM スタブサーバー
+Ollama（/api/version, /api/tags, /api/generate, /api/chat）と Claude（/v1/messages）を1つのポートで模擬する。
+最初のトークンまでの時間・トークン間隔・エラー率をプロバイダーごとに指定でき、
+LLMルーターの切り替えやヘッジを実機なしで確認するためのサーバー。
+
+Usage:
+  python llm_stub.py --port 11500 --ollama-first-token-ms 3000 --claude-first-token-ms 400
+  OLLAMA_URL=http://127.0.0.1:11500 CLAUDE_BASE_URL=http://127.0.0.1:11500 CLAUDE_API_KEY=stub python ../app.py
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+MANDAN_RESPONSE = """---
+topic: {topic}
+sentence: "{provider}のスタブが{topic}について話すのだ。今日もいい天気なのだ！"
+zundamonImage:
+  edamame: 通常
+  expression_eyebrows: 基本眉
+  expression_eyes: にっこり
+  expression_mouth: ほほえみ
+  face_color: ほっぺ基本
+  left_arm: 腰
+  right_arm: 腰
+---"""
+
+
+def make_response(provider, prompt):
+    """プロンプトのトピック（一括生成なら箇条書きの各トピック）ごとに漫談のYAMLを返す"""
+    topics = re.findall(r'^- (.+)$', prompt, flags=re.MULTILINE)
+    if not topics:
+        match = re.search(r'^トピック: (.+)$', prompt, flags=re.MULTILINE)
+        topics = [match.group(1) if match else '日常の話']
+    return "\n".join(MANDAN_RESPONSE.format(provider=provider, topic=topic) for topic in topics)
+
+
+def tokenize(text, size=4):
+    """数文字ずつに区切ってトークンの代わりにする"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def make_handler(args):
+    profiles = {
+        'ollama': (args.ollama_first_token_ms / 1000, args.ollama_error_rate),
+        'claude': (args.claude_first_token_ms / 1000, args.claude_error_rate)
+    }
+    token_delay = args.token_ms / 1000
+    seen_prefixes = set()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _start_stream(self, content_type):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def _end_stream(self):
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+        def _fail(self, provider):
+            """最初のトークンまで待ってから、指定の確率でエラーにする"""
+            first_token, error_rate = profiles[provider]
+            time.sleep(first_token)
+            if random.random() < error_rate:
+                self._send_json({"error": f"{provider} stub error"}, status=500)
+                return True
+            return False
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/api/version":
+                self._send_json({"version": "stub"})
+            elif path == "/api/tags":
+                self._send_json({"models": [{"name": "mistral", "model": "mistral"}]})
+            else:
+                self._send_json({"error": "not found"}, status=404)
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if path == "/api/generate":
+                self._ollama_generate(body)
+            elif path == "/api/chat":
+                self._ollama_chat(body)
+            elif path == "/v1/messages":
+                self._claude_messages(body)
+            else:
+                self._send_json({"error": "not found"}, status=404)
+
+        def _ollama_generate(self, body):
+            self._ollama_respond(body, body.get("prompt", ""), lambda text: {"response": text},
+                                 {"context": (body.get("context") or [1, 2, 3]) + [4]})
+
+        def _ollama_chat(self, body):
+            prompt = "".join(m.get("content", "") for m in body.get("messages", []) if m.get("role") == "user")
+            self._ollama_respond(body, prompt, lambda text: {"message": {"role": "assistant", "content": text}})
+
+        def _ollama_respond(self, body, prompt, content, extra=None):
+            """/api/generate・/api/chat の応答（content はテキストを応答の本文の形にする関数）"""
+            if self._fail('ollama'):
+                return
+            model = body.get("model", "mistral")
+            tokens = tokenize(make_response("Ollama", prompt))
+            if body.get("options", {}).get("num_predict") is not None:
+                tokens = tokens[:body["options"]["num_predict"]]
+            created = datetime.now(timezone.utc).isoformat()
+            final = {
+                "model": model, "created_at": created, **content(""), "done": True, **(extra or {}),
+                "load_duration": 0, "prompt_eval_count": len(prompt),
+                "prompt_eval_duration": int(profiles['ollama'][0] * 1e9),
+                "eval_count": len(tokens), "eval_duration": int(len(tokens) * token_delay * 1e9)
+            }
+            if not body.get("stream", True):
+                time.sleep(token_delay * len(tokens))
+                self._send_json({**final, **content("".join(tokens))})
+                return
+
+            self._start_stream("application/x-ndjson")
+            for token in tokens:
+                part = {"model": model, "created_at": created, **content(token), "done": False}
+                self._write_chunk((json.dumps(part, ensure_ascii=False) + "\n").encode('utf-8'))
+                time.sleep(token_delay)
+            self._write_chunk((json.dumps(final) + "\n").encode('utf-8'))
+            self._end_stream()
+
+        def _claude_messages(self, body):
+            if self._fail('claude'):
+                return
+            model = body.get("model", "claude-stub")
+            prompt = "".join(m["content"] for m in body.get("messages", []) if isinstance(m.get("content"), str))
+            text = make_response("Claude", prompt)
+
+            # cache_control 付きのシステムプロンプトは2回目から「キャッシュから読んだ」ことにする
+            system = body.get("system") or []
+            cached = sum(len(block.get("text", "")) for block in system
+                         if isinstance(block, dict) and block.get("cache_control"))
+            first_seen = cached and cached not in seen_prefixes
+            seen_prefixes.add(cached)
+            message = {
+                "id": "msg_stub", "type": "message", "role": "assistant", "model": model,
+                "content": [], "stop_reason": None, "stop_sequence": None,
+                "usage": {"input_tokens": len(prompt),
+                          "cache_creation_input_tokens": cached if first_seen else 0,
+                          "cache_read_input_tokens": 0 if first_seen else cached,
+                          "output_tokens": 0}
+            }
+            if not body.get("stream"):
+                time.sleep(token_delay * len(tokenize(text)))
+                message.update(content=[{"type": "text", "text": text}], stop_reason="end_turn")
+                message["usage"]["output_tokens"] = len(tokenize(text))
+                self._send_json(message)
+                return
+
+            def event(name, data):
+                self._write_chunk(f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+            self._start_stream("text/event-stream")
+            event("message_start", {"type": "message_start", "message": message})
+            event("content_block_start", {"type": "content_block_start", "index": 0,
+                                          "content_block": {"type": "text", "text": ""}})
+            for token in tokenize(text):
+                event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                              "delta": {"type": "text_delta", "text": token}})
+                time.sleep(token_delay)
+            event("content_block_stop", {"type": "content_block_stop", "index": 0})
+            event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                    "usage": {"output_tokens": len(tokenize(text))}})
+            event("message_stop", {"type": "message_stop"})
+            self._end_stream()
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama / Claude スタブサーバー")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--ollama-first-token-ms", type=float, default=1500)
+    parser.add_argument("--claude-first-token-ms", type=float, default=500)
+    parser.add_argument("--token-ms", type=float, default=20, help="トークン間隔")
+    parser.add_argument("--ollama-error-rate", type=float, default=0.0)
+    parser.add_argument("--claude-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args))
+    print(f"[INFO] LLM stub listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[INFO] LLM stub stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+バックエンドのホットパスのベンチマーク
+画像合成（コールド・ウォーム、PNG・JPEG）、レイヤー名の解決、アルファ合成、描画モード、隠れたタイルの省略、音声キャッシュ、
+LLMレスポンスのYAML解析、漫談生成の一連の流れを計測し、結果をJSONで保存する。
+PSD・VOICEVOX・Ollama・Claude は不要（合成用のダミーレイヤーとスタブサーバーを使う）。
+
+Usage:
+  python run_benchmarks.py                          # benchmarks/results/<日時>-<コミット>.json に保存
+  python run_benchmarks.py --only compose,alpha --repeat 50
+  python run_benchmarks.py --compare results/前回.json --threshold 0.2
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from argparse import Namespace
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKYARD_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BACKYARD_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import numpy as np
+import PIL
+import yaml
+
+import llm_stub
+import voicevox_stub
+from synthetic_layers import generate_layer_set
+from blend_kernels import KERNELS, blend
+from zundamon_compositor import ZundamonCompositor
+
+SUITES = ('compose', 'resolve', 'alpha', 'blend', 'occlusion', 'voice', 'yaml', 'mandan')
+FIXTURES_PATH = BENCH_DIR / 'fixtures' / 'llm_outputs.json'
+
+# 合成パラメータ（既定値と、腕・表情を変えたもの）
+COMPOSE_PARAMS = [
+    {},
+    {'right_arm': '手を挙げる', 'left_arm': '口元', 'expression_mouth': 'あは', 'expression_eyes': 'にっこり'},
+    {'edamame': '萎え', 'expression_eyebrows': '困り眉', 'face_color': '青ざめ', 'right_arm': '指差し上'},
+]
+
+# キオスクの回転数ごとの表情（kiosk/src/hooks/useZundamonExpression.ts）
+KIOSK_EXPRESSIONS = {
+    'idle': {'head_direction': '正面向き', 'right_arm': '腰', 'left_arm': '腰', 'edamame': '通常',
+             'face_color': 'ほっぺ基本', 'expression_mouth': 'ほほえみ', 'expression_eyes': 'なごみ目',
+             'expression_eyebrows': '基本眉'},
+    'normal': {'head_direction': '正面向き', 'right_arm': '基本', 'left_arm': '基本', 'edamame': '通常',
+               'face_color': 'ほっぺ基本', 'expression_mouth': 'えへ', 'expression_eyes': '基本目',
+               'expression_eyebrows': '基本眉'},
+    'active': {'head_direction': '正面向き', 'right_arm': '手を挙げる', 'left_arm': '手を挙げる', 'edamame': '立ち',
+               'face_color': 'ほっぺ赤め', 'expression_mouth': 'あは', 'expression_eyes': 'にっこり',
+               'expression_eyebrows': '上がり眉'},
+    'high': {'head_direction': '上向き', 'right_arm': '指差し上', 'left_arm': '手を挙げる', 'edamame': '立ち',
+             'face_color': '赤面', 'expression_mouth': 'お', 'expression_eyes': '〇〇',
+             'expression_eyebrows': '上がり眉'},
+}
+
+
+def measure(func, repeat, warmup=1, setup=None):
+    """func を repeat 回実行した時間（ミリ秒）の統計
+
+    setup は計測の外で毎回呼ぶ（キャッシュのクリアなど）。
+    アプリのログ出力は計測結果を見にくくするので捨てる（出力の処理時間は含む）。
+    """
+    samples = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(warmup + repeat):
+            if setup:
+                setup()
+            started = time.perf_counter()
+            func()
+            elapsed = (time.perf_counter() - started) * 1000
+            if i >= warmup:
+                samples.append(elapsed)
+    ordered = sorted(samples)
+    return {
+        'runs': len(samples),
+        'min_ms': round(ordered[0], 3),
+        'median_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        'mean_ms': round(statistics.mean(ordered), 3)
+    }
+
+
+def start_server(handler):
+    """スタブサーバーを空いているポートで起動してURLを返す"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def bench_compose(layers_dir, repeat):
+    """compose_image: コールド（合成器を作り直す）・キャッシュなし・キャッシュヒット"""
+    results = {}
+    compositor = ZundamonCompositor(str(layers_dir))
+    for format_type in ('PNG', 'JPEG'):
+        params = [compositor.with_defaults(p) for p in COMPOSE_PARAMS]
+        state = {'i': 0}
+
+        def next_params():
+            state['i'] += 1
+            return params[state['i'] % len(params)]
+
+        def cold():
+            ZundamonCompositor(str(layers_dir)).compose_image(next_params(), format_type)
+
+        def uncached():
+            compositor.compose_image(next_params(), format_type)
+
+        def warm():
+            compositor.compose_image(params[0], format_type)
+
+        key = format_type.lower()
+        results[f'cold_{key}'] = measure(cold, max(3, repeat // 4))
+        results[f'uncached_{key}'] = measure(uncached, repeat, setup=compositor.render_cache.clear)
+        results[f'warm_{key}'] = measure(warm, repeat * 5)
+    return results
+
+
+def bench_resolve(layers_dir, repeat):
+    compositor = ZundamonCompositor(str(layers_dir))
+    params = [compositor.with_defaults(p) for p in COMPOSE_PARAMS]
+    return {
+        'resolve_layer_names': measure(lambda: [compositor.resolve_layer_names(p) for p in params], repeat * 10)
+    }
+
+
+def bench_alpha(layers_dir, repeat):
+    """_alpha_composite_numpy: キャンバス全体に大きさの違うレイヤーを重ねる"""
+    compositor = ZundamonCompositor(str(layers_dir))
+    width, height = compositor.canvas_size
+    rng = np.random.default_rng(0)
+    canvas = np.zeros((height, width, 4), dtype=np.uint8)
+    results = {}
+    for size in (64, 256, 512, 1024):
+        src = rng.integers(0, 256, (min(size, height), min(size, width), 4), dtype=np.uint8)
+        position = ((width - src.shape[1]) // 2, (height - src.shape[0]) // 2)
+        results[f'src_{size}'] = measure(
+            lambda: compositor._alpha_composite_numpy(canvas, src, position), repeat * 5
+        )
+    return results
+
+
+def bench_blend(repeat):
+    """blend_kernels.blend: 描画モードごと（uint8・不透明度あり・uint16）に 512x512 の範囲を重ねる
+
+    blend は dst に書き込むため、毎回の計測前（計測の外）に元の dst をコピーし直して同じ入力で測る。
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for dtype, suffix in ((np.uint8, 'u8'), (np.uint16, 'u16')):
+        maximum = np.iinfo(dtype).max
+        base = rng.integers(0, maximum + 1, (512, 512, 4)).astype(dtype)
+        src = rng.integers(0, maximum + 1, (512, 512, 4)).astype(dtype)
+        target = {}
+
+        def reset():
+            target['dst'] = base.copy()
+
+        for mode in KERNELS:
+            results[f'{mode}_{suffix}'] = measure(lambda: blend(target['dst'], src, mode), repeat * 2, setup=reset)
+            if dtype == np.uint8:
+                results[f'{mode}_{suffix}_opacity'] = measure(
+                    lambda: blend(target['dst'], src, mode, 128), repeat * 2, setup=reset
+                )
+    return results
+
+
+def bench_occlusion(layers_dir, repeat, report):
+    """隠れたタイルを省略した合成としない合成（キャッシュなし）。省略した画素の割合を report に入れる"""
+    expressions = {**{f'compose_{i}': p for i, p in enumerate(COMPOSE_PARAMS)}, **KIOSK_EXPRESSIONS}
+    results = {}
+    for cull in (True, False):
+        compositor = ZundamonCompositor(str(layers_dir), cull_occluded=cull)
+        params = [compositor.with_defaults(dict(p)) for p in expressions.values()]
+        state = {'i': 0}
+
+        def uncached():
+            state['i'] += 1
+            compositor.compose_image(params[state['i'] % len(params)], 'PNG')
+
+        results['culled' if cull else 'unculled'] = measure(uncached, repeat, setup=compositor.render_cache.clear)
+        if cull:
+            report.update({name: compositor.occlusion_report(p) for name, p in expressions.items()})
+    return results
+
+
+def bench_voice(app, repeat):
+    """音声キャッシュのヒットとミス（スタブの合成時間は0）"""
+    server, url = start_server(voicevox_stub.make_handler(0, 0))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        client = app.VoicevoxClient(base_url=url)
+        client.cache_dir = Path(cache_dir)
+        results = {
+            'cache_hit': measure(
+                lambda: client.synthesize_with_cache("キャッシュのベンチマークなのだ", 3, 'use'), repeat * 5
+            ),
+            'cache_miss': measure(
+                lambda: client.synthesize_with_cache(f"キャッシュのベンチマークなのだ {uuid.uuid4().hex}", 3, 'use'),
+                repeat
+            ),
+            'cache_hit_lipsync': measure(
+                lambda: client.synthesize_with_cache("キャッシュのベンチマークなのだ", 3, 'use', with_lipsync=True),
+                repeat * 5
+            )
+        }
+    server.shutdown()
+    return results
+
+
+def bench_yaml(app, repeat):
+    """記録したLLMの出力からのYAML抽出と解析"""
+    with open(FIXTURES_PATH, encoding='utf-8') as f:
+        outputs = json.load(f)
+    results = {}
+    for output in outputs:
+        text = output['text']
+        if len(output['topics']) == 1:
+            results[output['name']] = measure(
+                lambda: yaml.safe_load(app.extract_yaml_from_response(text)), repeat * 5
+            )
+        else:
+            results[output['name']] = measure(
+                lambda: app.split_mandan_documents(text, output['topics']), repeat * 5
+            )
+    return results
+
+
+def bench_mandan(app, layers_dir, repeat):
+    """generate_mandan: スタブのLLM・VOICEVOXで mandan_ready までの時間"""
+    llm_server, llm_url = start_server(llm_stub.make_handler(Namespace(
+        ollama_first_token_ms=0, claude_first_token_ms=0, token_ms=0,
+        ollama_error_rate=0.0, claude_error_rate=0.0
+    )))
+    voice_server, voice_url = start_server(voicevox_stub.make_handler(0, 0))
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        app.ollama_client.base_url = llm_url
+        app.ollama_client._client = None
+        app.claude_client.base_url = llm_url
+        app.claude_client.api_key = app.claude_client.api_key or 'stub'
+        app.claude_client._client = None
+        app.voicevox_client.base_url = voice_url
+        app.voicevox_client.cache_dir = Path(cache_dir)
+        app.zundamon_compositor = ZundamonCompositor(str(layers_dir))
+        app.compositor_pool = None
+        app.mandan_store = None
+
+        client = app.socketio.test_client(app.app)
+        for provider in ('ollama', 'claude'):
+            def run():
+                client.emit('generate_mandan', {'topic': 'ベンチマーク', 'maxlength': 100,
+                                                'provider': provider, 'reuse': False})
+                events = [message['name'] for message in client.get_received()]
+                if 'mandan_ready' not in events:
+                    raise RuntimeError(f"mandan_ready が返りませんでした: {events}")
+            results[provider] = measure(run, repeat)
+        client.disconnect()
+    llm_server.shutdown()
+    voice_server.shutdown()
+    return results
+
+
+def git_info():
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=BACKYARD_DIR, capture_output=True,
+                                  text=True, timeout=10).stdout.strip()
+        except Exception:
+            return ''
+    return {'commit': git('rev-parse', '--short', 'HEAD') or 'unknown', 'dirty': bool(git('status', '--porcelain'))}
+
+
+def compare(results, previous, threshold):
+    """前回の結果と中央値を比べ、threshold（割合）以上遅くなったものを返す"""
+    regressions = []
+    for suite, cases in results['suites'].items():
+        for case, stats in cases.items():
+            before = previous.get('suites', {}).get(suite, {}).get(case)
+            if not before or not before.get('median_ms'):
+                continue
+            change = stats['median_ms'] / before['median_ms'] - 1
+            print(f"  {suite}.{case}: {before['median_ms']:.3f} → {stats['median_ms']:.3f} ms ({change:+.1%})")
+            if change > threshold:
+                regressions.append(f"{suite}.{case} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="バックエンドのホットパスのベンチマーク")
+    parser.add_argument("--layers", help="レイヤーディレクトリ（省略時は合成用のダミーを作成）")
+    parser.add_argument("--output", help="結果のJSON（省略時は benchmarks/results/<日時>-<コミット>.json）")
+    parser.add_argument("--only", help=f"実行するもの（カンマ区切り: {','.join(SUITES)}）")
+    parser.add_argument("--repeat", type=int, default=20, help="基本の繰り返し回数")
+    parser.add_argument("--compare", help="比較する前回の結果のJSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="遅くなったとみなす中央値の増加率")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    suites = args.only.split(',') if args.only else list(SUITES)
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"不明なベンチマーク: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        layers_dir = Path(args.layers) if args.layers else generate_layer_set(Path(tmp) / 'layers')
+
+        app = None
+        if {'voice', 'yaml', 'mandan'} & set(suites):
+            # app は読み込み時に設定やクライアントを作るので、ログは捨てる
+            with contextlib.redirect_stdout(io.StringIO()):
+                import app
+
+        runners = {
+            'compose': lambda: bench_compose(layers_dir, args.repeat),
+            'resolve': lambda: bench_resolve(layers_dir, args.repeat),
+            'alpha': lambda: bench_alpha(layers_dir, args.repeat),
+            'blend': lambda: bench_blend(args.repeat),
+            'occlusion': lambda: bench_occlusion(layers_dir, args.repeat, occlusion_report),
+            'voice': lambda: bench_voice(app, args.repeat),
+            'yaml': lambda: bench_yaml(app, args.repeat),
+            'mandan': lambda: bench_mandan(app, layers_dir, args.repeat),
+        }
+        occlusion_report = {}
+        results = {
+            'meta': {
+                **git_info(),
+                'timestamp': datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pillow': PIL.__version__,
+                'cpu_count': os.cpu_count(),
+                'layers': 'synthetic' if not args.layers else str(layers_dir),
+                'repeat': args.repeat
+            },
+            'suites': {}
+        }
+        for suite in suites:
+            print(f"[INFO] {suite} ...")
+            results['suites'][suite] = runners[suite]()
+            for case, stats in results['suites'][suite].items():
+                print(f"  {case}: median {stats['median_ms']:.3f} ms, p95 {stats['p95_ms']:.3f} ms ({stats['runs']} runs)")
+        if occlusion_report:
+            results['occlusion'] = occlusion_report
+            for name, entry in occlusion_report.items():
+                print(f"  {name}: {entry['drawn_pixels']}/{entry['pixels']} px drawn "
+                      f"({entry['saved_ratio']:.1%} saved, {len(entry['skipped_layers'])} layers skipped)")
+
+    output = Path(args.output) if args.output else (
+        BENCH_DIR / 'results' / f"{datetime.now():%Y%m%d-%H%M%S}-{results['meta']['commit']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"[INFO] Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        print(f"[INFO] Compared with {args.compare} ({previous.get('meta', {}).get('commit')})")
+        regressions = compare(results, previous, args.threshold)
+        if regressions:
+            print(f"[ERROR] Regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
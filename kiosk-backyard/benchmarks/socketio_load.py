@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Socket.IO 負荷試験（SLO判定つき）
+N個のクライアントを同時に接続し、voice_synthesize / generate_mandan / get_voice_status を
+指定した割合で送って、イベントごとのスループットと p50/p95/p99 レイテンシ、音声合成キューの深さを計測する。
+クライアント数を段階的に増やし、SLO（イベントごとのp95の上限）を満たす最大の接続数を求められる。
+
+VOICEVOX・LLM のスタブ（遅延を指定可能）とサーバーもこのスクリプトから起動できる:
+  python socketio_load.py --stubs --spawn-app --clients 5,10,20,40 --duration 30 \\
+      --mix voice_synthesize=6,get_voice_status=3,generate_mandan=1 \\
+      --slo voice_synthesize=3000,generate_mandan=15000,get_voice_status=200 \\
+      --synthesis-ms 300 --ollama-first-token-ms 800 --token-ms 20
+
+起動済みのサーバーに対して:
+  python socketio_load.py --url http://127.0.0.1:8000 --clients 20 --duration 60
+"""
+
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from argparse import Namespace
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+import socketio
+
+import llm_stub
+import voicevox_stub
+from voice_load import percentile
+
+APP_PATH = Path(__file__).resolve().parent.parent / 'app.py'
+
+# 送るイベント → 完了とみなすイベント
+EVENTS = {
+    'voice_synthesize': ('voice_ready', 'voice_error', 'voice_fallback'),
+    'generate_mandan': ('mandan_ready', 'mandan_error'),
+    'get_voice_status': ('voice_status_update',),
+}
+ERROR_EVENTS = ('voice_error', 'voice_fallback', 'mandan_error')
+
+MANDAN_TOPICS = ['今日の天気', '東北の温泉', 'ずんだ餅', '秋の紅葉', '電車の旅', '朝ごはん']
+
+
+def parse_pairs(text, value_type=float):
+    """"voice_synthesize=6,generate_mandan=1" → {'voice_synthesize': 6.0, 'generate_mandan': 1.0}"""
+    pairs = {}
+    for item in filter(None, (part.strip() for part in (text or '').split(','))):
+        name, _, value = item.partition('=')
+        if name not in EVENTS:
+            raise ValueError(f"不明なイベント: {name}（{', '.join(EVENTS)}）")
+        pairs[name] = value_type(value)
+    return pairs
+
+
+class Recorder:
+    """全クライアントの計測結果"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = []  # (イベント, 結果, レイテンシ秒)
+        self.queue_depths = []
+
+    def record(self, event_name, outcome, latency):
+        with self.lock:
+            self.results.append((event_name, outcome, latency))
+
+    def record_queue_depth(self, depth):
+        if depth is not None:
+            with self.lock:
+                self.queue_depths.append(depth)
+
+
+class LoadClient:
+    """1クライアント分: 前のリクエストが終わったら思考時間をおいて次を送る（クローズドループ）"""
+
+    def __init__(self, url, mix, options, recorder, rng):
+        self.url = url
+        self.mix = mix
+        self.options = options
+        self.recorder = recorder
+        self.rng = rng
+        self.client = socketio.Client(reconnection=False)
+        self.done = threading.Event()
+        self.pending = None  # (送ったイベント, 応答の対応付けキー)
+        self.outcome = None
+
+        for event_name, done_events in EVENTS.items():
+            for done_event in done_events:
+                self.client.on(done_event, self._make_done_handler(event_name, done_event))
+        self.client.on('voice_queued', lambda data: recorder.record_queue_depth(data.get('queue_position')))
+
+    def _make_done_handler(self, event_name, done_event):
+        def handler(data=None):
+            pending = self.pending
+            if not pending or pending[0] != event_name:
+                return
+            # 音声はテキスト、漫談はトピックで対応付ける（状態取得は1つずつしか送らない）
+            key = (data or {}).get('topic' if event_name == 'generate_mandan' else 'text')
+            if pending[1] is not None and key != pending[1]:
+                return
+            if event_name == 'get_voice_status':
+                self.recorder.record_queue_depth((data or {}).get('queue_size'))
+            self.outcome = 'error' if done_event in ERROR_EVENTS else 'ok'
+            self.done.set()
+        return handler
+
+    def _send(self):
+        names = list(self.mix)
+        event_name = self.rng.choices(names, weights=[self.mix[name] for name in names])[0]
+        tag = uuid.uuid4().hex[:8]
+        if event_name == 'voice_synthesize':
+            key = f"負荷試験なのだ {tag}"
+            payload = {'text': key, 'speaker': 3, 'cache': self.options.cache}
+        elif event_name == 'generate_mandan':
+            key = f"{self.rng.choice(MANDAN_TOPICS)} {tag}"
+            payload = {'topic': key, 'maxlength': self.options.maxlength,
+                       'provider': self.options.provider, 'reuse': self.options.reuse}
+        else:
+            key, payload = None, None
+
+        self.done.clear()
+        self.outcome = None
+        self.pending = (event_name, key)
+        started = time.perf_counter()
+        if payload is None:
+            self.client.emit(event_name)
+        else:
+            self.client.emit(event_name, payload)
+        finished = self.done.wait(self.options.timeout)
+        self.pending = None
+        self.recorder.record(event_name, self.outcome if finished else 'timeout', time.perf_counter() - started)
+
+    def run(self, start_barrier, deadline):
+        """deadline は全員の接続後に決まるので、[終了時刻] のリストで受け取る"""
+        try:
+            self.client.connect(self.url)
+        except Exception as e:
+            print(f"[ERROR] 接続できません: {e}")
+            start_barrier.abort()
+            return
+        try:
+            start_barrier.wait()
+        except threading.BrokenBarrierError:
+            self.client.disconnect()
+            return
+
+        stop_at = deadline[0]
+        sent = 0
+        while time.monotonic() < stop_at and (not self.options.requests or sent < self.options.requests):
+            self._send()
+            sent += 1
+            if self.options.think_ms:
+                time.sleep(self.rng.uniform(0.5, 1.5) * self.options.think_ms / 1000)
+        self.client.disconnect()
+
+
+def monitor_queue(url, recorder, interval, stop):
+    """負荷とは別の接続で音声合成キューの深さを定期的に取得"""
+    client = socketio.Client(reconnection=False)
+    client.on('voice_status_update', lambda data: recorder.record_queue_depth(data.get('queue_size')))
+    try:
+        client.connect(url)
+    except Exception:
+        return
+    while not stop.wait(interval):
+        client.emit('get_voice_status')
+    client.disconnect()
+
+
+def summarize(results, queue_depths, elapsed, clients, slo):
+    """イベントごとのスループット・レイテンシと SLO の判定"""
+    events = {}
+    for event_name in sorted({name for name, _, _ in results}):
+        samples = [(outcome, latency * 1000) for name, outcome, latency in results if name == event_name]
+        latencies = [latency for outcome, latency in samples if outcome == 'ok']
+        events[event_name] = {
+            'sent': len(samples),
+            'ok': len(latencies),
+            'errors': sum(1 for outcome, _ in samples if outcome == 'error'),
+            'timeouts': sum(1 for outcome, _ in samples if outcome == 'timeout'),
+            'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': max(latencies) if latencies else None
+            }
+        }
+
+    violations = []
+    for event_name, limit in slo.items():
+        stats = events.get(event_name)
+        if not stats:
+            continue
+        p95 = stats['latency_ms']['p95']
+        if stats['timeouts']:
+            violations.append(f"{event_name} timeouts={stats['timeouts']}")
+        elif p95 is None:
+            violations.append(f"{event_name} no successful responses")
+        elif p95 > limit:
+            violations.append(f"{event_name} p95={p95:.0f}ms > {limit:.0f}ms")
+
+    return {
+        'clients': clients,
+        'elapsed_s': round(elapsed, 3),
+        'completed': sum(stats['ok'] for stats in events.values()),
+        'throughput_rps': round(sum(stats['ok'] for stats in events.values()) / elapsed, 2) if elapsed else None,
+        'events': events,
+        'queue_depth': {
+            'max': max(queue_depths) if queue_depths else None,
+            'mean': round(sum(queue_depths) / len(queue_depths), 2) if queue_depths else None,
+            'p95': percentile(queue_depths, 95)
+        },
+        'slo_violations': violations,
+        'slo_ok': not violations
+    }
+
+
+def run_stage(args, mix, slo, clients):
+    """指定したクライアント数で duration 秒（または requests 回ずつ）負荷をかける"""
+    recorder = Recorder()
+    barrier = threading.Barrier(clients + 1)
+    deadline = [float('inf')]
+    rng = random.Random(args.seed)
+    load_clients = [LoadClient(args.url, mix, args, recorder, random.Random(rng.random())) for _ in range(clients)]
+
+    threads = []
+    for load_client in load_clients:
+        thread = threading.Thread(target=load_client.run, args=(barrier, deadline), daemon=True)
+        threads.append(thread)
+
+    stop_monitor = threading.Event()
+    monitor = threading.Thread(target=monitor_queue,
+                               args=(args.url, recorder, args.monitor_interval, stop_monitor), daemon=True)
+
+    for thread in threads:
+        thread.start()
+        time.sleep(args.connect_interval)
+    try:
+        # クライアントは全員が揃うまで barrier で待つので、その前に終了時刻を決める
+        deadline[0] = time.monotonic() + args.duration if args.duration else float('inf')
+        barrier.wait(timeout=max(30, clients * 2))
+    except threading.BrokenBarrierError:
+        print("[ERROR] クライアントの接続に失敗しました")
+    started = time.perf_counter()
+    monitor.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop_monitor.set()
+    monitor.join(timeout=5)
+    return summarize(recorder.results, recorder.queue_depths, elapsed, clients, slo)
+
+
+def start_stubs(args):
+    """VOICEVOX と LLM のスタブをこのプロセス内で起動し、サーバーに渡す環境変数を返す"""
+    voice_server = ThreadingHTTPServer(("127.0.0.1", args.voicevox_port),
+                                       voicevox_stub.make_handler(args.synthesis_ms / 1000, args.query_ms / 1000))
+    llm_server = ThreadingHTTPServer(("127.0.0.1", args.llm_port), llm_stub.make_handler(Namespace(
+        ollama_first_token_ms=args.ollama_first_token_ms, claude_first_token_ms=args.claude_first_token_ms,
+        token_ms=args.token_ms, ollama_error_rate=args.ollama_error_rate, claude_error_rate=args.claude_error_rate
+    )))
+    for server in (voice_server, llm_server):
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    voice_url = f"http://127.0.0.1:{voice_server.server_address[1]}"
+    llm_url = f"http://127.0.0.1:{llm_server.server_address[1]}"
+    print(f"[INFO] VOICEVOX stub: {voice_url} (synthesis {args.synthesis_ms:.0f} ms)")
+    print(f"[INFO] LLM stub: {llm_url} (ollama first token {args.ollama_first_token_ms:.0f} ms, "
+          f"claude {args.claude_first_token_ms:.0f} ms, token {args.token_ms:.0f} ms)")
+    return {
+        'VOICEVOX_URL': voice_url,
+        'OLLAMA_URL': llm_url,
+        'CLAUDE_BASE_URL': llm_url,
+        'CLAUDE_API_KEY': os.environ.get('CLAUDE_API_KEY', 'stub')
+    }
+
+
+def spawn_app(args, env):
+    """app.py を起動して応答するまで待つ"""
+    port = int(args.url.rsplit(':', 1)[1].split('/')[0])
+    command = [sys.executable, str(APP_PATH), '--port', str(port)]
+    if args.production:
+        command.append('--production')
+    process = subprocess.Popen(
+        command, cwd=APP_PATH.parent, env={**os.environ, 'FLASK_DEBUG': '0', **env},
+        stdout=None if args.app_log else subprocess.DEVNULL, stderr=None if args.app_log else subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"サーバーが終了しました（終了コード {process.returncode}）")
+        try:
+            requests.get(f"{args.url}/api/voice/status", timeout=1)
+            print(f"[INFO] Server started: {args.url} (pid {process.pid})")
+            return process
+        except requests.RequestException:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("サーバーが起動しませんでした")
+
+
+def print_stage(summary):
+    print(f"clients={summary['clients']} completed={summary['completed']} "
+          f"elapsed={summary['elapsed_s']}s throughput={summary['throughput_rps']} req/s "
+          f"queue_depth max={summary['queue_depth']['max']} mean={summary['queue_depth']['mean']}")
+    for event_name, stats in summary['events'].items():
+        latency = stats['latency_ms']
+        values = " ".join(f"{key}={value:.1f}" if value is not None else f"{key}=-" for key, value in latency.items())
+        print(f"  {event_name}: ok={stats['ok']} errors={stats['errors']} timeouts={stats['timeouts']} "
+              f"{stats['throughput_rps']} req/s  {values} ms")
+    if summary['slo_violations']:
+        print(f"  SLO違反: {', '.join(summary['slo_violations'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO の同時接続負荷試験とSLO判定")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", default="10", help="クライアント数（カンマ区切りで段階的に増やす: 5,10,20）")
+    parser.add_argument("--duration", type=float, default=30, help="各段階の秒数（0なら --requests 回ずつ）")
+    parser.add_argument("--requests", type=int, default=0, help="クライアントごとのリクエスト数（0なら無制限）")
+    parser.add_argument("--mix", default="voice_synthesize=6,get_voice_status=3,generate_mandan=1",
+                        help="イベントの割合")
+    parser.add_argument("--slo", default="", help="イベントごとのp95の上限（ミリ秒）: voice_synthesize=3000,...")
+    parser.add_argument("--think-ms", type=float, default=200, help="リクエスト間の思考時間（平均）")
+    parser.add_argument("--timeout", type=float, default=60, help="1リクエストの制限時間（秒）")
+    parser.add_argument("--cache", default="bypass", choices=["use", "bypass", "invalidate"], help="音声キャッシュ")
+    parser.add_argument("--provider", default="ollama", help="generate_mandan のプロバイダー")
+    parser.add_argument("--maxlength", type=int, default=100)
+    parser.add_argument("--reuse", action="store_true", help="保存済みの漫談の再利用を許す")
+    parser.add_argument("--connect-interval", type=float, default=0.02, help="クライアントの接続間隔（秒）")
+    parser.add_argument("--monitor-interval", type=float, default=0.5, help="キューの深さを取得する間隔（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stop-on-violation", action="store_true", help="SLO違反の段階で打ち切る")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    parser.add_argument("--output", help="結果のJSONを保存するファイル")
+
+    stubs = parser.add_argument_group("スタブ・サーバーの起動")
+    stubs.add_argument("--stubs", action="store_true", help="VOICEVOX・LLMのスタブを起動")
+    stubs.add_argument("--spawn-app", action="store_true", help="app.py を起動（--stubs ならスタブに向ける）")
+    stubs.add_argument("--production", action="store_true", help="app.py を eventlet で起動")
+    stubs.add_argument("--app-log", action="store_true", help="app.py のログを表示")
+    stubs.add_argument("--voicevox-port", type=int, default=0)
+    stubs.add_argument("--llm-port", type=int, default=0)
+    stubs.add_argument("--synthesis-ms", type=float, default=300)
+    stubs.add_argument("--query-ms", type=float, default=30)
+    stubs.add_argument("--ollama-first-token-ms", type=float, default=800)
+    stubs.add_argument("--claude-first-token-ms", type=float, default=500)
+    stubs.add_argument("--token-ms", type=float, default=20)
+    stubs.add_argument("--ollama-error-rate", type=float, default=0.0)
+    stubs.add_argument("--claude-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    try:
+        mix = parse_pairs(args.mix)
+        slo = parse_pairs(args.slo)
+        stages = [int(value) for value in args.clients.split(',')]
+    except ValueError as e:
+        parser.error(str(e))
+    if not args.duration and not args.requests:
+        parser.error("--duration か --requests を指定してください")
+
+    env = start_stubs(args) if args.stubs else {}
+    if env and not args.spawn_app:
+        print("[INFO] サーバーを次の環境変数で起動してください:")
+        print("  " + " ".join(f"{key}={value}" for key, value in env.items()))
+        input("[INFO] 起動したら Enter ...")
+    process = spawn_app(args, env) if args.spawn_app else None
+
+    summaries = []
+    try:
+        for clients in stages:
+            if not args.json:
+                print(f"[INFO] {clients} clients, mix {mix}")
+            summary = run_stage(args, mix, slo, clients)
+            summaries.append(summary)
+            if not args.json:
+                print_stage(summary)
+            if args.stop_on_violation and not summary['slo_ok']:
+                break
+    finally:
+        if process:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    within = [summary['clients'] for summary in summaries if summary['slo_ok']]
+    report = {
+        'url': args.url,
+        'mix': mix,
+        'slo_p95_ms': slo,
+        'think_ms': args.think_ms,
+        'stubs': {key: getattr(args, key) for key in ('synthesis_ms', 'ollama_first_token_ms', 'token_ms')}
+                 if args.stubs else None,
+        'stages': summaries,
+        'max_clients_within_slo': max(within) if slo and within else None
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    elif slo:
+        print(f"SLO を満たした最大クライアント数: {report['max_clients_within_slo']}")
+
+    if slo and summaries and not summaries[-1]['slo_ok']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+合成用のダミーレイヤーセットを作成
+kiosk-factory の layer_extractor.py と同じ形式（グループごとのディレクトリ、bbox で切り出したPNG、
+layer_metadata.json）で、ずんだもんのPSDなしに合成処理を動かしたり計測したりできるようにする。
+
+Usage: python synthetic_layers.py OUTPUT_DIR [--seed 0]
+"""
+
+import argparse
+import json
+import random
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+CANVAS_SIZE = (1082, 1594)
+
+# (グループ名, レイヤー名, bbox の大きさ) 。グループ名 "root" は最上位のレイヤー
+# 名前の先頭の * はラジオボタン（グループから1つ選ぶ）、! は強制表示（PSDTool の拡張）
+LAYER_SPECS = [
+    ("root", "尻尾のような何か", (380, 520)),
+    ("root", "!体", (640, 900)),
+    ("枝豆", "*通常", (300, 260)),
+    ("枝豆", "*立ち", (300, 300)),
+    ("枝豆", "*萎え", (300, 240)),
+    ("枝豆", "*立ち片折れ", (300, 280)),
+    ("右腕", "*腰", (300, 520)),
+    ("右腕", "*指差し横", (420, 360)),
+    ("右腕", "*手を挙げる", (300, 560)),
+    ("右腕", "*基本", (260, 540)),
+    ("右腕", "*横", (400, 380)),
+    ("右腕", "*指差し上", (300, 600)),
+    ("左腕", "*腰", (300, 520)),
+    ("左腕", "*横", (400, 380)),
+    ("左腕", "*手を挙げる", (300, 560)),
+    ("左腕", "*基本", (260, 540)),
+    ("左腕", "*あごに指", (300, 480)),
+    ("左腕", "*口元", (300, 460)),
+    ("頭_正面向き", "*正面向き", (760, 700)),
+    ("頭_上向き", "*上向き", (760, 700)),
+    ("顔色", "*ほっぺ基本", (420, 90)),
+    ("顔色", "*ほっぺ赤め", (420, 90)),
+    ("顔色", "*赤面", (460, 160)),
+    ("顔色", "*青ざめ", (460, 220)),
+    ("顔色", "*非表示", (8, 8)),
+    ("口", "*ほう", (120, 90)),
+    ("口", "*あは", (140, 110)),
+    ("口", "*ほほえみ", (130, 70)),
+    ("口", "*えへ", (130, 80)),
+    ("口", "*にやり", (130, 70)),
+    ("口", "*むふ", (110, 70)),
+    ("口", "*お", (90, 100)),
+    ("口", "*ん", (100, 50)),
+    ("目", "*基本目", (420, 200)),
+    ("目", "*にっこり", (420, 140)),
+    ("目", "*^^", (420, 120)),
+    ("目", "*なごみ目", (420, 130)),
+    ("目", "*閉じ目", (420, 100)),
+    ("目", "*ジト目", (420, 160)),
+    ("目", "*〇〇", (420, 200)),
+    ("眉", "*基本眉", (400, 80)),
+    ("眉", "*怒り眉", (400, 90)),
+    ("眉", "*困り眉", (400, 90)),
+    ("眉", "*上がり眉", (400, 90)),
+    ("眉", "*怒り眉2", (400, 90)),
+]
+
+# 体の中心付近に配置するためのグループごとの位置（キャンバス上の中心座標）
+GROUP_CENTERS = {
+    "root": (541, 1050),
+    "枝豆": (541, 130),
+    "右腕": (330, 1000),
+    "左腕": (750, 1000),
+    "頭_正面向き": (541, 520),
+    "頭_上向き": (541, 500),
+    "顔色": (541, 640),
+    "口": (541, 700),
+    "目": (541, 560),
+    "眉": (541, 450),
+}
+
+
+def clean_name(layer_name: str, parent_group: str) -> str:
+    """layer_extractor._generate_clean_name と同じ規則"""
+    clean = layer_name.lstrip('*!')
+    clean = clean.replace('(', '').replace(')', '').replace(' ', '_')
+    clean = clean.replace('・', '_').replace('、', '_').replace('。', '')
+    if parent_group != "root" and not clean.startswith(parent_group.lower()):
+        clean = f"{parent_group.lower().replace(' ', '_')}_{clean}"
+    return clean.lower()
+
+
+def draw_layer(size, rng: random.Random) -> Image.Image:
+    """不透明な塗りと縁のアンチエイリアス、半透明の影を持つ図形（実際のレイヤーに近いアルファ分布）"""
+    width, height = size
+    scale = 2  # 縁を滑らかにするため大きく描いて縮小する
+    image = Image.new('RGBA', (width * scale, height * scale), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    color = tuple(rng.randrange(40, 240) for _ in range(3))
+    draw.ellipse([0, 0, width * scale - 1, height * scale - 1], fill=color + (255,))
+    for _ in range(3):
+        x0, y0 = rng.randrange(width * scale // 2), rng.randrange(height * scale // 2)
+        x1, y1 = x0 + rng.randrange(4, width * scale // 2 + 5), y0 + rng.randrange(4, height * scale // 2 + 5)
+        shade = tuple(max(0, c - 60) for c in color) + (rng.randrange(60, 200),)
+        draw.ellipse([x0, y0, x1, y1], fill=shade)
+    return image.resize(size, Image.LANCZOS)
+
+
+def generate_layer_set(output_dir, seed: int = 0) -> Path:
+    """ダミーレイヤーセットを作成してディレクトリを返す"""
+    output_dir = Path(output_dir)
+    rng = random.Random(seed)
+    metadata = {
+        "version": "2.0",
+        "psd_info": {
+            "width": CANVAS_SIZE[0],
+            "height": CANVAS_SIZE[1],
+            "color_mode": "ColorMode.RGB",
+            "source_file": "synthetic"
+        },
+        "layers": {},
+        "radio_groups": {},
+        "composition_order": []
+    }
+
+    for z_index, (group, layer_name, size) in enumerate(LAYER_SPECS):
+        name = clean_name(layer_name, group)
+        file_path = f"base/{name}.png" if group == "root" else f"{group.lower()}/{name}.png"
+        (output_dir / file_path).parent.mkdir(parents=True, exist_ok=True)
+        draw_layer(size, rng).save(output_dir / file_path)
+
+        center_x, center_y = GROUP_CENTERS[group]
+        left = center_x - size[0] // 2 + rng.randrange(-20, 21)
+        top = center_y - size[1] // 2 + rng.randrange(-20, 21)
+        layer_info = {
+            "original_name": layer_name,
+            "file": file_path,
+            "bbox": {
+                "left": left, "top": top, "right": left + size[0], "bottom": top + size[1],
+                "width": size[0], "height": size[1]
+            },
+            "z_index": z_index,
+            "visible": True,
+            "opacity": 255,
+            "blend_mode": "BlendMode.NORMAL",
+            "required": layer_name.startswith('!'),
+            "parent_group": group
+        }
+        if layer_name.startswith('*'):
+            layer_info["radio_group"] = group
+            metadata["radio_groups"].setdefault(group, []).append(name)
+        metadata["layers"][name] = layer_info
+        metadata["composition_order"].append(name)
+
+    with open(output_dir / "layer_metadata.json", 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成用のダミーレイヤーセットを作成")
+    parser.add_argument("output_dir")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    output_dir = generate_layer_set(args.output_dir, args.seed)
+    print(f"[INFO] Synthetic layer set written to {output_dir} ({len(LAYER_SPECS)} layers)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+voice_synthesize 負荷試験
+複数のSocket.IOクライアントから同時に voice_synthesize を送り、
+voice_ready（または voice_error / voice_fallback）までのレイテンシを計測する。
+
+Usage:
+  python voicevox_stub.py --port 50121 &
+  VOICEVOX_URL=http://127.0.0.1:50121 KIOSK_SERVER_MODE=production python ../app.py &
+  python voice_load.py --url http://127.0.0.1:8000 --clients 20 --requests 5
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+
+import socketio
+
+DONE_EVENTS = ('voice_ready', 'voice_error', 'voice_fallback')
+
+
+def percentile(values, p):
+    """線形補間なしのパーセンタイル"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_client(url, requests_per_client, cache_mode, results, lock, start_barrier):
+    """1クライアント分: 接続して voice_synthesize を順に送る"""
+    client = socketio.Client(reconnection=False)
+    pending = {}
+    finished = threading.Event()
+    state = {'sent': 0, 'done': 0}
+
+    def send_next():
+        # タスクIDはサーバーが振るため、テキストで対応付ける
+        text = f"負荷試験なのだ {uuid.uuid4().hex[:8]}"
+        pending[text] = time.perf_counter()
+        state['sent'] += 1
+        client.emit('voice_synthesize', {'text': text, 'speaker': 3, 'cache': cache_mode})
+
+    def make_done_handler(event_name):
+        def handler(data):
+            started = pending.pop(data.get('text'), None)
+            if started is None:
+                return
+            with lock:
+                results.append((event_name, time.perf_counter() - started))
+            state['done'] += 1
+            if state['sent'] < requests_per_client:
+                send_next()
+            elif state['done'] >= requests_per_client:
+                finished.set()
+        return handler
+
+    for event_name in DONE_EVENTS:
+        client.on(event_name, make_done_handler(event_name))
+
+    client.connect(url)
+    start_barrier.wait()
+    send_next()
+    finished.wait(timeout=120)
+    client.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="voice_synthesize の同時接続負荷試験")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=5, help="クライアントごとのリクエスト数")
+    parser.add_argument("--cache", default="bypass", choices=["use", "bypass", "invalidate"])
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    results = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.clients)
+    threads = [
+        threading.Thread(target=run_client, args=(args.url, args.requests, args.cache, results, lock, barrier))
+        for _ in range(args.clients)
+    ]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency * 1000 for _, latency in results]
+    summary = {
+        "clients": args.clients,
+        "requests": args.clients * args.requests,
+        "completed": len(results),
+        "errors": sum(1 for event_name, _ in results if event_name != 'voice_ready'),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None
+        }
+    }
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"clients={summary['clients']} requests={summary['requests']} "
+          f"completed={summary['completed']} errors={summary['errors']}")
+    print(f"elapsed={summary['elapsed_s']}s throughput={summary['throughput_rps']} req/s")
+    for key, value in summary["latency_ms"].items():
+        print(f"  {key}: {value:.1f} ms" if value is not None else f"  {key}: -")
+
+
+if __name__ == "__main__":
+    main()
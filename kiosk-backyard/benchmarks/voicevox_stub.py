@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+VOICEVOX ENGINE スタブサーバー
+/version, /speakers, /audio_query, /synthesis を模擬し、合成時間を指定した遅延で再現する。
+VOICEVOXなしで音声合成まわりの負荷試験を行うためのサーバー。
+
+Usage: python voicevox_stub.py [--port 50121] [--synthesis-ms 300] [--query-ms 30]
+"""
+
+import argparse
+import io
+import json
+import struct
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SAMPLE_RATE = 24000
+
+
+def make_wav(seconds):
+    """無音のWAVデータを作成"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(struct.pack('<h', 0) * int(SAMPLE_RATE * seconds))
+    return buffer.getvalue()
+
+
+def make_audio_query(text):
+    """1文字1モーラのaudio_queryを作成"""
+    vowels = "aiueo"
+    moras = [{
+        "text": ch,
+        "consonant": None,
+        "consonant_length": None,
+        "vowel": vowels[i % len(vowels)],
+        "vowel_length": 0.1,
+        "pitch": 5.5
+    } for i, ch in enumerate(text)]
+    return {
+        "accent_phrases": [{"moras": moras, "accent": 1, "pause_mora": None, "is_interrogative": False}],
+        "speedScale": 1.0,
+        "pitchScale": 0.0,
+        "intonationScale": 1.0,
+        "volumeScale": 1.0,
+        "prePhonemeLength": 0.1,
+        "postPhonemeLength": 0.1,
+        "outputSamplingRate": SAMPLE_RATE,
+        "outputStereo": False
+    }
+
+
+def make_handler(synthesis_delay, query_delay):
+    class StubHandler(BaseHTTPRequestHandler):
+        def _send_json(self, data):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/version":
+                self._send_json("stub")
+            elif path == "/speakers":
+                self._send_json([{"name": "ずんだもん", "styles": [{"name": "ノーマル", "id": 3}]}])
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else b""
+
+            if url.path == "/audio_query":
+                time.sleep(query_delay)
+                self._send_json(make_audio_query(parse_qs(url.query).get("text", [""])[0]))
+            elif url.path == "/synthesis":
+                query = json.loads(body or b"{}")
+                moras = sum(len(p["moras"]) for p in query.get("accent_phrases", []))
+                time.sleep(synthesis_delay)
+                wav = make_wav(0.1 * moras + 0.2)
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/wav")
+                self.send_header("Content-Length", str(len(wav)))
+                self.end_headers()
+                self.wfile.write(wav)
+            else:
+                self.send_error(404)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VOICEVOX ENGINE スタブサーバー")
+    parser.add_argument("--port", type=int, default=50121)
+    parser.add_argument("--synthesis-ms", type=float, default=300, help="/synthesis の処理時間")
+    parser.add_argument("--query-ms", type=float, default=30, help="/audio_query の処理時間")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port),
+                                 make_handler(args.synthesis_ms / 1000, args.query_ms / 1000))
+    print(f"[INFO] VOICEVOX stub listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[INFO] VOICEVOX stub stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Blend Kernels
+レイヤーの描画モード（通常・乗算・スクリーン・オーバーレイ）と不透明度を反映して、
+RGBA配列（uint8 / uint16）の上に別のRGBA配列を重ねる。
+浮動小数点に変換せず整数のまま計算し、結果は重ねられる側の配列に直接書き込む。
+
+計算は W3C Compositing and Blending Level 1 の source-over と分離可能な描画モードに従う
+（PSD の合成、ブラウザの canvas の globalCompositeOperation と同じ定義）。
+"""
+
+import logging
+from typing import Callable, Dict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# layer_metadata.json の blend_mode（psd-tools の BlendMode を文字列にしたもの）→ 描画モード
+BLEND_MODES = {
+    'BlendMode.NORMAL': 'normal',
+    'BlendMode.PASS_THROUGH': 'normal',
+    'BlendMode.MULTIPLY': 'multiply',
+    'BlendMode.SCREEN': 'screen',
+    'BlendMode.OVERLAY': 'overlay',
+}
+
+_warned_modes = set()
+
+
+def blend_mode_name(blend_mode: str) -> str:
+    """メタデータの描画モードを kernel 名に変換（対応していないモードは通常として扱う）"""
+    if blend_mode in KERNELS:
+        return blend_mode
+    name = BLEND_MODES.get(blend_mode)
+    if name is None:
+        if blend_mode not in _warned_modes:
+            _warned_modes.add(blend_mode)
+            logger.warning(f"Unsupported blend mode {blend_mode}, using normal")
+        name = 'normal'
+    return name
+
+
+def _div(numerator: np.ndarray, denominator, maximum: int) -> np.ndarray:
+    """四捨五入した整数の割り算（255 で割るときはシフトで計算する）"""
+    if maximum == 255 and isinstance(denominator, int) and denominator == 255:
+        numerator = numerator + 128
+        return (numerator + (numerator >> 8)) >> 8
+    return (numerator + denominator // 2) // denominator
+
+
+# 描画モードの関数 B(背景色, 前景色)。値は 0..maximum の整数（作業用の型）
+def _normal(backdrop, source, maximum):
+    return source
+
+
+def _multiply(backdrop, source, maximum):
+    return _div(backdrop * source, maximum, maximum)
+
+
+def _screen(backdrop, source, maximum):
+    return backdrop + source - _div(backdrop * source, maximum, maximum)
+
+
+def _overlay(backdrop, source, maximum):
+    # 背景が暗い側なら乗算、明るい側ならスクリーン（ハードライトの前景と背景を入れ替えたもの）
+    doubled = backdrop * 2
+    dark = _div(doubled * source, maximum, maximum)
+    light_backdrop = np.maximum(doubled, maximum) - maximum
+    light = light_backdrop + source - _div(light_backdrop * source, maximum, maximum)
+    return np.where(doubled <= maximum, dark, light)
+
+
+KERNELS: Dict[str, Callable] = {
+    'normal': _normal,
+    'multiply': _multiply,
+    'screen': _screen,
+    'overlay': _overlay,
+}
+
+
+def blend(dst: np.ndarray, src: np.ndarray, mode: str = 'normal', opacity: int = 255) -> np.ndarray:
+    """dst (H, W, 4) の上に src (H, W, 4) を重ね、結果を dst に書き込んで返す
+
+    Args:
+        dst: 背景（ストレートアルファの RGBA。uint8 か uint16）
+        src: 前景（dst と同じ形・型）
+        mode: 描画モード（normal / multiply / screen / overlay、またはメタデータの BlendMode.*）
+        opacity: レイヤーの不透明度（PSD と同じ 0-255）
+    """
+    if dst.shape != src.shape or dst.dtype != src.dtype:
+        raise ValueError(f"形・型が違います: {dst.shape} {dst.dtype} / {src.shape} {src.dtype}")
+    maximum = int(np.iinfo(dst.dtype).max)
+    # 途中の積（最大で maximum の3乗）が収まる型
+    work = np.uint32 if dst.dtype == np.uint8 else np.uint64
+    kernel = KERNELS[blend_mode_name(mode)]
+
+    backdrop_alpha = dst[:, :, 3:4].astype(work)
+    source_alpha = src[:, :, 3:4].astype(work)
+    if opacity < 255:
+        source_alpha = _div(source_alpha * opacity, 255, 255) if maximum == 255 else \
+            (source_alpha * opacity + 127) // 255
+    backdrop = dst[:, :, :3].astype(work)
+    source = src[:, :, :3].astype(work)
+
+    # 背景が透明な部分は前景の色、不透明な部分は描画モードの結果（× maximum）
+    if kernel is _normal:
+        mixed = source * maximum
+    else:
+        mixed = (maximum - backdrop_alpha) * source + backdrop_alpha * kernel(backdrop, source, maximum)
+
+    # source-over（乗算済みの色と結果のアルファ。どちらも × maximum^2）
+    inverse_alpha = maximum - source_alpha
+    color = source_alpha * mixed + inverse_alpha * backdrop_alpha * backdrop
+    alpha = source_alpha * maximum + inverse_alpha * backdrop_alpha
+
+    dst[:, :, :3] = np.where(alpha > 0, (color + alpha // 2) // np.maximum(alpha, 1), 0)
+    dst[:, :, 3:4] = _div(alpha, maximum, maximum)
+    return dst
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Compositor Process Pool
+ずんだもん画像の合成を別プロセスで行うワーカープール。
+レイヤー画像は親プロセスで1つの共有メモリに展開し、各ワーカーはそれをコピーせずに参照する。
+"""
+
+import logging
+import multiprocessing
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from zundamon_compositor import ZundamonCompositor
+
+logger = logging.getLogger(__name__)
+
+# ワーカー起動中の __main__ 差し替えを直列化する
+_start_lock = threading.Lock()
+
+class SharedLayerStore:
+    """全レイヤーのRGBA配列を1つの共有メモリに格納"""
+
+    def __init__(self, shm: SharedMemory, manifest: Dict[str, Tuple[int, Tuple[int, ...]]]):
+        self.shm = shm
+        self.manifest = manifest  # レイヤー名 → (オフセット, 形状)
+
+    @classmethod
+    def create(cls, compositor: ZundamonCompositor) -> 'SharedLayerStore':
+        """メタデータの全レイヤーを読み込んで共有メモリに配置"""
+        arrays = {}
+        for layer_name in compositor.metadata.get("layers", {}):
+            array = compositor.load_layer_array(layer_name)
+            if array is not None:
+                arrays[layer_name] = array
+
+        total = sum(array.nbytes for array in arrays.values())
+        shm = SharedMemory(create=True, size=max(total, 1))
+        manifest = {}
+        offset = 0
+        for layer_name, array in arrays.items():
+            view = np.ndarray(array.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+            view[:] = array
+            manifest[layer_name] = (offset, array.shape)
+            offset += array.nbytes
+
+        logger.info(f"Shared {len(manifest)} layers in {total / 1024 / 1024:.1f} MB ({shm.name})")
+        return cls(shm, manifest)
+
+    @staticmethod
+    def views(shm: SharedMemory, manifest) -> Dict[str, np.ndarray]:
+        """共有メモリ上のレイヤー配列（読み取り専用ビュー）"""
+        views = {}
+        for layer_name, (offset, shape) in manifest.items():
+            view = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+            view.flags.writeable = False
+            views[layer_name] = view
+        return views
+
+    def close(self):
+        """共有メモリを解放"""
+        self.shm.close()
+        self.shm.unlink()
+
+
+@contextmanager
+def _worker_entry_main():
+    """ワーカーの起動中だけ __main__ を compositor_worker に差し替える
+
+    forkserver/spawn の子プロセスは親の __main__ を __mp_main__ として読み込み直すため、
+    そのままではサーバー本体（app.py）が丸ごと実行される。
+    """
+    import compositor_worker
+
+    with _start_lock:
+        main_module = sys.modules['__main__']
+        sys.modules['__main__'] = compositor_worker
+        try:
+            yield compositor_worker
+        finally:
+            sys.modules['__main__'] = main_module
+
+
+class CompositorPool:
+    """合成ワーカープロセスのプール
+
+    各ワーカーとはパイプで1対1に接続し、空いているワーカーに合成要求を送る。
+    スレッドを使わないため、eventlet の本番モードでもグリーンスレッドから直接呼べる。
+    """
+
+    def __init__(self, compositor: ZundamonCompositor, workers: int = 3, timeout: float = 30,
+                 store: Optional[SharedLayerStore] = None):
+        """
+        Args:
+            compositor: メタデータ読み込み済みの合成器（親プロセス側。合成済み画像のキャッシュにも使う）
+            workers: ワーカープロセス数
+            timeout: 1回の合成の制限時間（秒）。超えたワーカーは再起動する
+            store: 作成済みの共有メモリ（省略時はここで全レイヤーを読み込んで作る）
+        """
+        self.compositor = compositor
+        self.workers = workers
+        self.timeout = timeout
+        self.store = store or SharedLayerStore.create(compositor)
+
+        # forkserver: スレッドを持つ親プロセスを直接forkしない
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if self.context.get_start_method() == "forkserver":
+            self.context.set_forkserver_preload(["compositor_worker"])
+
+        self._idle = queue.Queue()
+        self._processes = {}
+        self._starting = set()  # まだ準備完了を受け取っていないワーカー
+        for _ in range(workers):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self):
+        parent_conn, child_conn = self.context.Pipe()
+        with _worker_entry_main() as entry:
+            process = self.context.Process(
+                target=entry.worker_main,
+                args=(child_conn, str(self.compositor.layers_dir), self.store.shm.name, self.store.manifest,
+                      self.compositor.tile_threads),
+                daemon=True
+            )
+            process.start()
+        child_conn.close()
+        self._processes[parent_conn] = process
+        self._starting.add(parent_conn)
+        return parent_conn
+
+    def _wait_ready(self, conn):
+        """起動直後のワーカーなら準備完了の通知を待つ"""
+        if conn in self._starting:
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"合成ワーカーが{self.timeout}秒以内に起動しませんでした")
+            conn.recv()
+            self._starting.discard(conn)
+
+    def _acquire(self):
+        """空いているワーカーを取得（落ちていれば置き換える）"""
+        conn = self._idle.get()
+        while not self._processes[conn].is_alive():
+            # 落ちたワーカーのパイプへの書き込みは eventlet では戻ってこないため、送る前に置き換える
+            logger.warning("Compositor worker died, restarting")
+            self._replace_worker(conn)
+            conn = self._idle.get()
+        return conn
+
+    def _replace_worker(self, conn):
+        """応答しない・落ちたワーカーを新しいものに置き換える"""
+        process = self._processes.pop(conn, None)
+        if process:
+            process.kill()
+        self._starting.discard(conn)
+        conn.close()
+        self._idle.put(self._start_worker())
+
+    def warm_up(self):
+        """全ワーカーの準備完了を待つ（最初の合成で待たないように）"""
+        conns = [self._acquire() for _ in range(self.workers)]
+        for conn in conns:
+            try:
+                self._wait_ready(conn)
+            except (OSError, EOFError, TimeoutError):
+                self._replace_worker(conn)
+                raise
+            self._idle.put(conn)
+
+    def _request(self, request) -> bytes:
+        """空いているワーカーに要求を送り、エンコード済みの画像データを受け取る"""
+        conn = self._acquire()
+        try:
+            self._wait_ready(conn)
+            conn.send(request)
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"合成が{self.timeout}秒以内に終わりませんでした")
+            status, data = conn.recv()
+        except (OSError, EOFError, TimeoutError):
+            self._replace_worker(conn)
+            raise
+        self._idle.put(conn)
+
+        if status != 'ok':
+            raise RuntimeError(data)
+        return data
+
+    def compose(self, params: Optional[Dict[str, str]] = None, format: str = 'PNG') -> bytes:
+        """パラメータを送って合成し、エンコード済みの画像データを受け取る"""
+        params = self.compositor.with_defaults(params)
+        key = self.compositor.render_key(params, format)
+        cached = self.compositor.get_rendered(key)
+        if cached:
+            return cached
+
+        data = self._request(('compose', params, format))
+        self.compositor.store_rendered(key, params, format, data)
+        return data
+
+    def encode_region(self, layer_names: List[str], rect: Tuple[int, int, int, int], format: str = 'PNG') -> bytes:
+        """キャンバスの rect の範囲だけをワーカーで合成する"""
+        return self._request(('region', list(layer_names), tuple(rect), format))
+
+    def compose_patch(self, previous_params: Dict[str, str], params: Dict[str, str], format: str = 'PNG') -> Dict:
+        """差分画像（変わった範囲の判定と差分のキャッシュは親プロセス、範囲の合成はワーカー）"""
+        return self.compositor.compose_patch(previous_params, params, format, encode_region=self.encode_region)
+
+    def shutdown(self):
+        """ワーカーを停止して共有メモリを解放"""
+        for conn, process in list(self._processes.items()):
+            if process.is_alive():
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+            process.join(timeout=0.5)
+            if process.is_alive():
+                process.kill()
+        self._processes.clear()
+        self.store.close()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Compositor Worker
+合成ワーカープロセスの起動モジュール。
+ワーカーは起動時にこのモジュールを __mp_main__ として読み込むため、サーバー本体（app.py）は読み込まない。
+ここでは compositor_pool と zundamon_compositor 以外を import しないこと。
+"""
+
+import os
+import signal
+from multiprocessing.shared_memory import SharedMemory
+
+from compositor_pool import SharedLayerStore
+from zundamon_compositor import ZundamonCompositor
+
+
+def worker_main(conn, layers_dir: str, shm_name: str, manifest, tile_threads: int = 1):
+    """ワーカープロセス: 合成器を作って共有メモリのレイヤーを割り当て、合成要求を処理し続ける
+
+    要求は ('compose', パラメータ, フォーマット)（画像全体）か
+    ('region', レイヤー名のリスト, 範囲, フォーマット)（差分画像の範囲だけ）。
+    """
+    # 終了は親プロセスが管理する（Ctrl+C等はプロセスグループ全体に届くため無視し、パイプが閉じたら終了）
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # eventlet の本番モードでは親のパイプがノンブロッキングで作られるため、ワーカー側はブロッキングに戻す
+    os.set_blocking(conn.fileno(), True)
+
+    # ワーカーは親プロセスと同じ resource_tracker を使うため、破棄は親の close() に任せる
+    shm = SharedMemory(name=shm_name)
+
+    # 合成済み画像のキャッシュは親プロセスで持つ
+    compositor = ZundamonCompositor(layers_dir, max_rendered=0, tile_threads=tile_threads)
+    compositor.layer_arrays = SharedLayerStore.views(shm, manifest)
+    conn.send(('ready', None))
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        kind, *args = request
+        try:
+            if kind == 'region':
+                data = compositor.encode_region(*args)
+            else:
+                data = compositor.compose_image(*args).getvalue()
+            conn.send(('ok', data))
+        except Exception as e:
+            conn.send(('error', str(e)))
+
+    compositor.layer_arrays = {}
+    shm.close()
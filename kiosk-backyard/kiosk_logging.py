@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Kiosk Logging
+構造化ログ（JSON Lines）の設定。ログはキューに積むだけで、書き込みは別スレッドで行う
+（PYTHONUNBUFFERED=1 の Docker で stdout や SDカードへの書き込みを待たないため）。
+カテゴリ（ロガー名）ごとにサンプリングと1秒あたりの上限を設定でき、WARNING 以上は常に出力する。
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import random
+import re
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+LOGGER_PREFIX = 'kiosk.'
+
+# LogRecord の標準属性（これ以外の extra はフィールドとして出力する）
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def _original(name: str):
+    """eventlet のモンキーパッチ前のモジュール（書き込みスレッドをOSスレッドで動かし、ハブを止めないため）"""
+    if 'eventlet' in sys.modules:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread'):
+            return patcher.original(name)
+    return __import__(name)
+
+
+def parse_size(value) -> int:
+    """"10MB" → 10485760（数値はそのままバイト数）"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMG]?)B?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"サイズを解釈できません: {value}")
+    return int(float(match.group(1)) * 1024 ** ' KMG'.index(match.group(2).upper() or ' '))
+
+
+def category_of(record: logging.LogRecord) -> str:
+    return record.name[len(LOGGER_PREFIX):] if record.name.startswith(LOGGER_PREFIX) else record.name
+
+
+def record_fields(record: logging.LogRecord) -> Dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1レコードのJSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'category': category_of(record),
+            'msg': record.getMessage(),
+            **record_fields(record)
+        }
+        exc = self.formatException(record.exc_info) if record.exc_info else record.exc_text
+        if exc:
+            entry['exc'] = exc
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """人が読む形式（時刻 [レベル] カテゴリ: メッセージ key=value ...）"""
+
+    def format(self, record):
+        fields = ' '.join(f"{key}={value}" for key, value in record_fields(record).items())
+        line = (f"{datetime.fromtimestamp(record.created):%H:%M:%S} [{record.levelname}] "
+                f"{category_of(record)}: {record.getMessage()}" + (f" {fields}" if fields else ''))
+        exc = self.formatException(record.exc_info) if record.exc_info else record.exc_text
+        if exc:
+            line += '\n' + exc
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """カテゴリごとのサンプリング（sample: 残す割合）と流量制限（rate: 1秒あたりの件数）
+
+    WARNING 以上は常に通す。捨てた件数は次に通したレコードの suppressed に入れる。
+    """
+
+    def __init__(self, categories: Dict[str, Dict]):
+        super().__init__()
+        self.categories = categories or {}
+        self._buckets = {}  # カテゴリ → [トークン, 最終更新時刻]
+        self._suppressed = {}
+        # 合成（eventlet の tpool のOSスレッド）からも呼ばれるのでOSのロックを使う
+        self._lock = _original('threading').Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        category = category_of(record)
+        config = self.categories.get(category)
+        if not config:
+            return True
+
+        with self._lock:
+            keep = random.random() < config.get('sample', 1.0)
+            rate = config.get('rate')
+            if keep and rate:
+                now = time.monotonic()
+                tokens, updated = self._buckets.get(category, (rate, now))
+                tokens = min(rate, tokens + (now - updated) * rate)
+                keep = tokens >= 1
+                self._buckets[category] = (tokens - 1 if keep else tokens, now)
+            if not keep:
+                self._suppressed[category] = self._suppressed.get(category, 0) + 1
+                return False
+            suppressed = self._suppressed.pop(category, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """キューが一杯なら待たずに捨てる（捨てた件数は次のレコードに付ける）"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.dropped:
+            record.dropped = self.dropped
+        try:
+            self.queue.put_nowait(record)
+            self.dropped = 0
+        except Exception:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # 書き込みスレッドで整形するため、メッセージの展開だけ済ませて引数は捨てる
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_text = record.exc_text or (logging.Formatter().formatException(record.exc_info)
+                                              if record.exc_info else None)
+        record.exc_info = None
+        return record
+
+
+class _OSThreadQueueListener(logging.handlers.QueueListener):
+    """書き込みスレッドを eventlet 下でもOSスレッドで動かす（ファイル・標準出力への書き込みでハブを止めない）"""
+
+    def start(self):
+        self._thread = _original('threading').Thread(target=self._monitor, name='log-writer', daemon=True)
+        self._thread.start()
+
+
+class EventLogger(logging.LoggerAdapter):
+    """フィールド付きのイベントを出すロガー
+
+        log = get_logger('voice')
+        log.event('cache_hit', key=cache_key)
+        with log.timed('synthesize', chars=len(text)):
+            ...
+    """
+
+    def process(self, msg, kwargs):
+        return msg, kwargs
+
+    def event(self, name: str, level: int = logging.INFO, **fields):
+        if self.isEnabledFor(level):
+            self.logger.log(level, name, extra=fields, stacklevel=2)
+
+    @contextmanager
+    def timed(self, name: str, level: int = logging.INFO, **fields):
+        """処理時間（duration_ms）付きで出力。例外なら error フィールド付きの WARNING"""
+        started = time.perf_counter()
+        try:
+            yield fields
+        except Exception as e:
+            fields.update(duration_ms=round((time.perf_counter() - started) * 1000, 1), error=str(e))
+            self.event(name, logging.WARNING, **fields)
+            raise
+        fields['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        self.event(name, level, **fields)
+
+
+def get_logger(category: str) -> EventLogger:
+    return EventLogger(logging.getLogger(LOGGER_PREFIX + category), {})
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(config: Optional[Dict] = None) -> Optional[logging.handlers.QueueListener]:
+    """settings.yaml の logging 設定でルートロガーを設定する
+
+    level / file / max_size / backup_count に加え、
+    console（標準出力にも出すか）、queue_size、categories（カテゴリ → {sample, rate}）を使う。
+    """
+    global _listener
+    config = config or {}
+    handlers = []
+
+    log_file = config.get('file')
+    if log_file:
+        try:
+            Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file,
+                maxBytes=parse_size(config.get('max_size', '10MB')),
+                backupCount=config.get('backup_count', 5),
+                encoding='utf-8'
+            )
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        except Exception as e:
+            print(f"⚠️  ログファイルを開けません（標準出力のみに出力します）: {log_file}: {e}")
+    if config.get('console', True) or not handlers:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(ConsoleFormatter())
+        handlers.append(console_handler)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    stop_logging()
+
+    log_queue = _original('queue').Queue(config.get('queue_size', 10000))
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(config.get('categories', {})))
+    root.addHandler(queue_handler)
+    root.setLevel(config.get('level', 'INFO'))
+
+    _listener = _OSThreadQueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """キューに残っているログを書き出して書き込みスレッドを止める"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
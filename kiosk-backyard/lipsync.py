@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Zundamon Lip-sync Track Builder
+VOICEVOX audio_query のモーラ・音素タイミングから口形状タイムラインを生成する
+"""
+
+from typing import Dict, List
+
+# VOICEVOX の母音記号 → 口形状
+VOWEL_TO_MOUTH = {
+    'a': 'あ',
+    'i': 'い',
+    'u': 'う',
+    'e': 'え',
+    'o': 'お',
+    'A': 'あ',  # 無声化母音
+    'I': 'い',
+    'U': 'う',
+    'E': 'え',
+    'O': 'お',
+    'N': 'ん',
+    'cl': 'ん',  # 促音は口を閉じる
+    'pau': 'ん',
+}
+
+# 口を閉じた状態（無音区間）
+CLOSED_MOUTH = 'ん'
+
+
+def _iter_mora_segments(audio_query: Dict):
+    """audio_queryから (長さ[秒], 口形状) の区間列を生成"""
+    yield audio_query.get('prePhonemeLength', 0.0), CLOSED_MOUTH
+
+    for accent_phrase in audio_query.get('accent_phrases', []):
+        for mora in accent_phrase.get('moras', []):
+            length = (mora.get('consonant_length') or 0.0) + (mora.get('vowel_length') or 0.0)
+            yield length, VOWEL_TO_MOUTH.get(mora.get('vowel'), CLOSED_MOUTH)
+
+        pause_mora = accent_phrase.get('pause_mora')
+        if pause_mora:
+            yield pause_mora.get('vowel_length') or 0.0, CLOSED_MOUTH
+
+    yield audio_query.get('postPhonemeLength', 0.0), CLOSED_MOUTH
+
+
+def build_mouth_timeline(audio_query: Dict) -> Dict:
+    """
+    audio_queryから口形状タイムラインを生成
+
+    Args:
+        audio_query: VOICEVOX /audio_query のレスポンス
+
+    Returns:
+        Dict: {'duration': 秒, 'frames': [[開始秒, 口形状], ...]}
+              同じ口形状が連続する区間はまとめる
+    """
+    speed_scale = audio_query.get('speedScale') or 1.0
+
+    frames: List[List] = []
+    current_time = 0.0
+    for length, mouth in _iter_mora_segments(audio_query):
+        if length <= 0:
+            continue
+        if not frames or frames[-1][1] != mouth:
+            frames.append([round(current_time, 3), mouth])
+        current_time += length / speed_scale
+
+    return {
+        'duration': round(current_time, 3),
+        'frames': frames
+    }
+
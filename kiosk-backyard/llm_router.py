@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+LLM Router
+漫談生成に使うLLM（Ollama / Claude）をレイテンシとエラー率で選ぶ。
+最初のトークンが hedge_after 以内に来なければ次の候補も並行して開始し、先にトークンを返した方を使う。
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from kiosk_logging import get_logger
+
+log = get_logger('llm')
+
+
+class LLMBackend:
+    """ルーティング対象のバックエンド（プロバイダー + モデル）"""
+
+    def __init__(self, provider: str, model: str,
+                 stream: Callable[[], Iterator[str]],
+                 is_available: Callable[[], bool] = lambda: True):
+        """
+        Args:
+            provider: 'ollama' / 'claude'
+            model: モデル名（統計はプロバイダーとモデルの組ごとに取る）
+            stream: 生成テキストを少しずつ返すイテレータを作る関数
+            is_available: 接続確認
+        """
+        self.provider = provider
+        self.model = model
+        self.stream = stream
+        self.is_available = is_available
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+class BackendStats:
+    """直近の呼び出しの最初のトークンまでの時間と成否
+
+    ヘッジで負けた・制限時間で打ち切った呼び出しは ok=None として記録する。
+    最初のトークンまでの時間には使うが、成否（エラー率）には数えない。
+    """
+
+    def __init__(self, window: int = 20):
+        self.samples = deque(maxlen=window)  # (最初のトークンまでの秒 or None, 成功 / 失敗 / None=打ち切り)
+        self.last_error_at = None
+        self.last_error = None
+
+    def record(self, first_token: Optional[float], ok: Optional[bool], error: Optional[str] = None):
+        self.samples.append((first_token, ok))
+        if ok is False:
+            self.last_error_at = time.monotonic()
+            self.last_error = error
+
+    def error_rate(self) -> float:
+        outcomes = [ok for _, ok in self.samples if ok is not None]
+        if not outcomes:
+            return 0.0
+        return sum(1 for ok in outcomes if not ok) / len(outcomes)
+
+    def latency(self, percentile: float = 90) -> Optional[float]:
+        """最初のトークンまでの時間のパーセンタイル（計測がなければ None）"""
+        values = sorted(first for first, _ in self.samples if first is not None)
+        if not values:
+            return None
+        index = min(len(values) - 1, int(len(values) * percentile / 100))
+        return values[index]
+
+    def snapshot(self) -> Dict:
+        latency = self.latency()
+        return {
+            'calls': len(self.samples),
+            'cancelled': sum(1 for _, ok in self.samples if ok is None),
+            'error_rate': round(self.error_rate(), 3),
+            'latency_p90_ms': round(latency * 1000) if latency is not None else None,
+            'last_error': self.last_error
+        }
+
+
+class _Attempt:
+    """1つのバックエンドでの生成の状態"""
+
+    def __init__(self, backend: LLMBackend):
+        self.backend = backend
+        self.started = time.monotonic()
+        self.first_token = None
+        self.chunks: List[str] = []
+        self.done = False
+        self.error = None
+        self.cancelled = False
+
+
+class LLMRouter:
+    """バックエンドごとのレイテンシ・エラー率を記録し、SLOを満たす最速の候補から生成する"""
+
+    def __init__(self, slo_ms: float = 4000, hedge_after_ms: float = 2500,
+                 max_error_rate: float = 0.5, window: int = 20,
+                 cooldown: float = 60, timeout: float = 120):
+        """
+        Args:
+            slo_ms: 最初のトークンまでの目標時間（直近のp90がこれを超える候補は後回し）
+            hedge_after_ms: 最初のトークンがこの時間内に来なければ次の候補も開始（0で無効）
+            max_error_rate: これを超えた候補は cooldown 秒間使わない
+            window: 統計に使う直近の呼び出し数
+            cooldown: エラーの多い候補を再び試すまでの秒数
+            timeout: 生成全体の制限時間（秒）
+        """
+        self.slo = slo_ms / 1000
+        self.hedge_after = hedge_after_ms / 1000 if hedge_after_ms else None
+        self.max_error_rate = max_error_rate
+        self.window = window
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.stats: Dict[str, BackendStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, backend: LLMBackend) -> BackendStats:
+        with self._lock:
+            if backend.key not in self.stats:
+                self.stats[backend.key] = BackendStats(self.window)
+            return self.stats[backend.key]
+
+    def is_healthy(self, backend: LLMBackend) -> bool:
+        """エラー率が上限以下か、最後のエラーから cooldown 秒経っている"""
+        stats = self._stats(backend)
+        if stats.error_rate() <= self.max_error_rate:
+            return True
+        return time.monotonic() - stats.last_error_at >= self.cooldown
+
+    def rank(self, backends: List[LLMBackend], preferred: Optional[str] = None) -> List[LLMBackend]:
+        """候補を試す順に並べる
+
+        1. 正常でSLO内（指定されたプロバイダーを優先し、あとは速い順。未計測は速いものとみなす）
+        2. 正常だがSLO超過（速い順）
+        3. エラーの多い候補（最後の手段）
+        接続できない候補は除く。
+        """
+        within, over, unhealthy = [], [], []
+        for backend in backends:
+            try:
+                if not backend.is_available():
+                    continue
+            except Exception:
+                continue
+            latency = self._stats(backend).latency()
+            if not self.is_healthy(backend):
+                unhealthy.append((latency or 0, backend))
+            elif latency is None or latency <= self.slo:
+                within.append((latency or 0, backend))
+            else:
+                over.append((latency, backend))
+
+        def order(group):
+            group.sort(key=lambda item: (item[1].provider != preferred, item[0]))
+            return [backend for _, backend in group]
+
+        return order(within) + [backend for _, backend in sorted(over, key=lambda item: item[0])] + order(unhealthy)
+
+    def generate(self, backends: List[LLMBackend], preferred: Optional[str] = None) -> Tuple[str, LLMBackend]:
+        """生成したテキストと使ったバックエンドを返す"""
+        pending = self.rank(backends, preferred)
+        if not pending:
+            raise RuntimeError("利用できるLLMがありません")
+
+        cond = threading.Condition()
+        attempts: List[_Attempt] = []
+        state = {'winner': None}
+        deadline = time.monotonic() + self.timeout
+
+        def run(attempt: _Attempt):
+            stats = self._stats(attempt.backend)
+            stream = None
+            try:
+                stream = attempt.backend.stream()
+                for chunk in stream:
+                    if not chunk:
+                        continue
+                    with cond:
+                        if attempt.first_token is None:
+                            attempt.first_token = time.monotonic() - attempt.started
+                            if state['winner'] is None:
+                                state['winner'] = attempt
+                                cond.notify_all()
+                        if attempt.cancelled or state['winner'] is not attempt:
+                            # 先にトークンを返した候補がある・制限時間切れ
+                            attempt.cancelled = True
+                            break
+                        attempt.chunks.append(chunk)
+                # 打ち切った候補は最後まで生成していないので成功には数えない
+                stats.record(attempt.first_token, None if attempt.cancelled else True)
+            except Exception as e:
+                attempt.error = e
+                stats.record(attempt.first_token, False, str(e))
+                log.event('backend_error', logging.WARNING, backend=attempt.backend.key, error=str(e),
+                          first_token_ms=round(attempt.first_token * 1000) if attempt.first_token else None)
+            finally:
+                if stream is not None and hasattr(stream, 'close'):
+                    stream.close()
+                with cond:
+                    attempt.done = True
+                    if attempt.error and state['winner'] is attempt:
+                        state['winner'] = None
+                    cond.notify_all()
+
+        def start_next():
+            attempt = _Attempt(pending.pop(0))
+            attempts.append(attempt)
+            threading.Thread(target=run, args=(attempt,), daemon=True).start()
+
+        with cond:
+            start_next()
+            while True:
+                winner = state['winner']
+                if winner and winner.done:
+                    if len(attempts) > 1:
+                        log.event('hedge', attempts=[a.backend.key for a in attempts], winner=winner.backend.key,
+                                  first_token_ms=round(winner.first_token * 1000))
+                    return ''.join(winner.chunks), winner.backend
+
+                now = time.monotonic()
+                if now >= deadline:
+                    for attempt in attempts:
+                        attempt.cancelled = True
+                    raise TimeoutError(f"LLMの生成が{self.timeout}秒以内に終わりませんでした")
+
+                running = [a for a in attempts if not a.done]
+                if winner is None and pending:
+                    if not running:
+                        # すべて失敗したので次の候補へ
+                        start_next()
+                        continue
+                    if self.hedge_after is not None:
+                        hedge_at = max(a.started for a in running) + self.hedge_after
+                        if now >= hedge_at:
+                            start_next()
+                            continue
+                        cond.wait(min(hedge_at, deadline) - now)
+                        continue
+                elif winner is None and not running:
+                    errors = [f"{a.backend.key}: {a.error}" for a in attempts if a.error]
+                    raise RuntimeError(f"すべてのLLMで生成に失敗しました（{'; '.join(errors)}）")
+                cond.wait(deadline - now)
+
+    def snapshot(self) -> Dict:
+        """バックエンドごとの統計"""
+        with self._lock:
+            items = list(self.stats.items())
+        return {key: stats.snapshot() for key, stats in items}
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Mandan Store
+生成した漫談を SQLite に保存し、同じ・近いトピックの漫談を LLM を呼ばずに返す。
+トピックは正規化してハッシュで引き、見つからなければ文字 n-gram の類似度で近いトピックを探す。
+"""
+
+import hashlib
+import json
+import math
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+def normalize_topic(topic: str) -> str:
+    """全角・半角や大文字小文字をそろえ、空白と記号を除く"""
+    text = unicodedata.normalize('NFKC', topic).lower()
+    return ''.join(ch for ch in text if not unicodedata.category(ch).startswith(('Z', 'P', 'S', 'C')))
+
+
+def topic_key(topic: str) -> str:
+    """正規化したトピックのハッシュ"""
+    return hashlib.sha1(normalize_topic(topic).encode('utf-8')).hexdigest()
+
+
+def ngram_vector(text: str, sizes: Tuple[int, ...] = (2, 3)) -> Counter:
+    """文字 n-gram の出現回数ベクトル
+
+    1文字の n-gram は「の」や地名の文字だけで似てしまうため使わない
+    （「東京の天気」と「東京の渋滞」を別のトピックとして扱う）。
+    """
+    vector = Counter()
+    for n in sizes:
+        for i in range(len(text) - n + 1):
+            vector[text[i:i + n]] += 1
+    return vector
+
+
+def cosine(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    return dot / (math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values())))
+
+
+class MandanStore:
+    """生成済み漫談の永続ストア"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS mandan (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            topic_key TEXT NOT NULL,
+            normalized TEXT NOT NULL,
+            sentence TEXT NOT NULL,
+            params TEXT NOT NULL,
+            provider TEXT,
+            created_at REAL NOT NULL,
+            served_count INTEGER NOT NULL DEFAULT 0,
+            last_served_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_mandan_topic_key ON mandan (topic_key);
+    """
+
+    def __init__(self, db_path: str, similarity_threshold: float = 0.7,
+                 max_entries: int = 5000, use_similarity: bool = True):
+        """
+        Args:
+            db_path: SQLite ファイル
+            similarity_threshold: 近いトピックとみなす n-gram ベクトルのコサイン類似度
+            max_entries: 保存する件数の上限（超えたら古いものから削除）
+            use_similarity: False なら正規化したトピックの完全一致のみ
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.use_similarity = use_similarity
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(self.SCHEMA)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+
+        # 類似度検索用: topic_key → (正規化したトピック, n-gram ベクトル)
+        self._topics: Dict[str, Tuple[str, Counter]] = {}
+        for row in self._conn.execute("SELECT DISTINCT topic_key, normalized FROM mandan"):
+            self._topics[row['topic_key']] = (row['normalized'], ngram_vector(row['normalized']))
+        print(f"[INFO] Mandan store: {self.count()} entries, {len(self._topics)} topics ({self.db_path})")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM mandan").fetchone()[0]
+
+    def add(self, topic: str, sentence: str, params: Dict, provider: Optional[str] = None):
+        """生成した漫談を保存"""
+        normalized = normalize_topic(topic)
+        key = topic_key(topic)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO mandan (topic, topic_key, normalized, sentence, params, provider, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (topic, key, normalized, sentence, json.dumps(params, ensure_ascii=False), provider, time.time())
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM mandan").fetchone()[0] - self.max_entries
+            removed_keys = set()
+            if overflow > 0:
+                oldest = self._conn.execute(
+                    "SELECT id, topic_key FROM mandan ORDER BY created_at, id LIMIT ?", (overflow,)
+                ).fetchall()
+                self._conn.executemany("DELETE FROM mandan WHERE id = ?", [(row['id'],) for row in oldest])
+                removed_keys = {row['topic_key'] for row in oldest}
+            # 漫談が1つも残っていないトピックは類似度検索の対象から外す
+            if removed_keys:
+                placeholders = ','.join('?' * len(removed_keys))
+                remaining = {row['topic_key'] for row in self._conn.execute(
+                    f"SELECT DISTINCT topic_key FROM mandan WHERE topic_key IN ({placeholders})",
+                    tuple(removed_keys)
+                )}
+                for removed_key in removed_keys - remaining:
+                    self._topics.pop(removed_key, None)
+            self._conn.commit()
+            self._topics.setdefault(key, (normalized, ngram_vector(normalized)))
+
+    def similar_topics(self, topic: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """正規化したトピックが一致するか、類似度が閾値以上のトピック（似ている順）"""
+        key = topic_key(topic)
+        matches = [(key, 1.0)] if key in self._topics else []
+        if not self.use_similarity:
+            return matches
+
+        vector = ngram_vector(normalize_topic(topic))
+        with self._lock:
+            topics = list(self._topics.items())
+        scored = [
+            (other_key, score) for other_key, (_, other_vector) in topics
+            if other_key != key and (score := cosine(vector, other_vector)) >= self.similarity_threshold
+        ]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return (matches + scored)[:limit]
+
+    def lookup(self, topic: str, max_age: Optional[float] = None,
+               repeat_interval: float = 0) -> Optional[Dict]:
+        """同じ・近いトピックの漫談を1つ選んで返す（返したものは提供済みとして記録）
+
+        Args:
+            max_age: これより古い漫談は使わない（秒。None なら無制限）
+            repeat_interval: この秒数以内に返した漫談は使わない（同じ漫談の繰り返しを避ける）
+
+        同じ近さなら、提供回数が少なく、最後に提供してから長いものを選ぶ。
+        """
+        now = time.time()
+        for key, score in self.similar_topics(topic):
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT * FROM mandan WHERE topic_key = ? "
+                    "AND (? IS NULL OR created_at >= ?) "
+                    "AND (last_served_at IS NULL OR last_served_at <= ?) "
+                    "ORDER BY served_count, COALESCE(last_served_at, 0) LIMIT 5",
+                    (key, max_age, now - (max_age or 0), now - repeat_interval)
+                ).fetchall()
+                if not rows:
+                    continue
+                # 提供回数が同じものの中からはランダムに選ぶ
+                fewest = [row for row in rows if row['served_count'] == rows[0]['served_count']]
+                row = random.choice(fewest)
+                self._conn.execute(
+                    "UPDATE mandan SET served_count = served_count + 1, last_served_at = ? WHERE id = ?",
+                    (now, row['id'])
+                )
+                self._conn.commit()
+            return {
+                'topic': row['topic'],
+                'sentence': row['sentence'],
+                'zundamonParams': json.loads(row['params']),
+                'provider': row['provider'],
+                'generatedAt': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(row['created_at'])),
+                'similarity': round(score, 3)
+            }
+        return None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
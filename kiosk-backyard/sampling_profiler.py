@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Sampling Profiler
+一定間隔で全スレッドのスタックを取り、flamegraph 用の collapsed stack 形式で集計する。
+デバッガを付けられない車載環境で、動いているサーバーのどこで時間を使っているかを調べるためのもの。
+"""
+
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Dict, List, Optional
+
+
+def _real_modules():
+    """OSスレッドと本物の sleep（eventlet のモンキーパッチ下ではグリーンスレッドだとハブが止まっている間に標本を取れない）"""
+    if 'eventlet' in sys.modules:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread'):
+            return patcher.original('threading'), patcher.original('time')
+    return threading, time
+
+
+def frame_label(frame) -> str:
+    """flamegraph の1フレーム（関数名 + ファイル名:定義行）"""
+    code = frame.f_code
+    filename = code.co_filename.rsplit('/', 1)[-1]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> List[str]:
+    """外側（呼び出し元）から順のフレーム名"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def thread_names() -> Dict[int, str]:
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    real_threading, _ = _real_modules()
+    if real_threading is not threading:
+        names.update({thread.ident: thread.name for thread in real_threading.enumerate()})
+    return names
+
+
+class SamplingProfiler:
+    """sys._current_frames() を定期的に取る低負荷のプロファイラ（同時に1つだけ実行）"""
+
+    def __init__(self, hz: float = 100, max_seconds: float = 60):
+        """
+        Args:
+            hz: 1秒あたりの標本数
+            max_seconds: 1回のプロファイルの最大秒数
+        """
+        self.hz = hz
+        self.max_seconds = max_seconds
+        self._busy = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._busy.locked()
+
+    def profile(self, seconds: float, hz: Optional[float] = None) -> Dict:
+        """seconds 秒間標本を取り、collapsed stack（"スレッド;外側;...;内側 回数" の行）と統計を返す
+
+        別のプロファイルが実行中なら RuntimeError。
+        """
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("別のプロファイルを実行中です")
+        try:
+            seconds = max(0.1, min(float(seconds), self.max_seconds))
+            interval = 1.0 / max(1.0, min(float(hz or self.hz), 1000.0))
+            real_threading, real_time = _real_modules()
+            result = {}
+            # 標本を取るスレッド自身は数えない
+            sampler = real_threading.Thread(target=self._sample,
+                                            args=(seconds, interval, real_threading, real_time, result),
+                                            name='sampling-profiler', daemon=True)
+            sampler.start()
+            # 本番モードでは time.sleep が協調的なので、待っている間もハブは止まらない
+            time.sleep(seconds)
+            sampler.join()
+            return result
+        finally:
+            self._busy.release()
+
+    def _sample(self, seconds, interval, real_threading, real_time, result):
+        stacks = Counter()
+        samples = 0
+        own_ident = real_threading.get_ident()
+        names = thread_names()
+        started = real_time.monotonic()
+        deadline = started + seconds
+        overhead = 0.0
+        while True:
+            now = real_time.monotonic()
+            if now >= deadline:
+                break
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                name = names.get(ident)
+                if name is None:
+                    names = thread_names()
+                    name = names.get(ident, f"thread-{ident}")
+                stacks[';'.join([name.replace(';', '_')] + collapse_stack(frame))] += 1
+            samples += 1
+            overhead += real_time.monotonic() - now
+            real_time.sleep(max(0.0, interval - (real_time.monotonic() - now)))
+
+        elapsed = real_time.monotonic() - started
+        result.update({
+            'collapsed': '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common()) + '\n',
+            'samples': samples,
+            'seconds': round(elapsed, 3),
+            'hz': round(samples / elapsed, 1) if elapsed else 0,
+            'overhead_ratio': round(overhead / elapsed, 4) if elapsed else 0
+        })
+
+
+def dump_threads() -> Dict[str, List[Dict]]:
+    """全スレッド（eventlet ならグリーンスレッドも）の現在のスタック"""
+    names = thread_names()
+    daemons = {thread.ident: thread.daemon for thread in threading.enumerate()}
+    threads = [
+        {
+            'ident': ident,
+            'name': names.get(ident, f"thread-{ident}"),
+            'daemon': daemons.get(ident),
+            'stack': [line.rstrip('\n') for line in traceback.format_stack(frame)]
+        }
+        for ident, frame in sys._current_frames().items()
+    ]
+
+    greenlets = []
+    if 'greenlet' in sys.modules:
+        import gc
+        from greenlet import greenlet
+        for obj in gc.get_objects():
+            if isinstance(obj, greenlet) and obj.gr_frame is not None:
+                greenlets.append({
+                    'name': getattr(obj, 'name', None) or type(obj).__name__,
+                    'stack': [line.rstrip('\n') for line in traceback.format_stack(obj.gr_frame)]
+                })
+    return {'threads': threads, 'greenlets': greenlets}
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Sensor Push Throttle
+センサーデータをSocket.IOでプッシュする際の変化しきい値・レート制限判定
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+def position_changed(threshold: float) -> Callable[[Dict, Dict], bool]:
+    """緯度・経度のどちらかがしきい値（度）以上動いたかを判定する関数を返す"""
+    def is_changed(previous: Dict, current: Dict) -> bool:
+        return (abs(current['latitude'] - previous['latitude']) >= threshold or
+                abs(current['longitude'] - previous['longitude']) >= threshold)
+    return is_changed
+
+
+def payload_changed(previous: Any, current: Any) -> bool:
+    """内容が変わったかを判定"""
+    return previous != current
+
+
+class ChangeThrottle:
+    """変化しきい値とレート制限付きのプッシュ判定
+
+    最後に送信したデータと比較し、変化がない場合や
+    前回送信から min_interval 秒経っていない場合は送信しない。
+    """
+
+    def __init__(self, min_interval: float, is_changed: Callable[[Any, Any], bool] = payload_changed):
+        self.min_interval = min_interval
+        self.is_changed = is_changed
+        self._last_sent = None
+        self._last_sent_at = 0.0
+        self._lock = threading.Lock()
+
+    def offer(self, payload: Any, now: Optional[float] = None) -> bool:
+        """送信すべきならTrueを返し、送信済みとして記録する"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._last_sent is not None:
+                if not self.is_changed(self._last_sent, payload):
+                    return False
+                if now - self._last_sent_at < self.min_interval:
+                    return False
+
+            self._last_sent = payload
+            self._last_sent_at = now
+            return True
+
+    @property
+    def last_sent(self) -> Any:
+        """最後に送信したデータ"""
+        return self._last_sent
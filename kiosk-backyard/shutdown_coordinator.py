@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Shutdown Coordinator
+シャットダウン時にメモリ上のキャッシュ・状態を制限時間内に並列でディスクへ書き出し、
+次回起動時に復元する
+"""
+
+import itertools
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class ShutdownCoordinator:
+    """状態の保存・復元をまとめて管理
+
+    シャットダウン（flush、プロセス終了時に1回だけ）は次の順序で行う:
+      1. 停止フック（新しい処理の受付を止める）を登録順に実行
+      2. 登録された状態を budget 秒以内に並列で保存
+    save_state は 2 だけを行い、何度でも呼べる（電源断の前の保存など、その後も動き続ける場合）。
+    各状態は保存ごとに別の一時ディレクトリ（state_dir/<name>.XXXX.tmp）に書き出し、制限時間内に完了したものだけを
+    state_dir/<name> に置き換える。置き換えは前回の状態を <name>.old に移してから新しい状態を移すので、
+    途中で電源が落ちても前回の状態は残る（復元時は <name> がなければ <name>.old を使う）。
+    制限時間を過ぎてから終わった保存や、後から始まった保存に先を越された保存の結果は捨てる。
+    """
+
+    def __init__(self, state_dir: str, budget: float = 3.0):
+        self.state_dir = Path(state_dir)
+        self.budget = budget
+        self._handlers: Dict[str, Tuple[Callable[[Path], None], Optional[Callable[[Path], None]]]] = {}
+        self._stop_hooks: List[Tuple[str, Callable[[], None]]] = []
+        self._lock = threading.Lock()
+        self._report = None
+        self._swap_lock = threading.Lock()
+        self._save_counter = itertools.count(1)
+        self._committed: Dict[str, int] = {}  # 状態名 → 置き換えた保存の通し番号
+
+    def register(self, name: str, save: Callable[[Path], None], restore: Optional[Callable[[Path], None]] = None):
+        """状態を登録（save/restore は状態用のディレクトリを受け取る）"""
+        self._handlers[name] = (save, restore)
+
+    def add_stop_hook(self, name: str, hook: Callable[[], None]):
+        """保存前に実行する停止処理を登録"""
+        self._stop_hooks.append((name, hook))
+
+    def restore_all(self) -> Dict[str, str]:
+        """保存済みの状態を復元"""
+        # 前回の書きかけの一時ディレクトリは使わない
+        for tmp_path in self.state_dir.glob('*.tmp'):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        results = {}
+        for name, (_, restore) in self._handlers.items():
+            path = self.state_dir / name
+            if not path.is_dir():
+                # 置き換えの途中で止まった場合は前回の状態
+                path = self.state_dir / f"{name}.old"
+            if restore is None or not path.is_dir():
+                continue
+            try:
+                restore(path)
+                results[name] = 'ok'
+            except Exception as e:
+                results[name] = f'error: {e}'
+                print(f"[状態復元] {name} の復元に失敗: {e}")
+        if results:
+            print(f"[状態復元] {results}")
+        return results
+
+    def flush(self, reason: str = 'shutdown') -> Dict:
+        """停止フックを実行し、状態を並列で保存（終了時用。2回目以降は前回の結果を返す）"""
+        with self._lock:
+            if self._report is not None:
+                return self._report
+
+            started = time.monotonic()
+            print(f"[シャットダウン] 開始: {reason}（制限時間 {self.budget}秒）")
+
+            for name, hook in self._stop_hooks:
+                try:
+                    hook()
+                except Exception as e:
+                    print(f"[シャットダウン] 停止処理エラー ({name}): {e}")
+
+            self._report = self._save_all(reason, started)
+            print(f"[シャットダウン] 完了: {self._report}")
+            return self._report
+
+    def save_state(self, reason: str = 'save') -> Dict:
+        """停止フックを実行せずに状態だけを保存（サービスは動き続ける）"""
+        with self._lock:
+            report = self._save_all(reason, time.monotonic())
+            print(f"[状態保存] 完了: {report}")
+            return report
+
+    def _save_all(self, reason: str, started: float) -> Dict:
+        """登録された状態を budget 秒以内に並列で保存"""
+        deadline = started + self.budget
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        results = {name: 'timeout' for name in self._handlers}
+        sequence = next(self._save_counter)
+        executor = ThreadPoolExecutor(max_workers=max(1, len(self._handlers)), thread_name_prefix="flush")
+        futures = {
+            executor.submit(self._save, name, save, deadline, sequence): name
+            for name, (save, _) in self._handlers.items()
+        }
+        done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        for future in done:
+            name = futures[future]
+            error = future.exception()
+            results[name] = f'error: {error}' if error else future.result()
+        # 間に合わなかった保存は待たない（書きかけは昇格されない）
+        executor.shutdown(wait=False)
+
+        return {
+            'reason': reason,
+            'results': results,
+            'elapsed': round(time.monotonic() - started, 3)
+        }
+
+    def _save(self, name: str, save: Callable[[Path], None], deadline: float, sequence: int) -> str:
+        """この保存だけの一時ディレクトリに保存し、制限時間内なら置き換える"""
+        tmp_path = Path(tempfile.mkdtemp(prefix=f"{name}.", suffix=".tmp", dir=self.state_dir))
+        try:
+            save(tmp_path)
+            with self._swap_lock:
+                if time.monotonic() > deadline:
+                    return 'timeout'
+                if self._committed.get(name, 0) > sequence:
+                    return 'superseded'
+                self._swap(name, tmp_path)
+                self._committed[name] = sequence
+            return 'ok'
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def _swap(self, name: str, tmp_path: Path):
+        """前回の状態を <name>.old に移してから、新しい状態を <name> に移す"""
+        final_path = self.state_dir / name
+        old_path = self.state_dir / f"{name}.old"
+        if final_path.exists():
+            shutil.rmtree(old_path, ignore_errors=True)
+            final_path.rename(old_path)
+        tmp_path.rename(final_path)
+        shutil.rmtree(old_path, ignore_errors=True)
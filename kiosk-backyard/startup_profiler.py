@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Startup Profiler
+起動処理を区間ごとに計測し、最初のリクエストに応答するまでの内訳を表示する
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+
+class StartupProfiler:
+    """起動時の各処理の開始・終了時刻を記録"""
+
+    def __init__(self):
+        self.origin = time.time()
+        self.phases: List[Tuple[str, float, float, str]] = []  # (名前, 開始, 終了, スレッド名)
+        self.marks: Dict[str, float] = {}
+        self._open: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def start(self, name: str):
+        """区間の計測を開始"""
+        self._open[name] = time.time()
+
+    def stop(self, name: str):
+        """区間の計測を終了"""
+        started = self._open.pop(name, None)
+        if started is not None:
+            with self._lock:
+                self.phases.append((name, started, time.time(), threading.current_thread().name))
+
+    @contextmanager
+    def phase(self, name: str):
+        """with文で区間を計測"""
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def mark(self, name: str):
+        """時点を記録（最初の1回のみ）"""
+        with self._lock:
+            self.marks.setdefault(name, time.time())
+
+    def _process_start(self) -> Optional[float]:
+        """プロセスの起動時刻（インタプリタの起動時間を含めるため）"""
+        try:
+            import psutil
+            return psutil.Process().create_time()
+        except Exception:
+            return None
+
+    def report(self) -> str:
+        """起動プロファイルのレポートを作成"""
+        process_start = self._process_start() or self.origin
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p[1])
+            marks = sorted(self.marks.items(), key=lambda m: m[1])
+
+        lines = ["=" * 60, "起動プロファイル（プロセス起動からの経過秒）", "=" * 60]
+        lines.append(f"{'インタプリタ起動':<28} {0.0:>7.3f} → {self.origin - process_start:>7.3f}")
+        for name, started, ended, thread_name in phases:
+            where = '' if thread_name == 'MainThread' else f"  [{thread_name}]"
+            lines.append(f"{name:<28} {started - process_start:>7.3f} → {ended - process_start:>7.3f}"
+                         f"  ({ended - started:.3f}s){where}")
+        lines.append("-" * 60)
+        for name, at in marks:
+            lines.append(f"{name:<28} {at - process_start:>7.3f}")
+        if 'first_response' in self.marks:
+            lines.append(f"最初のリクエストまで: {self.marks['first_response'] - process_start:.3f}s")
+        lines.append("=" * 60)
+        return "\n".join(lines)
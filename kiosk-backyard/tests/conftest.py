@@ -0,0 +1,6 @@
+"""kiosk-backyard のテスト共通設定（モジュールを kiosk-backyard 直下から import する）"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,179 @@
+"""blend_kernels と ZundamonCompositor の合成結果のテスト
+
+- 浮動小数点で計算した W3C の式と比べる（乗算済みの色で 1.5 LSB 以内）
+- 小さな PSD を作り、psd-tools の psd.composite() と比べる（各チャンネル 2 LSB 以内）
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from blend_kernels import KERNELS, blend
+
+MODES = ['normal', 'multiply', 'screen', 'overlay']
+OPACITIES = [255, 192, 128, 64, 0]
+
+# psd.composite() との差の許容値（8bit の各チャンネル。丸め方の違いの分）
+PSD_TOLERANCE = 2
+# 浮動小数点の式との差の許容値（乗算済みの色。アルファを 8bit / 16bit に丸める分）
+REFERENCE_TOLERANCE = 1.5
+
+
+def reference_blend(dst: np.ndarray, src: np.ndarray, mode: str, opacity: int) -> np.ndarray:
+    """W3C Compositing and Blending Level 1 をそのまま浮動小数点で計算した結果（乗算済みの RGBA、0..1）"""
+    maximum = float(np.iinfo(dst.dtype).max)
+    cb = dst[:, :, :3] / maximum
+    ab = dst[:, :, 3:4] / maximum
+    cs = src[:, :, :3] / maximum
+    as_ = src[:, :, 3:4] / maximum * (opacity / 255)
+    if mode == 'normal':
+        mixed_mode = cs
+    elif mode == 'multiply':
+        mixed_mode = cb * cs
+    elif mode == 'screen':
+        mixed_mode = cb + cs - cb * cs
+    else:
+        mixed_mode = np.where(cb <= 0.5, 2 * cb * cs, 1 - 2 * (1 - cb) * (1 - cs))
+    mixed = (1 - ab) * cs + ab * mixed_mode
+    color = as_ * mixed + (1 - as_) * ab * cb
+    alpha = as_ + (1 - as_) * ab
+    return np.concatenate([color, alpha], axis=2)
+
+
+def premultiplied(image: np.ndarray) -> np.ndarray:
+    maximum = float(np.iinfo(image.dtype).max)
+    alpha = image[:, :, 3:4] / maximum
+    return np.concatenate([image[:, :, :3] / maximum * alpha, alpha], axis=2)
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16])
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('opacity', OPACITIES)
+def test_blend_matches_float_reference(dtype, mode, opacity):
+    rng = np.random.default_rng(0)
+    maximum = np.iinfo(dtype).max
+    dst = rng.integers(0, maximum, size=(32, 32, 4), endpoint=True).astype(dtype)
+    src = rng.integers(0, maximum, size=(32, 32, 4), endpoint=True).astype(dtype)
+    # 完全に透明・不透明な画素も含める
+    dst[:4, :, 3] = 0
+    dst[4:8, :, 3] = maximum
+    src[:, :4, 3] = 0
+    src[:, 4:8, 3] = maximum
+
+    expected = reference_blend(dst, src, mode, opacity)
+    result = blend(dst.copy(), src, mode, opacity)
+
+    error = np.abs(premultiplied(result) - expected) * maximum
+    assert error.max() <= REFERENCE_TOLERANCE
+
+
+def test_blend_accepts_metadata_mode_names():
+    dst = np.full((2, 2, 4), 200, dtype=np.uint8)
+    src = np.full((2, 2, 4), 100, dtype=np.uint8)
+    expected = blend(dst.copy(), src, 'multiply', 255)
+    assert np.array_equal(blend(dst.copy(), src, 'BlendMode.MULTIPLY', 255), expected)
+    # 対応していないモードは通常として重ねる
+    assert np.array_equal(blend(dst.copy(), src, 'BlendMode.DISSOLVE', 255), blend(dst.copy(), src))
+
+
+def test_blend_rejects_mismatched_arrays():
+    with pytest.raises(ValueError):
+        blend(np.zeros((2, 2, 4), dtype=np.uint8), np.zeros((2, 2, 4), dtype=np.uint16))
+    assert set(KERNELS) == set(MODES)
+
+
+# ---- psd-tools との比較 ----
+
+WIDTH, HEIGHT = 48, 40
+
+
+def gradient_image(seed: int, width: int, height: int, translucent: bool):
+    """色が位置で変わる RGBA 画像（translucent なら半透明の画素を含む）"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    rgb = np.stack([xx * 255 // max(width - 1, 1),
+                    yy * 255 // max(height - 1, 1),
+                    rng.integers(0, 255, size=(height, width), endpoint=True)], axis=2)
+    alpha = np.full((height, width), 255)
+    if translucent:
+        alpha = (xx + yy) * 255 // (width + height - 2)
+        alpha[: height // 4] = 255
+    return Image.fromarray(np.dstack([rgb, alpha]).astype(np.uint8), 'RGBA')
+
+
+def build_psd(layers):
+    """layers: (名前, 描画モード名, 不透明度, 位置 (left, top), 大きさ (w, h), 半透明か) のリスト（下から順）"""
+    psd_tools = pytest.importorskip('psd_tools')
+    from psd_tools.api.layers import PixelLayer
+    from psd_tools.constants import BlendMode
+
+    psd = psd_tools.PSDImage.new('RGBA', (WIDTH, HEIGHT))
+    base = PixelLayer.frompil(gradient_image(0, WIDTH, HEIGHT, False), psd, '!base', 0, 0)
+    psd.append(base)
+    for index, (name, mode, opacity, (left, top), (width, height), translucent) in enumerate(layers, start=1):
+        layer = PixelLayer.frompil(gradient_image(index, width, height, translucent), psd, name, top, left)
+        layer.blend_mode = getattr(BlendMode, mode.upper())
+        layer.opacity = opacity
+        psd.append(layer)
+    return psd
+
+
+def psd_composite(psd) -> np.ndarray:
+    return np.asarray(psd.composite(force=True).convert('RGBA'))
+
+
+LAYER_SETS = [
+    [('!normal', 'normal', 255, (4, 4), (24, 20), True),
+     ('!multiply', 'multiply', 128, (10, 8), (30, 24), False),
+     ('!screen', 'screen', 192, (0, 16), (40, 20), True),
+     ('!overlay', 'overlay', 64, (20, 2), (28, 36), False)],
+    [('!overlay', 'overlay', 255, (0, 0), (48, 40), True),
+     ('!multiply', 'multiply', 255, (8, 8), (16, 16), True),
+     ('!screen', 'screen', 128, (16, 4), (24, 30), False),
+     ('!normal', 'normal', 64, (2, 20), (44, 16), False)],
+]
+
+
+@pytest.mark.parametrize('layers', LAYER_SETS)
+def test_blend_matches_psd_composite(layers):
+    psd = build_psd(layers)
+
+    canvas = np.zeros((HEIGHT, WIDTH, 4), dtype=np.uint8)
+    for layer in psd:
+        left, top, right, bottom = layer.bbox
+        source = np.asarray(layer.topil().convert('RGBA'))
+        blend(canvas[top:bottom, left:right], source, str(layer.blend_mode), layer.opacity)
+
+    error = np.abs(canvas.astype(int) - psd_composite(psd).astype(int))
+    assert error.max() <= PSD_TOLERANCE
+
+
+@pytest.mark.parametrize('layers', LAYER_SETS)
+def test_compose_image_matches_psd_composite(layers, tmp_path):
+    psd = build_psd(layers)
+    psd_path = tmp_path / 'synthetic.psd'
+    psd.save(str(psd_path))
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'kiosk-factory'))
+    from layer_extractor import ZundamonLayerExtractor
+    from PIL import Image
+    from zundamon_compositor import ZundamonCompositor
+
+    layers_dir = tmp_path / 'layers'
+    result = ZundamonLayerExtractor(str(psd_path), str(layers_dir)).extract_all_layers()
+    assert result['success'] and result['failed'] == 0
+    metadata = json.loads((layers_dir / 'layer_metadata.json').read_text(encoding='utf-8'))
+    assert all('opacity_applied' in layer_info for layer_info in metadata['layers'].values())
+
+    compositor = ZundamonCompositor(str(layers_dir), max_rendered=0)
+    image = np.asarray(Image.open(compositor.compose_image({})).convert('RGBA'))
+
+    expected = psd_composite(psd)
+    assert image.shape == expected.shape
+    error = np.abs(image.astype(int) - expected.astype(int))
+    assert error.max() <= PSD_TOLERANCE
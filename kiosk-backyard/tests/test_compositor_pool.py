@@ -0,0 +1,76 @@
+"""CompositorPool のテスト（合成ワーカーの結果がこのプロセスでの合成と同じになる）"""
+
+import sys
+import types
+
+import pytest
+
+from benchmarks.synthetic_layers import generate_layer_set
+from compositor_pool import CompositorPool
+from zundamon_compositor import ZundamonCompositor
+
+BEFORE = {'expression_mouth': 'ほう', 'right_arm': '腰'}
+AFTER = {'expression_mouth': 'むふ', 'right_arm': '指差し'}
+
+
+@pytest.fixture(scope='module')
+def layers_dir(tmp_path_factory):
+    return generate_layer_set(tmp_path_factory.mktemp('layers'))
+
+
+@pytest.fixture(scope='module')
+def pool(layers_dir):
+    pool = CompositorPool(ZundamonCompositor(str(layers_dir)), workers=1, timeout=60)
+    pool.warm_up()
+    yield pool
+    pool.shutdown()
+
+
+def test_compose_matches_local(pool, layers_dir):
+    local = ZundamonCompositor(str(layers_dir), max_rendered=0)
+    assert pool.compose(dict(AFTER)) == local.compose_image(dict(AFTER)).getvalue()
+
+
+def test_patch_is_rendered_by_worker(pool, layers_dir, monkeypatch):
+    local = ZundamonCompositor(str(layers_dir), max_rendered=0)
+    expected = local.compose_patch(BEFORE, AFTER)
+    assert expected['rect'] is not None
+
+    # 親プロセスの合成器では範囲を合成しない
+    def fail(*args, **kwargs):
+        raise AssertionError('render_region ran in the server process')
+    monkeypatch.setattr(pool.compositor, 'render_region', fail)
+
+    patch = pool.compose_patch(BEFORE, AFTER)
+    assert patch['rect'] == expected['rect']
+    assert patch['content_key'] == expected['content_key']
+    assert patch['data'] == expected['data']
+
+    # 同じ差分は親プロセスのキャッシュから返す
+    monkeypatch.setattr(pool, 'encode_region', fail)
+    assert pool.compose_patch(BEFORE, AFTER) is patch
+
+
+def test_unchanged_patch_has_no_data(pool):
+    patch = pool.compose_patch(BEFORE, BEFORE)
+    assert patch['rect'] is None and patch['data'] is None
+
+
+def test_worker_does_not_import_server_main(layers_dir, tmp_path, monkeypatch):
+    # app.py の代わりに、読み込まれたら印を残す起動スクリプトを __main__ にする
+    marker = tmp_path / 'imported'
+    script = tmp_path / 'server_main.py'
+    script.write_text(f"open({str(marker)!r}, 'w').close()\n", encoding='utf-8')
+    main_module = types.ModuleType('__main__')
+    main_module.__file__ = str(script)
+    main_module.__spec__ = None
+    monkeypatch.setitem(sys.modules, '__main__', main_module)
+
+    pool = CompositorPool(ZundamonCompositor(str(layers_dir)), workers=1, timeout=60)
+    try:
+        pool.warm_up()
+        assert pool.compose(dict(BEFORE))
+    finally:
+        pool.shutdown()
+    assert sys.modules['__main__'] is main_module
+    assert not marker.exists()
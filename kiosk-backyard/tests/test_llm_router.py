@@ -0,0 +1,130 @@
+"""LLMRouter をスタブサーバー（benchmarks/llm_stub.py）で動かすテスト"""
+
+import json
+import threading
+import time
+from argparse import Namespace
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+from benchmarks import llm_stub
+from llm_router import BackendStats, LLMBackend, LLMRouter
+
+PROMPT = "トピック: テスト"
+
+
+@contextmanager
+def stub_server(ollama_first_token_ms=0, claude_first_token_ms=0, ollama_error_rate=0.0, claude_error_rate=0.0):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), llm_stub.make_handler(Namespace(
+        ollama_first_token_ms=ollama_first_token_ms, claude_first_token_ms=claude_first_token_ms, token_ms=1,
+        ollama_error_rate=ollama_error_rate, claude_error_rate=claude_error_rate
+    )))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def ollama_backend(base_url, model="mistral"):
+    def stream():
+        with requests.post(f"{base_url}/api/generate", json={"model": model, "prompt": PROMPT, "stream": True},
+                           stream=True, timeout=10) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line).get("response", "")
+    return LLMBackend("ollama", model, stream)
+
+
+def claude_backend(base_url, model="claude-stub"):
+    def stream():
+        with requests.post(f"{base_url}/v1/messages",
+                           json={"model": model, "stream": True, "messages": [{"role": "user", "content": PROMPT}]},
+                           stream=True, timeout=10) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.startswith(b"data: "):
+                    data = json.loads(line[len(b"data: "):])
+                    if data["type"] == "content_block_delta":
+                        yield data["delta"]["text"]
+    return LLMBackend("claude", model, stream)
+
+
+def wait_for_samples(stats, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while len(stats.samples) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_hedge_after_timeout_uses_first_responder():
+    with stub_server(ollama_first_token_ms=800, claude_first_token_ms=0) as base_url:
+        router = LLMRouter(hedge_after_ms=100)
+        backends = [ollama_backend(base_url), claude_backend(base_url)]
+        text, backend = router.generate(backends, preferred="ollama")
+
+        assert backend.provider == "claude"
+        assert "Claudeのスタブ" in text
+
+        # 負けた Ollama は最初のトークンが来た時点で打ち切られる。成功にも失敗にも数えない
+        ollama_stats = router.stats["ollama:mistral"]
+        wait_for_samples(ollama_stats, 1)
+    assert list(ollama_stats.samples)[0][1] is None
+    assert ollama_stats.latency() >= 0.7
+    assert ollama_stats.error_rate() == 0.0
+    assert router.snapshot()["ollama:mistral"]["cancelled"] == 1
+    assert list(router.stats["claude:claude-stub"].samples)[0][1] is True
+
+
+def test_failover_on_error():
+    with stub_server(ollama_error_rate=1.0) as base_url:
+        router = LLMRouter(hedge_after_ms=0)
+        text, backend = router.generate([ollama_backend(base_url), claude_backend(base_url)], preferred="ollama")
+
+    assert backend.provider == "claude"
+    assert "Claudeのスタブ" in text
+    ollama = router.snapshot()["ollama:mistral"]
+    assert ollama["error_rate"] == 1.0 and ollama["last_error"]
+
+
+def test_all_backends_failing_raises():
+    with stub_server(ollama_error_rate=1.0, claude_error_rate=1.0) as base_url:
+        router = LLMRouter(hedge_after_ms=0)
+        with pytest.raises(RuntimeError):
+            router.generate([ollama_backend(base_url), claude_backend(base_url)])
+
+
+def test_ranking_by_health_latency_and_preference():
+    with stub_server(ollama_first_token_ms=300, ollama_error_rate=0.0) as base_url:
+        router = LLMRouter(slo_ms=200, hedge_after_ms=0, max_error_rate=0.5)
+        slow, fast = ollama_backend(base_url), claude_backend(base_url)
+
+        # 未計測なら指定されたプロバイダーが先
+        assert router.rank([fast, slow], preferred="ollama") == [slow, fast]
+
+        # 計測すると SLO を超える Ollama は指定されていても後回し
+        router.generate([slow], preferred="ollama")
+        router.generate([fast], preferred="claude")
+        assert router.rank([slow, fast], preferred="ollama") == [fast, slow]
+
+    # エラーの多い候補は最後（接続できない候補は除く）
+    router = LLMRouter(slo_ms=200, cooldown=60)
+    failing = LLMBackend("claude", "failing", lambda: iter(()))
+    offline = LLMBackend("ollama", "offline", lambda: iter(()), is_available=lambda: False)
+    for _ in range(3):
+        router._stats(failing).record(0.01, False, "boom")
+    assert router.rank([failing, slow, offline]) == [slow, failing]
+
+
+def test_cancelled_samples_do_not_count_as_outcomes():
+    stats = BackendStats(window=10)
+    stats.record(0.5, None)
+    stats.record(0.1, False, "boom")
+    stats.record(0.2, True)
+    assert stats.error_rate() == 0.5
+    assert stats.latency(percentile=100) == 0.5
@@ -0,0 +1,58 @@
+"""LLMの漫談レスポンスの読み取り（split_mandan_documents / validate_zundamon_params）のテスト"""
+
+import pytest
+
+app = pytest.importorskip('app')
+
+TOPICS = ['天気', '渋滞']
+
+TWO_DOCUMENTS = """---
+topic: 天気
+sentence: 晴れなのだ
+zundamonImage:
+  expression_mouth: にっこり
+---
+topic: 渋滞
+sentence: 混んでるのだ
+zundamonImage:
+  right_arm: 指差し
+---
+"""
+
+
+def test_split_plain_documents():
+    documents = app.split_mandan_documents(TWO_DOCUMENTS, TOPICS)
+    assert [document['sentence'] for document in documents] == ['晴れなのだ', '混んでるのだ']
+
+
+def test_split_fenced_documents():
+    fenced = f"以下が漫談です。\n```yaml\n{TWO_DOCUMENTS}```\n"
+    documents = app.split_mandan_documents(fenced, TOPICS)
+    assert [document['sentence'] for document in documents] == ['晴れなのだ', '混んでるのだ']
+
+
+def test_split_fence_per_document():
+    fenced = TWO_DOCUMENTS.replace('---\ntopic', '---\n```yaml\ntopic').replace('\n---', '\n```\n---')
+    documents = app.split_mandan_documents(fenced, TOPICS)
+    assert [document['sentence'] for document in documents] == ['晴れなのだ', '混んでるのだ']
+
+
+def test_split_keeps_other_documents_when_one_is_broken():
+    broken = TWO_DOCUMENTS.replace('sentence: 晴れなのだ', 'sentence: [晴れ')
+    documents = app.split_mandan_documents(broken, TOPICS)
+    assert documents[0] is None
+    assert documents[1]['sentence'] == '混んでるのだ'
+
+
+def test_split_assigns_untitled_documents_in_order():
+    untitled = TWO_DOCUMENTS.replace('topic: 天気\n', '').replace('topic: 渋滞\n', '')
+    documents = app.split_mandan_documents(untitled, TOPICS)
+    assert [document['sentence'] for document in documents] == ['晴れなのだ', '混んでるのだ']
+
+
+def test_validate_zundamon_params():
+    assert app.validate_zundamon_params({'expression_mouth': 'にっこり', 'unknown': 'x', 'left_arm': ['a']}) == \
+        {'expression_mouth': 'にっこり'}
+    assert app.validate_zundamon_params('にっこり') == app.DEFAULT_ZUNDAMON_PARAMS
+    assert app.validate_zundamon_params({'unknown': 'x'}) == app.DEFAULT_ZUNDAMON_PARAMS
+    assert app.validate_zundamon_params(None) is not app.DEFAULT_ZUNDAMON_PARAMS
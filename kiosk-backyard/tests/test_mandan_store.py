@@ -0,0 +1,52 @@
+"""MandanStore のテスト"""
+
+import pytest
+
+from mandan_store import MandanStore, topic_key
+
+PARAMS = {'expression_mouth': 'ほう'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MandanStore(str(tmp_path / 'mandan.db'), max_entries=3)
+    yield store
+    store.close()
+
+
+def test_lookup_same_and_similar_topic(store):
+    store.add('東京の天気', '晴れなのだ', PARAMS, 'ollama:mistral')
+    assert store.lookup('東京の 天気！')['sentence'] == '晴れなのだ'
+    similar = store.lookup('東京の天気予報')
+    assert similar['sentence'] == '晴れなのだ' and similar['similarity'] < 1.0
+    assert store.lookup('まったく別の話') is None
+
+
+@pytest.mark.parametrize('stored, asked', [('東京の天気', '東京の渋滞'), ('名古屋の天気', '名古屋の渋滞')])
+def test_same_place_different_subject_does_not_match(store, stored, asked):
+    # 地名と「の」が同じでも、話題が違えば別のトピック
+    store.add(stored, '晴れなのだ', PARAMS)
+    assert store.similar_topics(asked) == []
+    assert store.lookup(asked) is None
+
+
+def test_overflow_prunes_topics_without_entries(store, tmp_path):
+    store.add('天気', '1', PARAMS)
+    store.add('渋滞', '2', PARAMS)
+    store.add('渋滞', '3', PARAMS)
+    store.add('ラーメン', '4', PARAMS)
+
+    # 一番古い「天気」が消え、類似度検索の対象からも外れる
+    assert store.count() == 3
+    assert topic_key('天気') not in store._topics
+    assert store.lookup('天気') is None
+
+    # まだ漫談が残っているトピックは残す
+    store.add('カレー', '5', PARAMS)
+    assert topic_key('渋滞') in store._topics
+    assert set(store._topics) == {topic_key(topic) for topic in ('渋滞', 'ラーメン', 'カレー')}
+
+    # 開き直しても同じトピックになる
+    reopened = MandanStore(str(tmp_path / 'mandan.db'), max_entries=3)
+    assert set(reopened._topics) == set(store._topics)
+    reopened.close()
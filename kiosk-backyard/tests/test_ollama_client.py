@@ -0,0 +1,54 @@
+"""OllamaClient のテスト（固定の指示はシステムメッセージで送り、廃止予定の context を使わない）"""
+
+import pytest
+
+app = pytest.importorskip('app')
+
+SYSTEM = "あなたはずんだもんです。"
+
+
+class FakeOllama:
+    """ollama.Client の代わりに chat / generate の引数を記録する"""
+
+    def __init__(self):
+        self.calls = []
+
+    def chat(self, **kwargs):
+        self.calls.append(('chat', kwargs))
+        if kwargs.get('stream'):
+            return iter([{'message': {'content': 'のだ'}, 'done': False},
+                         {'message': {'content': ''}, 'done': True}])
+        return {'message': {'content': 'のだ'}, 'done': True}
+
+    def generate(self, **kwargs):
+        self.calls.append(('generate', kwargs))
+        return {'response': '', 'context': [1, 2, 3], 'done': True}
+
+
+@pytest.fixture
+def ollama():
+    client = app.OllamaClient(base_url='http://ollama.invalid')
+    client._client = FakeOllama()
+    return client
+
+
+def test_session_sends_system_and_user_messages(ollama):
+    assert ''.join(ollama.stream_in_session('mistral', SYSTEM, 'トピック: 天気')) == 'のだ'
+    assert ollama.generate_in_session('mistral', SYSTEM, 'トピック: 渋滞') == 'のだ'
+
+    calls = ollama._client.calls
+    assert [kind for kind, _ in calls] == ['chat', 'chat', 'chat']
+    # 最初の1回だけシステムプロンプトを処理させる（準備用の問答は会話に入れない）
+    assert calls[0][1]['messages'] == [{'role': 'system', 'content': SYSTEM}]
+    for _, kwargs in calls[1:]:
+        assert 'context' not in kwargs
+        assert kwargs['messages'][0] == {'role': 'system', 'content': SYSTEM}
+        assert [message['role'] for message in kwargs['messages']] == ['system', 'user']
+    assert calls[2][1]['messages'][1]['content'] == 'トピック: 渋滞'
+
+
+def test_session_restarts_when_system_prompt_changes(ollama):
+    ollama.generate_in_session('mistral', SYSTEM, 'トピック: 天気')
+    ollama.generate_in_session('mistral', SYSTEM + '短くしてください。', 'トピック: 天気')
+    prepared = [kwargs['messages'] for _, kwargs in ollama._client.calls if len(kwargs['messages']) == 1]
+    assert len(prepared) == 2
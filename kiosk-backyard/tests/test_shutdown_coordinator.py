@@ -0,0 +1,77 @@
+"""ShutdownCoordinator のテスト（状態の保存・置き換え・復元）"""
+
+import threading
+import time
+
+from shutdown_coordinator import ShutdownCoordinator
+
+
+def file_state(store):
+    """store['value'] を value.txt に保存し、復元した値を store['restored'] に入れる状態"""
+    def save(path):
+        (path / 'value.txt').write_text(store['value'])
+
+    def restore(path):
+        store['restored'] = (path / 'value.txt').read_text()
+    return save, restore
+
+
+def test_save_and_restore(tmp_path):
+    store = {'value': 'first'}
+    coordinator = ShutdownCoordinator(str(tmp_path), budget=2)
+    coordinator.register('state', *file_state(store))
+    assert coordinator.save_state()['results'] == {'state': 'ok'}
+    store['value'] = 'second'
+    assert coordinator.save_state()['results'] == {'state': 'ok'}
+
+    # 一時ディレクトリ・前回の状態は残らない
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['state']
+
+    restored = {}
+    other = ShutdownCoordinator(str(tmp_path))
+    other.register('state', *file_state(restored))
+    assert other.restore_all() == {'state': 'ok'}
+    assert restored['restored'] == 'second'
+
+
+def test_restore_previous_state_after_interrupted_swap(tmp_path):
+    # 前回の状態を <name>.old に移したところで止まった
+    (tmp_path / 'state.old').mkdir()
+    (tmp_path / 'state.old' / 'value.txt').write_text('previous')
+    (tmp_path / 'state.x1y2.tmp').mkdir()
+
+    restored = {}
+    coordinator = ShutdownCoordinator(str(tmp_path))
+    coordinator.register('state', *file_state(restored))
+    assert coordinator.restore_all() == {'state': 'ok'}
+    assert restored['restored'] == 'previous'
+    assert not (tmp_path / 'state.x1y2.tmp').exists()
+
+
+def test_late_save_does_not_replace_newer_state(tmp_path):
+    release = threading.Event()
+    calls = []
+
+    def save(path):
+        calls.append(path)
+        if len(calls) == 1:
+            # 1回目は制限時間を過ぎても書き続ける
+            release.wait(2)
+            (path / 'value.txt').write_text('stale')
+        else:
+            (path / 'value.txt').write_text('fresh')
+
+    coordinator = ShutdownCoordinator(str(tmp_path), budget=0.1)
+    coordinator.register('state', save)
+    assert coordinator.save_state('prepare-shutdown')['results'] == {'state': 'timeout'}
+    assert coordinator.save_state('shutdown')['results'] == {'state': 'ok'}
+
+    # 保存ごとに別の一時ディレクトリ
+    assert calls[0] != calls[1]
+    release.set()
+    deadline = time.monotonic() + 2
+    while calls[0].exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert (tmp_path / 'state' / 'value.txt').read_text() == 'fresh'
+    assert not calls[0].exists()
@@ -0,0 +1,51 @@
+"""ZundamonCompositor の合成済み画像キャッシュの保存・復元のテスト"""
+
+import json
+
+import pytest
+
+import zundamon_compositor
+from benchmarks.synthetic_layers import generate_layer_set
+from zundamon_compositor import ZundamonCompositor
+
+PARAMS = {'expression_mouth': 'ほう'}
+
+
+@pytest.fixture
+def saved_cache(tmp_path):
+    layers_dir = generate_layer_set(tmp_path / 'layers')
+    compositor = ZundamonCompositor(str(layers_dir))
+    compositor.compose_image(dict(PARAMS))
+    state_dir = tmp_path / 'state'
+    state_dir.mkdir()
+    compositor.save_render_cache(state_dir)
+    return layers_dir, state_dir
+
+
+def test_restore_with_same_layers(saved_cache):
+    layers_dir, state_dir = saved_cache
+    compositor = ZundamonCompositor(str(layers_dir))
+    compositor.load_render_cache(state_dir)
+    assert len(compositor.render_cache) == 1
+
+
+def test_skip_restore_after_layers_change(saved_cache):
+    layers_dir, state_dir = saved_cache
+    # レイヤーを抽出し直した（メタデータが変わった）
+    metadata_path = layers_dir / 'layer_metadata.json'
+    metadata = json.loads(metadata_path.read_text(encoding='utf-8'))
+    next(iter(metadata['layers'].values()))['bbox']['left'] += 1
+    metadata_path.write_text(json.dumps(metadata, ensure_ascii=False), encoding='utf-8')
+
+    compositor = ZundamonCompositor(str(layers_dir))
+    compositor.load_render_cache(state_dir)
+    assert len(compositor.render_cache) == 0
+    assert len(compositor.content_index) == 0
+
+
+def test_skip_restore_after_renderer_change(saved_cache, monkeypatch):
+    layers_dir, state_dir = saved_cache
+    monkeypatch.setattr(zundamon_compositor, 'RENDERER_VERSION', 'next')
+    compositor = ZundamonCompositor(str(layers_dir))
+    compositor.load_render_cache(state_dir)
+    assert len(compositor.render_cache) == 0
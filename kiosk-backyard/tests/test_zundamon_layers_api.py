@@ -0,0 +1,48 @@
+"""/api/zundamon/layers のテスト（ブラウザで合成するかどうかとレイヤー一覧の ETag）"""
+
+import pytest
+
+app = pytest.importorskip('app')
+
+from benchmarks.synthetic_layers import generate_layer_set
+from zundamon_compositor import ZundamonCompositor
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    compositor = ZundamonCompositor(str(generate_layer_set(tmp_path / 'layers')), max_rendered=0)
+    monkeypatch.setattr(app, 'zundamon_compositor', compositor)
+    monkeypatch.setitem(app.settings, 'compositor', {'client_compositing': False})
+    return app.app.test_client()
+
+
+def set_client_compositing(enabled):
+    app.settings['compositor'] = {'client_compositing': enabled}
+
+
+def test_server_compositing_skips_manifest(client):
+    response = client.get('/api/zundamon/layers')
+    assert response.status_code == 200
+    assert response.get_json()['data'] == {'clientCompositing': False}
+    # レイヤー画像のハッシュを計算していない
+    assert app.zundamon_compositor._layer_manifest is None
+
+
+def test_client_compositing_returns_manifest(client):
+    set_client_compositing(True)
+    data = client.get('/api/zundamon/layers').get_json()['data']
+    assert data['clientCompositing'] is True
+    assert data['layers']
+    assert all(layer['url'].startswith('/api/zundamon/layer/') for layer in data['layers'].values())
+
+
+def test_etag_changes_when_setting_flips(client):
+    server_etag = client.get('/api/zundamon/layers').headers['ETag']
+    assert client.get('/api/zundamon/layers', headers={'If-None-Match': server_etag}).status_code == 304
+
+    # 設定を切り替えたら、前の ETag では 304 にならず新しい内容を返す
+    set_client_compositing(True)
+    response = client.get('/api/zundamon/layers', headers={'If-None-Match': server_etag})
+    assert response.status_code == 200
+    assert response.get_json()['data']['clientCompositing'] is True
+    assert response.headers['ETag'] != server_etag
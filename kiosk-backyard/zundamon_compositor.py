@@ -5,29 +5,67 @@ Zundamon Image Compositor
 """
 
 import os
+import sys
 import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 from PIL import Image
 from io import BytesIO
 import logging
 import numpy as np
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
+
+from blend_kernels import blend
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+RENDERER_VERSION = '2'  # 合成の計算が変わったら上げる（同じレイヤーの組でも画像のハッシュが変わる）
+TILE_SIZE = 64  # 合成と隠れたレイヤーの判定の単位（キャンバス上の正方形のタイル、ピクセル）
+
+
+def _os_threading():
+    """タイルの並列合成に使う threading（eventlet のモンキーパッチ下でもOSスレッドを使う）"""
+    if 'eventlet' in sys.modules:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread'):
+            return patcher.original('threading')
+    return threading
+
 class ZundamonCompositor:
-    def __init__(self, layers_dir: str = "/app/assets/zundamon_layers"):
+    def __init__(self, layers_dir: str = "/app/assets/zundamon_layers", max_rendered: int = 64,
+                 max_content_index: int = 1024, cull_occluded: bool = True, tile_threads: int = 1):
         """
         ずんだもん合成器を初期化
 
         Args:
             layers_dir: レイヤー画像ディレクトリのパス
+            max_rendered: 合成済み画像キャッシュの最大件数
+            max_content_index: 画像のハッシュから合成パラメータを引く索引の最大件数
+            cull_occluded: 上のレイヤーで完全に隠れるタイルを合成しない
+            tile_threads: タイルの行を並列に合成するスレッド数（NumPy の演算中は GIL が外れる）
         """
         self.layers_dir = Path(layers_dir)
         self.layer_cache = {}  # メモリキャッシュ
+        self.max_rendered = max_rendered
+        self.render_cache = OrderedDict()  # 合成済み画像（キー → (パラメータ, フォーマット, 画像データ)）
+        self.layer_arrays = {}  # 共有メモリ上のレイヤー配列（合成ワーカーで設定）
+        self._render_lock = threading.Lock()
+        # 画像のハッシュ → (パラメータ, フォーマット)（/api/zundamon/img/<ハッシュ> で合成し直せるように）
+        self.max_content_index = max_content_index
+        self.content_index = OrderedDict()
+        self.patch_cache = OrderedDict()  # 差分画像（(前のハッシュ, ハッシュ, フォーマット) → 差分）
+        self._layer_manifest = None  # ブラウザで合成するためのレイヤー一覧（初回に作成）
+        self.layer_files = {}  # レイヤー画像ファイルのハッシュ → パス
+        self.cull_occluded = cull_occluded
+        self.tile_threads = max(1, tile_threads)
+        self.layer_coverage_cache = {}  # レイヤー名 → (タイルごとの被覆, タイルごとの不透明)
         self.metadata = {}
+        self.metadata_fingerprint = ''
         self.canvas_size = (1082, 1594)  # デフォルトサイズ
 
         self.load_metadata()
@@ -41,8 +79,10 @@ class ZundamonCompositor:
                 logger.error(f"Metadata file not found: {metadata_path}")
                 return False
 
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                self.metadata = json.load(f)
+            metadata_bytes = metadata_path.read_bytes()
+            self.metadata = json.loads(metadata_bytes.decode('utf-8'))
+            # レイヤーを作り直したら画像のハッシュも変わるようにする
+            self.metadata_fingerprint = hashlib.sha1(metadata_bytes).hexdigest()
 
             # キャンバスサイズを更新
             psd_info = self.metadata.get("psd_info", {})
@@ -92,11 +132,112 @@ class ZundamonCompositor:
             logger.error(f"Failed to load layer image {layer_name}: {e}")
             return None
 
+    def load_layer_array(self, layer_name: str) -> Optional[np.ndarray]:
+        """レイヤー画像をRGBA配列として読み込む（キャッシュしない）"""
+        layer_info = self.metadata.get("layers", {}).get(layer_name)
+        if not layer_info:
+            return None
+        image_path = self.layers_dir / layer_info["file"]
+        if not image_path.exists():
+            return None
+        with Image.open(image_path) as image:
+            return np.array(image.convert('RGBA'))
+
+    def get_layer_array(self, layer_name: str) -> Optional[np.ndarray]:
+        """合成用のレイヤー配列を取得（共有メモリにあればコピーせずに使う）"""
+        array = self.layer_arrays.get(layer_name)
+        if array is not None:
+            return array
+        layer_image = self.get_layer_image(layer_name)
+        return np.array(layer_image) if layer_image else None
+
     def clear_cache(self):
         """キャッシュをクリア"""
         self.layer_cache.clear()
+        with self._render_lock:
+            self.render_cache.clear()
+            self.patch_cache.clear()
         logger.info("Layer cache cleared")
 
+    @staticmethod
+    def render_key(params: Dict[str, str], format: str) -> str:
+        """合成済み画像キャッシュのキー"""
+        key_string = json.dumps(params, sort_keys=True, ensure_ascii=False) + format.upper()
+        return hashlib.sha1(key_string.encode('utf-8')).hexdigest()
+
+    def content_key(self, params: Dict[str, str], format: str) -> str:
+        """合成結果のハッシュ（解決したレイヤーの組とフォーマットで決まる。パラメータの書き方が違っても同じ画像なら同じ値）"""
+        layer_names = self.resolve_layer_names(self.with_defaults(dict(params)))
+        key_string = '\n'.join([RENDERER_VERSION, self.metadata_fingerprint, format.upper(), *sorted(layer_names)])
+        return hashlib.sha1(key_string.encode('utf-8')).hexdigest()[:20]
+
+    def register_content(self, params: Dict[str, str], format: str) -> str:
+        """画像のハッシュを索引に登録して返す"""
+        content_key = self.content_key(params, format)
+        with self._render_lock:
+            self.content_index[content_key] = (dict(params), format.upper())
+            self.content_index.move_to_end(content_key)
+            while len(self.content_index) > self.max_content_index:
+                self.content_index.popitem(last=False)
+        return content_key
+
+    def lookup_content(self, content_key: str) -> Optional[Tuple[Dict[str, str], str]]:
+        """画像のハッシュから (パラメータ, フォーマット)（索引になければ None）"""
+        with self._render_lock:
+            entry = self.content_index.get(content_key)
+            if entry:
+                self.content_index.move_to_end(content_key)
+            return entry
+
+    def get_rendered(self, key: str) -> Optional[bytes]:
+        """合成済み画像をキャッシュから取得"""
+        with self._render_lock:
+            cached = self.render_cache.get(key)
+            if cached:
+                self.render_cache.move_to_end(key)
+                return cached[2]
+        return None
+
+    def store_rendered(self, key: str, params: Dict[str, str], format: str, data: bytes):
+        self.register_content(params, format)
+        with self._render_lock:
+            self.render_cache[key] = (dict(params), format.upper(), data)
+            self.render_cache.move_to_end(key)
+            while len(self.render_cache) > self.max_rendered:
+                self.render_cache.popitem(last=False)
+
+    def save_render_cache(self, state_dir: Path):
+        """合成済み画像キャッシュをディレクトリに保存（シャットダウン時）
+
+        index.json にはレイヤーのメタデータと合成処理のバージョンも書き、違っていれば復元しない。
+        """
+        with self._render_lock:
+            entries = list(self.render_cache.items())
+
+        index = []
+        for key, (params, format, data) in entries:
+            (state_dir / f"{key}.{format.lower()}").write_bytes(data)
+            index.append({"key": key, "params": params, "format": format})
+        (state_dir / "index.json").write_text(json.dumps({
+            "renderer_version": RENDERER_VERSION,
+            "fingerprint": self.metadata_fingerprint,
+            "entries": index
+        }, ensure_ascii=False), encoding='utf-8')
+
+    def load_render_cache(self, state_dir: Path):
+        """保存済みの合成済み画像キャッシュを読み込む（起動時）"""
+        index = json.loads((state_dir / "index.json").read_text(encoding='utf-8'))
+        # レイヤーを抽出し直した・合成処理が変わった後の古い画像を新しいハッシュで配信しない
+        if not isinstance(index, dict) or index.get("renderer_version") != RENDERER_VERSION \
+                or index.get("fingerprint") != self.metadata_fingerprint:
+            logger.info("Rendered images were saved for other layers or renderer, not restoring")
+            return
+        for entry in index["entries"]:
+            image_path = state_dir / f"{entry['key']}.{entry['format'].lower()}"
+            if image_path.exists():
+                self.store_rendered(entry["key"], entry["params"], entry["format"], image_path.read_bytes())
+        logger.info(f"Restored {len(self.render_cache)} rendered images")
+
     def get_available_options(self) -> Dict[str, List[str]]:
         """利用可能なオプションを取得"""
         try:
@@ -202,6 +343,27 @@ class ZundamonCompositor:
                 original_clean.endswith(param_clean) or
                 layer_clean.endswith(param_clean))
 
+    @staticmethod
+    def with_defaults(params: Optional[Dict[str, str]]) -> Dict[str, str]:
+        """デフォルト値で不足分を補完（渡された辞書を更新して返す）"""
+        if params is None:
+            params = {}
+
+        default_params = {
+            "head_direction": "正面向き",
+            "right_arm": "腰",
+            "left_arm": "腰",
+            "edamame": "通常",
+            "face_color": "ほっぺ基本",
+            "expression_mouth": "ほう",
+            "expression_eyes": "基本目",
+            "expression_eyebrows": "怒り眉",
+            "something_like_shippo": "true"
+        }
+        for key, value in default_params.items():
+            params.setdefault(key, value)
+        return params
+
     def compose_image(self, params: Dict[str, str] = None, format: str = 'PNG') -> BytesIO:
         """
         パラメータに基づいて画像を合成
@@ -214,26 +376,14 @@ class ZundamonCompositor:
             BytesIO: 合成された画像データ
         """
         try:
-            # デフォルトパラメータ
-            if params is None:
-                params = {}
-
-            default_params = {
-                "head_direction": "正面向き",
-                "right_arm": "腰",
-                "left_arm": "腰",
-                "edamame": "通常",
-                "face_color": "ほっぺ基本",
-                "expression_mouth": "ほう",
-                "expression_eyes": "基本目",
-                "expression_eyebrows": "怒り眉",
-                "something_like_shippo": "true"
-            }
+            started = time.perf_counter()
+            params = self.with_defaults(params)
 
-            # デフォルト値で不足分を補完
-            for key, value in default_params.items():
-                if key not in params:
-                    params[key] = value
+            # 同じパラメータの合成済み画像があれば再利用
+            key = self.render_key(params, format)
+            cached = self.get_rendered(key)
+            if cached:
+                return BytesIO(cached)
 
             # レイヤー名を解決
             layer_names = self.resolve_layer_names(params)
@@ -242,45 +392,353 @@ class ZundamonCompositor:
                 logger.warning("No layers resolved from parameters")
                 layer_names = ["base_body"]  # フォールバック
 
-            logger.info(f"Composing with layers: {layer_names}")
+            logger.debug("Composing with layers", extra={'layers': layer_names})
 
             # キャンバスを作成
-            canvas = Image.new('RGBA', self.canvas_size, (0, 0, 0, 0))
-
-            # 合成順序に従ってレイヤーを合成
-            composition_order = self.metadata.get("composition_order", [])
-
-            # 合成順序に含まれるレイヤーを優先して合成
-            for layer_name in composition_order:
-                if layer_name in layer_names:
-                    self._composite_layer(canvas, layer_name)
-
-            # 順序に含まれていないレイヤーも合成
-            for layer_name in layer_names:
-                if layer_name not in composition_order:
-                    self._composite_layer(canvas, layer_name)
-
-            # 最終画像の形式を調整
-            if format.upper() == 'JPEG':
-                # JPEGの場合は白背景に変換
-                jpeg_image = Image.new('RGB', canvas.size, (255, 255, 255))
-                jpeg_image.paste(canvas, mask=canvas.split()[-1])
-                final_image = jpeg_image
-            else:
-                final_image = canvas
+            canvas = np.zeros((self.canvas_size[1], self.canvas_size[0], 4), dtype=np.uint8)
+
+            # 合成順序に従って、上のレイヤーに隠れていないタイルだけを合成
+            self.composite_tiles(canvas, self.tile_plan(self.composition_sequence(layer_names)))
 
-            # BytesIOに保存
-            img_buffer = BytesIO()
-            final_image.save(img_buffer, format=format.upper())
-            img_buffer.seek(0)
+            img_buffer = self._encode(Image.fromarray(canvas, 'RGBA'), format)
+            self.store_rendered(key, params, format, img_buffer.getvalue())
 
-            logger.info(f"Generated {format} image with {len(layer_names)} layers")
+            logger.info("Generated image", extra={
+                'format': format.upper(),
+                'layer_count': len(layer_names),
+                'bytes': len(img_buffer.getvalue()),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+            })
             return img_buffer
 
         except Exception as e:
             logger.error(f"Failed to compose image: {e}")
             raise
 
+    def composition_sequence(self, layer_names: List[str]) -> List[str]:
+        """合成する順のレイヤー名（合成順序に含まれるものが先、含まれないものはその後に指定順）"""
+        composition_order = self.metadata.get("composition_order", [])
+        selected = set(layer_names)
+        ordered = [layer_name for layer_name in composition_order if layer_name in selected]
+        ordered_set = set(ordered)
+        return ordered + [layer_name for layer_name in layer_names if layer_name not in ordered_set]
+
+    @staticmethod
+    def _encode(image: Image.Image, format: str) -> BytesIO:
+        """PNG はそのまま、JPEG は白背景にしてエンコード"""
+        if format.upper() == 'JPEG':
+            jpeg_image = Image.new('RGB', image.size, (255, 255, 255))
+            jpeg_image.paste(image, mask=image.split()[-1])
+            image = jpeg_image
+        img_buffer = BytesIO()
+        image.save(img_buffer, format=format.upper())
+        img_buffer.seek(0)
+        return img_buffer
+
+    def layer_rect(self, layer_name: str) -> Optional[Tuple[int, int, int, int]]:
+        """レイヤーがキャンバス上で占める範囲 (left, top, right, bottom)。bbox がなければキャンバス全体"""
+        width, height = self.canvas_size
+        bbox = self.metadata.get("layers", {}).get(layer_name, {}).get("bbox")
+        if not bbox:
+            return (0, 0, width, height)
+        rect = (max(0, bbox["left"]), max(0, bbox["top"]), min(width, bbox["right"]), min(height, bbox["bottom"]))
+        return rect if rect[0] < rect[2] and rect[1] < rect[3] else None
+
+    def dirty_rect(self, before: List[str], after: List[str]) -> Optional[Tuple[int, int, int, int]]:
+        """増えた・消えたレイヤーの範囲を合わせた矩形（変化がなければ None）"""
+        rects = [rect for rect in map(self.layer_rect, set(before) ^ set(after)) if rect]
+        if not rects:
+            return None
+        return (min(r[0] for r in rects), min(r[1] for r in rects),
+                max(r[2] for r in rects), max(r[3] for r in rects))
+
+    def _layer_position(self, layer_name: str, layer_array: np.ndarray) -> Tuple[int, int]:
+        bbox = self.metadata.get("layers", {}).get(layer_name, {}).get("bbox")
+        if bbox:
+            return (bbox["left"], bbox["top"])
+        # 位置情報がない場合は中央配置
+        return ((self.canvas_size[0] - layer_array.shape[1]) // 2, (self.canvas_size[1] - layer_array.shape[0]) // 2)
+
+    def render_region(self, layer_names: List[str], rect: Tuple[int, int, int, int]) -> Image.Image:
+        """キャンバスの rect の範囲だけを合成（rect に掛かるタイルだけを compose_image と同じ手順で合成）"""
+        left, top, right, bottom = rect
+        canvas = np.zeros((self.canvas_size[1], self.canvas_size[0], 4), dtype=np.uint8)
+        window = np.zeros(self.tile_grid(), dtype=bool)
+        window[top // TILE_SIZE:-(-bottom // TILE_SIZE), left // TILE_SIZE:-(-right // TILE_SIZE)] = True
+        self.composite_tiles(canvas, self.tile_plan(self.composition_sequence(layer_names), window))
+        return Image.fromarray(canvas[top:bottom, left:right], 'RGBA')
+
+    def encode_region(self, layer_names: List[str], rect: Tuple[int, int, int, int], format: str = 'PNG') -> bytes:
+        """rect の範囲だけを合成してエンコードした画像データ"""
+        return self._encode(self.render_region(layer_names, rect), format).getvalue()
+
+    def compose_patch(self, previous_params: Dict[str, str], params: Dict[str, str],
+                      format: str = 'PNG', encode_region: Optional[Callable] = None) -> Dict:
+        """前のパラメータの画像から変わった範囲だけを合成した差分画像
+
+        Args:
+            encode_region: 範囲の合成・エンコードを行う関数（省略時は encode_region。CompositorPool はワーカーで行う）
+
+        Returns:
+            rect: 差分の範囲 (x, y, width, height)（変化がなければ None）
+            data: 差分画像（範囲内の画素をすべて置き換える。変化がなければ None）
+            content_key: 新しい画像全体のハッシュ（次の差分の基準になる）
+        """
+        started = time.perf_counter()
+        previous_params = self.with_defaults(dict(previous_params))
+        params = self.with_defaults(dict(params))
+        from_key = self.content_key(previous_params, format)
+        content_key = self.register_content(params, format)
+        cache_key = (from_key, content_key, format.upper())
+        with self._render_lock:
+            cached = self.patch_cache.get(cache_key)
+            if cached:
+                self.patch_cache.move_to_end(cache_key)
+                return cached
+
+        before = self.resolve_layer_names(previous_params)
+        after = self.resolve_layer_names(params)
+        rect = self.dirty_rect(before, after)
+        patch = {
+            'rect': None,
+            'data': None,
+            'format': format.upper(),
+            'from_key': from_key,
+            'content_key': content_key,
+            'added': sorted(set(after) - set(before)),
+            'removed': sorted(set(before) - set(after))
+        }
+        if rect:
+            patch['rect'] = (rect[0], rect[1], rect[2] - rect[0], rect[3] - rect[1])
+            patch['data'] = (encode_region or self.encode_region)(after, rect, format)
+
+        with self._render_lock:
+            self.patch_cache[cache_key] = patch
+            while len(self.patch_cache) > self.max_rendered:
+                self.patch_cache.popitem(last=False)
+        logger.info("Generated patch", extra={
+            'format': format.upper(),
+            'rect': patch['rect'],
+            'bytes': len(patch['data'] or b''),
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+        })
+        return patch
+
+    def tile_grid(self) -> Tuple[int, int]:
+        """キャンバスのタイルの行数・列数（端のタイルはキャンバスからはみ出す）"""
+        return (-(-self.canvas_size[1] // TILE_SIZE), -(-self.canvas_size[0] // TILE_SIZE))
+
+    def layer_blend(self, layer_name: str) -> Tuple[str, int]:
+        """レイヤーの描画モードと、合成時に掛ける不透明度
+
+        layer_extractor は多くのレイヤーを composite() で書き出すため、画像のアルファに不透明度が掛かっている
+        （opacity_applied。記録のない古いメタデータもこの方法で作られている）。その場合はもう掛けない。
+        """
+        layer_info = self.metadata.get("layers", {}).get(layer_name, {})
+        mode = layer_info.get("blend_mode", "BlendMode.NORMAL")
+        if layer_info.get("opacity_applied", True):
+            return mode, 255
+        return mode, layer_info.get("opacity", 255)
+
+    def layer_coverage(self, layer_name: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """レイヤーのタイルごとの被覆（不透明度が0でない画素がある）と不透明（タイル全体が不透明）
+
+        レイヤーごとに初回だけアルファチャンネルから作る。
+        不透明度が255未満・通常以外の描画モードのレイヤーは下を隠さないものとする。
+        """
+        with self._render_lock:
+            if layer_name in self.layer_coverage_cache:
+                return self.layer_coverage_cache[layer_name]
+
+        layer_array = self.get_layer_array(layer_name)
+        if layer_array is None:
+            return None
+        rows, cols = self.tile_grid()
+        width, height = self.canvas_size
+        x, y = self._layer_position(layer_name, layer_array)
+        x_start, y_start = max(0, x), max(0, y)
+        x_end, y_end = min(width, x + layer_array.shape[1]), min(height, y + layer_array.shape[0])
+
+        alpha = np.zeros((rows * TILE_SIZE, cols * TILE_SIZE), dtype=np.uint8)
+        if x_start < x_end and y_start < y_end:
+            alpha[y_start:y_end, x_start:x_end] = layer_array[y_start - y:y_end - y, x_start - x:x_end - x, 3]
+        tiles = alpha.reshape(rows, TILE_SIZE, cols, TILE_SIZE)
+        covered = tiles.max(axis=(1, 3)) > 0
+
+        mode, opacity = self.layer_blend(layer_name)
+        if opacity < 255 or mode != "BlendMode.NORMAL":
+            opaque = np.zeros_like(covered)
+        else:
+            opaque = tiles.min(axis=(1, 3)) == 255
+
+        with self._render_lock:
+            self.layer_coverage_cache[layer_name] = (covered, opaque)
+        return covered, opaque
+
+    def visible_tiles(self, sequence: List[str]) -> Dict[str, np.ndarray]:
+        """合成順のレイヤーそれぞれについて、合成するタイル（上のレイヤーで完全に隠れるタイルを除く）"""
+        occluded = np.zeros(self.tile_grid(), dtype=bool)
+        visible = {}
+        for layer_name in reversed(sequence):
+            coverage = self.layer_coverage(layer_name)
+            if coverage is None:
+                continue
+            covered, opaque = coverage
+            if self.cull_occluded:
+                visible[layer_name] = covered & ~occluded
+                occluded |= opaque
+            else:
+                visible[layer_name] = covered
+        return visible
+
+    def occlusion_report(self, params: Dict[str, str]) -> Dict:
+        """隠れたタイルを合成しないことで減った画素数（レイヤーの範囲全体を合成する場合との比較）"""
+        sequence = self.composition_sequence(self.resolve_layer_names(self.with_defaults(dict(params))))
+        visible = self.visible_tiles(sequence)
+        rows, cols = self.tile_grid()
+        total = drawn = 0
+        skipped = []
+        for layer_name in sequence:
+            rect = self.layer_rect(layer_name)
+            if rect is None or layer_name not in visible:
+                continue
+            left, top, right, bottom = rect
+            # タイルとレイヤーの範囲の重なり（行ごとの高さ × 列ごとの幅）
+            edges_x = np.arange(cols + 1) * TILE_SIZE
+            edges_y = np.arange(rows + 1) * TILE_SIZE
+            widths = np.clip(np.minimum(edges_x[1:], right) - np.maximum(edges_x[:-1], left), 0, None)
+            heights = np.clip(np.minimum(edges_y[1:], bottom) - np.maximum(edges_y[:-1], top), 0, None)
+            total += (right - left) * (bottom - top)
+            drawn += int((np.outer(heights, widths) * visible[layer_name]).sum())
+            if not visible[layer_name].any():
+                skipped.append(layer_name)
+        return {
+            'layers': len(sequence),
+            'skipped_layers': skipped,
+            'pixels': total,
+            'drawn_pixels': drawn,
+            'saved_ratio': round(1 - drawn / total, 4) if total else 0.0
+        }
+
+    def tile_plan(self, sequence: List[str], window: Optional[np.ndarray] = None) -> List[Tuple[int, List]]:
+        """タイルの行ごとに、合成するレイヤー（下から順）とその列の範囲
+
+        [(行, [(レイヤー名, [(開始列, 終了列), ...]), ...]), ...] の形で、連続するタイルは1つの範囲にまとめる。
+        どのレイヤーも掛からない（透明な）タイルは含まない。window を指定するとその範囲のタイルだけ。
+        """
+        visible = self.visible_tiles(sequence)
+        if window is not None:
+            visible = {layer_name: tiles & window for layer_name, tiles in visible.items()}
+        plan = []
+        for row in range(self.tile_grid()[0]):
+            entries = []
+            for layer_name in sequence:
+                tiles = visible.get(layer_name)
+                columns = np.flatnonzero(tiles[row]) if tiles is not None else ()
+                if len(columns) == 0:
+                    continue
+                breaks = np.flatnonzero(np.diff(columns) > 1)
+                starts = np.r_[columns[0], columns[breaks + 1]]
+                ends = np.r_[columns[breaks], columns[-1]]
+                entries.append((layer_name, list(zip(starts.tolist(), ends.tolist()))))
+            if entries:
+                plan.append((row, entries))
+        return plan
+
+    def composite_tiles(self, canvas: np.ndarray, plan: List[Tuple[int, List]]):
+        """tile_plan の順にキャンバス（RGBA配列）へ直接合成する
+
+        タイルの行ごとに全レイヤーを重ねてから次の行に進む（作業中の範囲がキャッシュに収まる）。
+        行どうしは重ならないので、tile_threads > 1 なら行を分けて並列に合成する。
+        """
+        workers = min(self.tile_threads, len(plan))
+        if workers <= 1:
+            self._composite_rows(canvas, plan)
+            return
+
+        errors = []
+
+        def run(rows):
+            try:
+                self._composite_rows(canvas, rows)
+            except Exception as e:
+                errors.append(e)
+
+        # 重いレイヤーはキャンバスの中央に集まるので、行を交互に割り当てる
+        threads = [_os_threading().Thread(target=run, args=(plan[i::workers],), daemon=True)
+                   for i in range(1, workers)]
+        for thread in threads:
+            thread.start()
+        run(plan[0::workers])
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def _composite_rows(self, canvas: np.ndarray, rows: List[Tuple[int, List]]):
+        height, width = canvas.shape[:2]
+        for row, entries in rows:
+            row_top = row * TILE_SIZE
+            row_bottom = min(height, row_top + TILE_SIZE)
+            for layer_name, runs in entries:
+                layer_array = self.get_layer_array(layer_name)
+                if layer_array is None:
+                    continue
+                x, y = self._layer_position(layer_name, layer_array)
+                mode, opacity = self.layer_blend(layer_name)
+                top = max(y, row_top)
+                bottom = min(y + layer_array.shape[0], row_bottom)
+                for start, end in runs:
+                    left = max(x, start * TILE_SIZE)
+                    right = min(x + layer_array.shape[1], (end + 1) * TILE_SIZE, width)
+                    if left < right and top < bottom:
+                        blend(canvas[top:bottom, left:right],
+                              layer_array[top - y:bottom - y, left - x:right - x], mode, opacity)
+
+    def layer_manifest(self) -> Dict:
+        """ブラウザで重ねるためのレイヤー一覧（画像ファイルのハッシュ・位置・重ね順）
+
+        ハッシュはファイルの内容から作るので、レイヤーを抽出し直しても変わらない画像はキャッシュが効く。
+        """
+        with self._render_lock:
+            if self._layer_manifest is not None:
+                return self._layer_manifest
+
+        composition_order = self.metadata.get("composition_order", [])
+        order = {layer_name: index for index, layer_name in enumerate(composition_order)}
+        layers = {}
+        layer_files = {}
+        for layer_name, layer_info in self.metadata.get("layers", {}).items():
+            image_path = self.layers_dir / layer_info["file"]
+            if not image_path.exists():
+                continue
+            file_key = hashlib.sha1(image_path.read_bytes()).hexdigest()[:20]
+            layer_files[file_key] = image_path
+            mode, opacity = self.layer_blend(layer_name)
+            layers[layer_name] = {
+                'key': file_key,
+                'bbox': layer_info.get("bbox"),
+                'z': order.get(layer_name, len(composition_order)),
+                'opacity': opacity,
+                'blendMode': mode
+            }
+
+        manifest = {
+            'fingerprint': self.metadata_fingerprint,
+            'canvas': {'width': self.canvas_size[0], 'height': self.canvas_size[1]},
+            'compositionOrder': composition_order,
+            'layers': layers
+        }
+        with self._render_lock:
+            self.layer_files = layer_files
+            self._layer_manifest = manifest
+        return manifest
+
+    def lookup_layer_file(self, file_key: str) -> Optional[Path]:
+        """ハッシュからレイヤー画像ファイルのパス"""
+        self.layer_manifest()
+        return self.layer_files.get(file_key)
+
     def _alpha_composite_numpy(self, dst_array: np.ndarray, src_array: np.ndarray, position: Tuple[int, int]) -> np.ndarray:
         """
         NumPyを使用した正しいアルファコンポジティング
@@ -313,76 +771,9 @@ class ZundamonCompositor:
         src_x_end = src_x_start + (x_end - x_start)
         src_y_end = src_y_start + (y_end - y_start)
 
-        # 対象領域を抽出
-        dst_region = dst_array[y_start:y_end, x_start:x_end].astype(np.float32) / 255.0
-        src_region = src_array[src_y_start:src_y_end, src_x_start:src_x_end].astype(np.float32) / 255.0
-
-        # アルファチャンネルを分離
-        dst_rgb = dst_region[:, :, :3]
-        dst_alpha = dst_region[:, :, 3:4]
-        src_rgb = src_region[:, :, :3]
-        src_alpha = src_region[:, :, 3:4]
-
-        # アルファコンポジティングの計算
-        # result_alpha = src_alpha + dst_alpha * (1 - src_alpha)
-        result_alpha = src_alpha + dst_alpha * (1 - src_alpha)
-
-        # ゼロ除算を避けるため、result_alphaが0の場合の処理
-        alpha_mask = result_alpha > 0
-
-        # result_color = (src_color * src_alpha + dst_color * dst_alpha * (1 - src_alpha)) / result_alpha
-        result_rgb = np.zeros_like(dst_rgb)
-        result_rgb[alpha_mask.squeeze()] = (
-            (src_rgb * src_alpha + dst_rgb * dst_alpha * (1 - src_alpha))[alpha_mask.squeeze()] /
-            result_alpha[alpha_mask.squeeze()]
-        )
-
-        # 結果を結合
-        result_region = np.concatenate([result_rgb, result_alpha], axis=2)
-
-        # 結果を元の配列にコピー
-        result_array = dst_array.copy().astype(np.float32) / 255.0
-        result_array[y_start:y_end, x_start:x_end] = result_region
-
-        # 0-255の範囲に戻す
-        return (result_array * 255).astype(np.uint8)
-
-    def _composite_layer(self, canvas: Image.Image, layer_name: str) -> bool:
-        """レイヤーをキャンバスに合成（改良されたアルファコンポジティング使用）"""
-        try:
-            layer_image = self.get_layer_image(layer_name)
-            if not layer_image:
-                return False
-
-            layer_info = self.metadata.get("layers", {}).get(layer_name, {})
-            bbox = layer_info.get("bbox")
-
-            if bbox:
-                # 位置情報がある場合は指定位置に配置
-                position = (bbox["left"], bbox["top"])
-            else:
-                # 位置情報がない場合は中央配置
-                x = (canvas.width - layer_image.width) // 2
-                y = (canvas.height - layer_image.height) // 2
-                position = (x, y)
-
-            # NumPyを使用した正しいアルファコンポジティング
-            canvas_array = np.array(canvas)
-            layer_array = np.array(layer_image)
-
-            # アルファコンポジティングを実行
-            result_array = self._alpha_composite_numpy(canvas_array, layer_array, position)
-
-            # 結果をPIL Imageに変換してキャンバスを更新
-            result_image = Image.fromarray(result_array, 'RGBA')
-            canvas.paste(result_image, (0, 0))
-
-            logger.debug(f"Composited layer: {layer_name}")
-            return True
-
-        except Exception as e:
-            logger.error(f"Failed to composite layer {layer_name}: {e}")
-            return False
+        result_array = dst_array.copy()
+        blend(result_array[y_start:y_end, x_start:x_end], src_array[src_y_start:src_y_end, src_x_start:src_x_end])
+        return result_array
 
 # テスト用のメイン関数
 if __name__ == "__main__":
@@ -36,6 +36,8 @@ class ZundamonLayerExtractor:
             "radio_groups": {},
             "composition_order": []
         }
+        # レイヤー名 → 抽出した画像に不透明度が掛かっているか（composite() は掛ける、topil() は掛けない）
+        self.opacity_applied = {}
 
     def load_psd(self) -> bool:
         """PSDファイルを読み込む"""
@@ -231,6 +233,7 @@ class ZundamonLayerExtractor:
                         alpha = layer_image.split()[-1]
                         if alpha.getextrema()[1] > 0:  # 透明でない
                             logger.debug(f"Method 1 success for {layer.name}")
+                            self.opacity_applied[layer.name] = True
                             return self._process_layer_image(layer_image, layer.name)
             except Exception as e:
                 logger.debug(f"Method 1 failed for {layer.name}: {e}")
@@ -244,6 +247,7 @@ class ZundamonLayerExtractor:
                         alpha = layer_image.split()[-1]
                         if alpha.getextrema()[1] > 0:  # 透明でない
                             logger.debug(f"Method 2 success for {layer.name}")
+                            self.opacity_applied[layer.name] = False
                             return self._process_layer_image(layer_image, layer.name)
             except Exception as e:
                 logger.debug(f"Method 2 failed for {layer.name}: {e}")
@@ -277,6 +281,7 @@ class ZundamonLayerExtractor:
                         layer_image = psd_image.crop(bbox)
                         if layer_image and layer_image.size[0] > 0 and layer_image.size[1] > 0:
                             logger.debug(f"Method 3 success for {layer.name}")
+                            self.opacity_applied[layer.name] = True
                             return self._process_layer_image(layer_image, layer.name)
 
             finally:
@@ -368,6 +373,7 @@ class ZundamonLayerExtractor:
                     layer_image = self.extract_layer_image(layer, parent_group_layer)
 
                     if layer_image:
+                        layer_info["opacity_applied"] = self.opacity_applied.get(layer.name, True)
                         try:
                             layer_image.save(str(file_path), "PNG", optimize=True)
                             logger.info(f"Extracted: {file_path}")
@@ -1,5 +1,6 @@
 import React, { useCallback } from 'react';
 import { useZundamonExpression } from '../hooks/useZundamonExpression';
+import { useZundamonCanvas } from '../hooks/useZundamonCanvas';
 import { useWebSocket } from '../hooks/useWebSocket';
 
 interface SystemAlert {
@@ -29,7 +30,9 @@ export const ZundamonDisplay: React.FC<ZundamonDisplayProps> = ({
     }
   }, [synthesizeVoice]);
 
-  const { zundamonUrl, rpmRange, message } = useZundamonExpression(rpm, systemAlerts, handleMessageChange);
+  const { expression, rpmRange, message } = useZundamonExpression(rpm, systemAlerts, handleMessageChange);
+  // 表情が変わった範囲だけを差し替えて描画
+  const { canvasRef, ready } = useZundamonCanvas(expression);
 
   const getRPMStatusClass = () => {
     switch (rpmRange) {
@@ -77,13 +80,14 @@ export const ZundamonDisplay: React.FC<ZundamonDisplayProps> = ({
   return (
     <div className={`zundamon-display ${className}`}>
       <div className="zundamon-container">
-        {zundamonUrl ? (
-          <img
-            src={zundamonUrl}
-            alt="ずんだもん"
-            className="zundamon-image console-mode"
-          />
-        ) : (
+        <canvas
+          ref={canvasRef}
+          role="img"
+          aria-label="ずんだもん"
+          className="zundamon-image console-mode"
+          style={ready ? undefined : { display: 'none' }}
+        />
+        {!ready && (
           <div className="zundamon-loading">
             <p>ずんだもんを読み込み中...</p>
           </div>
@@ -33,11 +33,20 @@ interface VoiceProcessingData {
   text: string;
 }
 
+// 口形状タイムライン（[開始秒, 口形状] の列）
+type MouthShape = 'あ' | 'い' | 'う' | 'え' | 'お' | 'ん';
+
+interface MouthTimeline {
+  duration: number;
+  frames: Array<[number, MouthShape]>;
+}
+
 interface VoiceReadyData {
   task_id: string;
   audio_data: string;
   format: string;
   text: string;
+  lipsync?: MouthTimeline;
 }
 
 interface VoiceFallbackData {
@@ -80,6 +89,7 @@ interface MandanRequest {
   speaker?: number;
   model?: string;
   provider?: 'ollama' | 'claude';
+  lipsync?: boolean;
 }
 
 interface MandanResponse {
@@ -90,6 +100,7 @@ interface MandanResponse {
     audioData: string;
     format: string;
     speaker: number;
+    lipsync?: MouthTimeline;
   };
   topic: string;
   generatedAt: string;
@@ -106,6 +117,28 @@ interface MandanErrorData {
   timestamp: string;
 }
 
+interface GPSData {
+  latitude: number;
+  longitude: number;
+  altitude: number | null;
+  speed: number | null;
+  heading: number | null;
+  address: string;
+  timestamp: string;
+}
+
+interface WeatherData {
+  temperature: number;
+  condition: string;
+  humidity: number;
+  rainAlert: boolean;
+}
+
+interface SensorUpdate<T> {
+  data: T;
+  timestamp: string;
+}
+
 interface OllamaStatusData {
   available: boolean;
   models: string[];
@@ -131,6 +164,8 @@ export const useWebSocket = () => {
   const [currentMandan, setCurrentMandan] = useState<MandanResponse | null>(null);
   const [ollamaStatus, setOllamaStatus] = useState<OllamaStatusData | null>(null);
   const [claudeStatus, setClaudeStatus] = useState<ClaudeStatusData | null>(null);
+  const [gpsData, setGpsData] = useState<GPSData | null>(null);
+  const [weatherData, setWeatherData] = useState<WeatherData | null>(null);
 
   // Base64をBlobに変換するヘルパー関数
   const base64ToBlob = useCallback((base64: string, mimeType: string): Blob => {
@@ -299,6 +334,16 @@ export const useWebSocket = () => {
       console.log('Claude状態受信:', data);
     });
 
+    // GPS位置更新（サーバーからプッシュ）
+    newSocket.on('gps_update', (update: SensorUpdate<GPSData>) => {
+      setGpsData(update.data);
+    });
+
+    // 天気情報更新（サーバーからプッシュ）
+    newSocket.on('weather_update', (update: SensorUpdate<WeatherData>) => {
+      setWeatherData(update.data);
+    });
+
     setSocket(newSocket);
 
     // クリーンアップ
@@ -308,13 +353,14 @@ export const useWebSocket = () => {
   }, [base64ToBlob, speakWithBrowserTTS]);
 
   // 音声合成リクエスト
-  const synthesizeVoice = useCallback((text: string, speaker: number = 3, cache: string = 'use') => {
+  const synthesizeVoice = useCallback((text: string, speaker: number = 3, cache: string = 'use', lipsync: boolean = false) => {
     if (socket && connected && text.trim()) {
       socket.emit('voice_synthesize', {
         text: text.trim(),
         speaker,
         priority: 'normal',
-        cache: cache
+        cache: cache,
+        lipsync
       });
     } else {
       console.warn('WebSocket未接続または空のテキスト');
@@ -368,6 +414,8 @@ export const useWebSocket = () => {
     currentMandan,
     ollamaStatus,
     claudeStatus,
+    gpsData,
+    weatherData,
     synthesizeVoice,
     getSpeakers,
     getVoiceStatus,
@@ -0,0 +1,203 @@
+import { useEffect, useRef, useState } from 'react';
+import type { ZundamonExpression } from '../types/console';
+
+interface LayerBBox {
+  left: number;
+  top: number;
+  right: number;
+  bottom: number;
+}
+
+interface LayerEntry {
+  url: string;
+  bbox: LayerBBox | null;
+  z: number;
+  opacity: number;
+  blendMode: string;
+}
+
+interface LayerManifest {
+  fingerprint: string;
+  canvas: { width: number; height: number };
+  layers: Record<string, LayerEntry>;
+  clientCompositing: true;
+}
+
+// サーバーで合成する設定のときは clientCompositing: false だけが返る
+type LayersResponse = LayerManifest | { clientCompositing: false };
+
+const parseNumbers = (header: string | null): number[] | null => {
+  if (!header) return null;
+  const values = header.split(',').map(Number);
+  return values.some(Number.isNaN) ? null : values;
+};
+
+const toQuery = (expression: ZundamonExpression) => {
+  const queryParams = new URLSearchParams();
+  Object.entries(expression).forEach(([key, value]) => {
+    queryParams.append(key, value);
+  });
+  return queryParams;
+};
+
+// レイヤーの描画モード（サーバーの blend_kernels と同じもの以外は通常として描く）
+const COMPOSITE_OPERATIONS: Record<string, GlobalCompositeOperation> = {
+  'BlendMode.MULTIPLY': 'multiply',
+  'BlendMode.SCREEN': 'screen',
+  'BlendMode.OVERLAY': 'overlay'
+};
+
+// レイヤー一覧（ブラウザで合成しないなら null）・レイヤー画像・パラメータの解決結果は起動中ずっと使い回す
+let manifestPromise: Promise<LayerManifest | null> | null = null;
+const bitmapCache = new Map<string, Promise<ImageBitmap>>();
+const resolveCache = new Map<string, Promise<string[]>>();
+
+const loadLayerManifest = () => {
+  if (!manifestPromise) {
+    manifestPromise = fetch('/api/zundamon/layers')
+      .then(response => response.json())
+      .then(result => {
+        const data = result.success ? (result.data as LayersResponse) : null;
+        return data?.clientCompositing === true ? data : null;
+      })
+      .catch(error => {
+        console.error('ずんだもんレイヤー一覧の取得エラー:', error);
+        manifestPromise = null;
+        return null;
+      });
+  }
+  return manifestPromise;
+};
+
+const loadLayerBitmap = (url: string) => {
+  let bitmap = bitmapCache.get(url);
+  if (!bitmap) {
+    bitmap = fetch(url)
+      .then(response => {
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.blob();
+      })
+      .then(blob => createImageBitmap(blob));
+    bitmap.catch(() => bitmapCache.delete(url));
+    bitmapCache.set(url, bitmap);
+  }
+  return bitmap;
+};
+
+// どのレイヤーを重ねるかはサーバーが決める（下から順のレイヤー名）
+const resolveLayers = (query: string) => {
+  let layers = resolveCache.get(query);
+  if (!layers) {
+    layers = fetch(`/api/zundamon/layers/resolve?${query}`)
+      .then(response => response.json())
+      .then(result => {
+        if (!result.success) throw new Error(result.error);
+        return result.data.layers as string[];
+      });
+    layers.catch(() => resolveCache.delete(query));
+    resolveCache.set(query, layers);
+  }
+  return layers;
+};
+
+// 表情が変わったら、変わった範囲の画像（/api/zundamon/patch）だけを取得してキャンバスに描く。
+// サーバーの設定（compositor.client_compositing）が有効なら、レイヤー画像をブラウザで重ねる
+export const useZundamonCanvas = (expression: ZundamonExpression) => {
+  const canvasRef = useRef<HTMLCanvasElement>(null);
+  // キャンバスに描かれている画像のハッシュ（次の差分の基準）
+  const contentKeyRef = useRef<string | null>(null);
+  const [ready, setReady] = useState(false);
+
+  useEffect(() => {
+    let cancelled = false;
+    const queryParams = toQuery(expression);
+
+    const resizeCanvas = (canvas: HTMLCanvasElement, width: number, height: number) => {
+      if (canvas.width !== width || canvas.height !== height) {
+        canvas.width = width;
+        canvas.height = height;
+      }
+    };
+
+    const drawLayers = async (manifest: LayerManifest) => {
+      const layerNames = (await resolveLayers(queryParams.toString()))
+        .filter(layerName => manifest.layers[layerName]);
+      const bitmaps = await Promise.all(
+        layerNames.map(layerName => loadLayerBitmap(manifest.layers[layerName].url))
+      );
+      const canvas = canvasRef.current;
+      const context = canvas?.getContext('2d');
+      if (cancelled || !canvas || !context) return;
+
+      resizeCanvas(canvas, manifest.canvas.width, manifest.canvas.height);
+      context.clearRect(0, 0, canvas.width, canvas.height);
+      layerNames.forEach((layerName, index) => {
+        const { bbox, opacity, blendMode } = manifest.layers[layerName];
+        const bitmap = bitmaps[index];
+        // 位置情報がない場合は中央配置
+        const x = bbox ? bbox.left : Math.floor((canvas.width - bitmap.width) / 2);
+        const y = bbox ? bbox.top : Math.floor((canvas.height - bitmap.height) / 2);
+        context.globalAlpha = opacity / 255;
+        context.globalCompositeOperation = COMPOSITE_OPERATIONS[blendMode] ?? 'source-over';
+        context.drawImage(bitmap, x, y);
+      });
+      context.globalAlpha = 1;
+      context.globalCompositeOperation = 'source-over';
+      setReady(true);
+    };
+
+    const applyPatch = async () => {
+      if (contentKeyRef.current) {
+        queryParams.append('from', contentKeyRef.current);
+      }
+      const response = await fetch(`/api/zundamon/patch?${queryParams.toString()}`);
+      if (cancelled) return;
+      const contentKey = response.headers.get('X-Content-Key');
+      if (response.status === 204) {
+        contentKeyRef.current = contentKey;
+        return;
+      }
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+
+      const rect = parseNumbers(response.headers.get('X-Patch-Rect'));
+      const canvasSize = parseNumbers(response.headers.get('X-Canvas-Size'));
+      const bitmap = await createImageBitmap(await response.blob());
+      const canvas = canvasRef.current;
+      const context = canvas?.getContext('2d');
+      if (cancelled || !canvas || !context || !rect || !canvasSize) return;
+
+      const [x, y, width, height] = rect;
+      resizeCanvas(canvas, canvasSize[0], canvasSize[1]);
+      // 差分は範囲内の画素をすべて置き換える（透明な部分も含む）ので、消してから描く
+      context.clearRect(x, y, width, height);
+      context.drawImage(bitmap, x, y);
+      bitmap.close();
+      contentKeyRef.current = contentKey;
+      setReady(true);
+    };
+
+    const update = async () => {
+      const manifest = await loadLayerManifest();
+      if (cancelled) return;
+      if (manifest) {
+        await drawLayers(manifest);
+      } else {
+        await applyPatch();
+      }
+    };
+
+    update().catch(error => {
+      // 次回はキャンバス全体を取り直す
+      contentKeyRef.current = null;
+      console.error('ずんだもん画像の更新エラー:', error);
+    });
+
+    return () => {
+      cancelled = true;
+    };
+  }, [expression]);
+
+  return { canvasRef, ready };
+};
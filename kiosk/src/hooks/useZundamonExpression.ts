@@ -67,14 +67,6 @@ export const useZundamonExpression = (rpm: number, systemAlerts: SystemAlert[] =
     return getExpressionForRPM(rpmRange);
   }, [rpm]);
 
-  const zundamonUrl = useMemo(() => {
-    const queryParams = new URLSearchParams();
-    Object.entries(expression).forEach(([key, value]) => {
-      queryParams.append(key, value);
-    });
-    return `/api/zundamon/generate?${queryParams.toString()}`;
-  }, [expression]);
-
   // メッセージを取得する関数
   const getMessage = useMemo(() => {
     // 最も重要な警告を取得（優先度: danger > warning > normal）
@@ -128,7 +120,6 @@ export const useZundamonExpression = (rpm: number, systemAlerts: SystemAlert[] =
 
   return {
     expression,
-    zundamonUrl,
     rpmRange: getRPMRange(rpm),
     message: getMessage
   };
@@ -48,6 +48,8 @@ export const MandanMode = () => {
     currentMandan,
     ollamaStatus,
     claudeStatus,
+    gpsData: pushedGpsData,
+    weatherData: pushedWeatherData,
     // synthesizeVoice,
     // getSpeakers,
     generateMandan,
@@ -117,7 +119,16 @@ export const MandanMode = () => {
     return () => clearInterval(interval);
   }, []);
 
-  // APIからデータを取得
+  // サーバーからプッシュされたセンサーデータを反映
+  useEffect(() => {
+    if (pushedGpsData) setGpsData(pushedGpsData);
+  }, [pushedGpsData]);
+
+  useEffect(() => {
+    if (pushedWeatherData) setWeatherData(pushedWeatherData);
+  }, [pushedWeatherData]);
+
+  // APIから初期データを取得（以降の更新はgps_update / weather_updateで受信）
   useEffect(() => {
     const fetchData = async () => {
       try {
@@ -152,9 +163,6 @@ export const MandanMode = () => {
     };
 
     fetchData();
-    // 30秒ごとにデータを更新
-    // const interval = setInterval(fetchData, 30000);
-    // return () => clearInterval(interval);
   }, []);
 
   // 漫談生成テスト（Ollama）
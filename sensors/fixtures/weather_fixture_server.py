@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+天気APIフィクスチャサーバー
+Open-Meteo互換の /v1/forecast を模擬し、東から西へ移動する雨域を返す。
+実APIのクォータを消費せずに雨到達予測を動作確認するためのローカルサーバー。
+
+Usage: python weather_fixture_server.py [--port 8765] [--rain-lon 139.9] [--speed-kmh 30]
+"""
+
+import argparse
+import json
+import math
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FixtureWeather:
+    """経度 rain_lon より東側に雨域があり、speed_kmh で西へ移動するモデル"""
+
+    def __init__(self, rain_lon, speed_kmh, intensity_mm, start_time=None):
+        self.rain_lon = rain_lon
+        self.speed_kmh = speed_kmh
+        self.intensity_mm = intensity_mm
+        self.start_time = start_time or time.time()
+
+    def precipitation(self, lat, lon, timestamp):
+        km_per_deg = 111.32 * math.cos(math.radians(lat))
+        front_lon = self.rain_lon - (timestamp - self.start_time) / 3600.0 * self.speed_kmh / km_per_deg
+        return self.intensity_mm if lon >= front_lon else 0.0
+
+
+def make_handler(weather):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        request_count = 0
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/v1/forecast":
+                self.send_error(404)
+                return
+
+            FixtureHandler.request_count += 1
+            query = parse_qs(url.query)
+            lats = [float(v) for v in query["latitude"][0].split(",")]
+            lons = [float(v) for v in query["longitude"][0].split(",")]
+            steps = int(query.get("forecast_minutely_15", ["12"])[0])
+            start = int(time.time() // 900 * 900)
+            times = [start + 900 * i for i in range(steps)]
+
+            results = [{
+                "latitude": lat,
+                "longitude": lon,
+                "minutely_15": {
+                    "time": times,
+                    "precipitation": [weather.precipitation(lat, lon, t) for t in times]
+                }
+            } for lat, lon in zip(lats, lons)]
+            body = json.dumps(results if len(results) > 1 else results[0]).encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            print(f"[FIXTURE] request #{FixtureHandler.request_count}: {self.command} {urlparse(self.path).path}")
+
+    return FixtureHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-Meteo互換の天気フィクスチャサーバー")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rain-lon", type=float, default=139.9, help="雨域の西端の経度")
+    parser.add_argument("--speed-kmh", type=float, default=30.0, help="雨域の西進速度")
+    parser.add_argument("--intensity", type=float, default=5.0, help="降水量 (mm/h)")
+    args = parser.parse_args()
+
+    weather = FixtureWeather(args.rain_lon, args.speed_kmh, args.intensity)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(weather))
+    print(f"[INFO] Weather fixture server listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[INFO] Weather fixture server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,23 @@
 """
 GPIO シャットダウンスクリプト - ダミーファイル
 このファイルはダミーです。実際の開発時に置き換えてください。
+gpiochip（libgpiod）が使える環境ではエッジイベントで監視し、使えなければポーリングにフォールバックする。
 """
 
+import argparse
+import os
 import time
 import signal
 import sys
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+try:
+    import gpiod
+    from gpiod.line import Bias, Direction, Edge, Value
+except ImportError:
+    gpiod = None
 
 class GPIOShutdownMonitor:
     """GPIO シャットダウン監視クラス（ダミー実装）"""
@@ -58,17 +69,20 @@ class GPIOShutdownMonitor:
         """セーフシャットダウン実行"""
         print("[WARNING] Safe shutdown initiated...")
 
-        # LED を点滅させてシャットダウン中を示す
-        for i in range(5):
-            self.set_led_status(True)
-            time.sleep(0.5)
-            self.set_led_status(False)
-            time.sleep(0.5)
+        # コールバック実行中はLEDを点滅させてシャットダウン中を示す
+        blinking = threading.Event()
+        blinker = threading.Thread(target=self._blink_led, args=(blinking,), daemon=True)
+        blinker.start()
 
-        # シャットダウンコールバックがあれば実行
-        if self.shutdown_callback:
-            print("[INFO] Executing shutdown callback...")
-            self.shutdown_callback()
+        try:
+            # シャットダウンコールバックがあれば実行
+            if self.shutdown_callback:
+                print("[INFO] Executing shutdown callback...")
+                self.shutdown_callback()
+        finally:
+            blinking.set()
+            blinker.join()
+            self.set_led_status(False)
 
         # システムシャットダウン（ダミー実装）
         print("[DUMMY] Executing system shutdown...")
@@ -78,6 +92,14 @@ class GPIOShutdownMonitor:
 
         print("[INFO] System shutdown complete")
 
+    def _blink_led(self, stop_event, interval=0.25):
+        """stop_event がセットされるまでLEDを点滅"""
+        status = True
+        while not stop_event.is_set():
+            self.set_led_status(status)
+            status = not status
+            stop_event.wait(interval)
+
     def start_monitoring(self, callback=None):
         """監視開始"""
         self.shutdown_callback = callback
@@ -113,6 +135,227 @@ class GPIOShutdownMonitor:
         print("[INFO] Stopping GPIO monitoring...")
         self.is_monitoring = False
 
+class GpiodChip:
+    """gpiochip キャラクタデバイス（libgpiod v2）"""
+
+    def __init__(self, path="/dev/gpiochip0"):
+        self.path = path
+        self.active = Value.ACTIVE
+        self.inactive = Value.INACTIVE
+
+    def request_lines(self, shutdown_pin, led_pin, debounce):
+        """シャットダウンピンを立ち下がりエッジ検出・カーネル側デバウンス付きで要求"""
+        return gpiod.request_lines(
+            self.path,
+            consumer="kiosk-shutdown",
+            config={
+                shutdown_pin: gpiod.LineSettings(
+                    direction=Direction.INPUT,
+                    edge_detection=Edge.FALLING,
+                    bias=Bias.PULL_UP,
+                    debounce_period=timedelta(seconds=debounce)
+                ),
+                led_pin: gpiod.LineSettings(direction=Direction.OUTPUT, output_value=Value.INACTIVE)
+            }
+        )
+
+
+class SimulatedEdgeEvent:
+    """シミュレートしたエッジイベント（gpiod.EdgeEvent 互換の属性のみ）"""
+
+    def __init__(self, line_offset, event_type):
+        self.line_offset = line_offset
+        self.event_type = event_type
+        self.timestamp_ns = time.monotonic_ns()
+
+
+class SimulatedLineRequest:
+    """gpiod.LineRequest 互換のシミュレーション
+
+    入力は内部プルアップ（High）から始まり、set_input() で変化させる。
+    値が debounce 秒間安定した時点でエッジイベントを発行する（カーネルのデバウンスと同じ挙動）。
+    """
+
+    def __init__(self, shutdown_pin, led_pin, debounce):
+        self.shutdown_pin = shutdown_pin
+        self.led_pin = led_pin
+        self.debounce = debounce
+        self._values = {shutdown_pin: True, led_pin: False}
+        self._reported = True
+        self._events = []
+        self._timer = None
+        self._condition = threading.Condition()
+
+    def set_input(self, level):
+        """シャットダウンピンの入力レベルを変更（チャタリングも再現できる）"""
+        with self._condition:
+            self._values[self.shutdown_pin] = bool(level)
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self._settle)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def press(self, duration=0.5):
+        """ボタンを押して離す（Low → High）"""
+        self.set_input(False)
+        time.sleep(duration)
+        self.set_input(True)
+
+    def _settle(self):
+        with self._condition:
+            level = self._values[self.shutdown_pin]
+            if level == self._reported:
+                return
+            self._reported = level
+            if not level:
+                self._events.append(SimulatedEdgeEvent(self.shutdown_pin, "FALLING_EDGE"))
+                self._condition.notify_all()
+
+    def wait_edge_events(self, timeout=None):
+        with self._condition:
+            return self._condition.wait_for(lambda: self._events, timeout=timeout)
+
+    def read_edge_events(self):
+        with self._condition:
+            events, self._events = self._events, []
+            return events
+
+    def get_value(self, offset):
+        return self._values[offset]
+
+    def set_value(self, offset, value):
+        self._values[offset] = bool(value)
+
+    def release(self):
+        if self._timer:
+            self._timer.cancel()
+
+
+class SimulatedGpioChip:
+    """ハードウェアなしで動作確認するための gpiochip シミュレーション"""
+
+    def __init__(self):
+        self.request = None
+        self.active = True
+        self.inactive = False
+
+    def request_lines(self, shutdown_pin, led_pin, debounce):
+        self.request = SimulatedLineRequest(shutdown_pin, led_pin, debounce)
+        return self.request
+
+
+class EdgeShutdownMonitor(GPIOShutdownMonitor):
+    """gpiochip のエッジイベントでシャットダウンボタンを監視
+
+    ピンをポーリングせず、カーネルが検出した立ち下がりエッジを待ち受ける。
+    デバウンスもカーネル側で行われる。
+    """
+
+    def __init__(self, chip, shutdown_pin=18, led_pin=24, debounce=0.1, stop_check_interval=1.0):
+        self.chip = chip
+        self.shutdown_pin = shutdown_pin
+        self.led_pin = led_pin
+        self.debounce = debounce
+        self.stop_check_interval = stop_check_interval
+        self.is_monitoring = False
+        self.shutdown_callback = None
+        self.request = None
+        print(f"[INFO] EdgeShutdownMonitor initialized (shutdown_pin: {shutdown_pin}, led_pin: {led_pin}, debounce: {debounce}s)")
+
+    def setup_gpio(self):
+        """ラインを要求"""
+        self.request = self.chip.request_lines(self.shutdown_pin, self.led_pin, self.debounce)
+        print(f"[INFO] GPIO lines requested - shutdown pin: {self.shutdown_pin} (falling edge), LED pin: {self.led_pin}")
+
+    def cleanup_gpio(self):
+        """ラインを解放"""
+        if self.request:
+            self.request.release()
+            self.request = None
+        print("[INFO] GPIO lines released")
+
+    def set_led_status(self, status):
+        """LED ステータス設定"""
+        if self.request:
+            self.request.set_value(self.led_pin, self.chip.active if status else self.chip.inactive)
+
+    def read_shutdown_pin(self):
+        """シャットダウンピンの状態を読み取り（High = 通常）"""
+        return self.request.get_value(self.shutdown_pin) == self.chip.active
+
+    def wait_for_shutdown_edge(self):
+        """立ち下がりエッジを待つ（stop_monitoring されたら False を返す）"""
+        while self.is_monitoring:
+            # 停止要求を確認するためにだけタイムアウトする（ピンは読まない）
+            if not self.request.wait_edge_events(self.stop_check_interval):
+                continue
+            for event in self.request.read_edge_events():
+                event_type = getattr(event.event_type, "name", event.event_type)
+                if event.line_offset == self.shutdown_pin and event_type == "FALLING_EDGE":
+                    return True
+        return False
+
+    def start_monitoring(self, callback=None):
+        """監視開始"""
+        self.shutdown_callback = callback
+        self.is_monitoring = True
+
+        print("[INFO] Starting GPIO shutdown monitoring (edge events)...")
+        self.setup_gpio()
+
+        # システム起動完了を示すLED点灯
+        self.set_led_status(True)
+
+        try:
+            if self.wait_for_shutdown_edge():
+                print(f"[{datetime.now()}] Shutdown signal detected on pin {self.shutdown_pin}")
+                self.safe_shutdown()
+
+        except KeyboardInterrupt:
+            print("[INFO] GPIO monitoring stopped by user")
+        except Exception as e:
+            print(f"[ERROR] GPIO monitoring error: {e}")
+        finally:
+            self.cleanup_gpio()
+
+
+def create_shutdown_monitor(gpio_settings=None, simulate=False):
+    """
+    設定に応じたシャットダウン監視を作成
+
+    gpiochip が使えればエッジイベント方式、使えなければ従来のポーリング方式にフォールバックする。
+    """
+    gpio_settings = gpio_settings or {}
+    shutdown_pin = gpio_settings.get("shutdown_pin", 18)
+    led_pin = gpio_settings.get("led_pin", 24)
+    debounce = gpio_settings.get("button_debounce", 0.1)
+
+    if simulate:
+        return EdgeShutdownMonitor(SimulatedGpioChip(), shutdown_pin, led_pin, debounce)
+
+    chip_path = gpio_settings.get("chip", "/dev/gpiochip0")
+    if gpiod is not None and os.path.exists(chip_path):
+        return EdgeShutdownMonitor(GpiodChip(chip_path), shutdown_pin, led_pin, debounce)
+
+    reason = "gpiod not installed" if gpiod is None else f"{chip_path} not found"
+    print(f"[INFO] Edge-triggered GPIO unavailable ({reason}), falling back to polling")
+    return GPIOShutdownMonitor(shutdown_pin, led_pin)
+
+
+def load_gpio_settings(config_path):
+    """settings.yaml の gpio セクションを読み込む"""
+    try:
+        import yaml
+        with open(config_path, "r", encoding="utf-8") as f:
+            settings = yaml.safe_load(f) or {}
+        return (settings.get("gpio", {}), settings.get("shutdown", {}),
+                settings.get("development", {}).get("mock_gpio", False))
+    except Exception as e:
+        print(f"[ERROR] Failed to load {config_path}: {e}")
+        return {}, {}, False
+
+
 def signal_handler(signum, frame):
     """シグナルハンドラー"""
     print(f"\n[INFO] Received signal {signum}, shutting down gracefully...")
@@ -124,17 +367,37 @@ def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
+    parser = argparse.ArgumentParser(description="GPIO シャットダウン監視")
+    parser.add_argument("--config", default=str(Path(__file__).resolve().parent.parent / "config" / "settings.yaml"))
+    parser.add_argument("--simulate", action="store_true", help="シミュレートした gpiochip を使う")
+    parser.add_argument("--press-after", type=float, help="シミュレーション時、指定秒後にボタンを押す")
+    args = parser.parse_args()
+
+    gpio_settings, shutdown_settings, mock_gpio = load_gpio_settings(args.config)
+
     # GPIO監視開始
-    monitor = GPIOShutdownMonitor()
+    monitor = create_shutdown_monitor(gpio_settings, simulate=args.simulate or mock_gpio)
+
+    if args.press_after is not None and isinstance(monitor, EdgeShutdownMonitor):
+        def press_button():
+            time.sleep(args.press_after)
+            if isinstance(monitor.request, SimulatedLineRequest):
+                print("[INFO] Simulated button press")
+                monitor.request.press()
+        threading.Thread(target=press_button, daemon=True).start()
 
     def shutdown_callback():
         """シャットダウン時のコールバック"""
         print("[INFO] Executing pre-shutdown tasks...")
-        # 実際の実装では以下のような処理を行う：
-        # - アプリケーションの終了
-        # - データの保存
-        # - ログの出力
-        # - 外部デバイスの切断
+        # バックエンドにキャッシュ・状態の保存を依頼（制限時間はバックエンド側で管理）
+        backend_url = os.getenv("KIOSK_BACKEND_URL", gpio_settings.get("backend_url", "http://localhost:8000"))
+        timeout = shutdown_settings.get("flush_budget", 3.0) + 2.0
+        try:
+            import requests
+            response = requests.post(f"{backend_url}/api/system/prepare-shutdown", timeout=timeout)
+            print(f"[INFO] Backend state saved: {response.json().get('data')}")
+        except Exception as e:
+            print(f"[ERROR] Failed to save backend state: {e}")
         print("[INFO] Pre-shutdown tasks completed")
 
     try:
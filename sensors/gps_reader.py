@@ -1,74 +1,425 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-GPS読み取りスクリプト - ダミーファイル
-このファイルはダミーです。実際の開発時に置き換えてください。
+GPS読み取りスクリプト
+シリアル / pty のNMEAストリーム（GGA/RMC/VTG）をバックグラウンドで読み取り、
+固定長リングバッファに測位結果を蓄積する。記録済みNMEAログのリプレイにも対応。
 """
 
-import time
 import json
-import random
-from datetime import datetime
+import math
+import sys
+import threading
+from array import array
+from datetime import datetime, timezone
+
+KNOTS_TO_KMH = 1.852
+
+
+class NMEAParser:
+    """ストリーミングNMEAパーサー
+
+    同一UTC時刻のGGA/RMC/VTGを1エポックとしてまとめ、測位結果（fix）を生成する。
+    VTGには時刻がないので、GGA/RMCで始まったエポックの途中に来たものだけを使う
+    （確定後に来たVTGは次のエポックに混ぜない）。
+    """
+
+    def __init__(self):
+        self._partial = b""
+        self._date = None
+        self._epoch = {}
+        self._epoch_sentences = set()
+
+    @staticmethod
+    def verify_checksum(sentence):
+        """チェックサムを検証（チェックサムなしの文は許容）"""
+        if '*' not in sentence:
+            return True
+        body, _, checksum = sentence[1:].partition('*')
+        calculated = 0
+        for char in body:
+            calculated ^= ord(char)
+        try:
+            return calculated == int(checksum[:2], 16)
+        except ValueError:
+            return False
+
+    @staticmethod
+    def _parse_coordinate(value, hemisphere):
+        """ddmm.mmmm形式を10進度に変換"""
+        if not value or not hemisphere:
+            return None
+        dot = value.find('.')
+        degree_digits = (dot if dot >= 0 else len(value)) - 2
+        degrees = float(value[:degree_digits])
+        minutes = float(value[degree_digits:])
+        coordinate = degrees + minutes / 60.0
+        return -coordinate if hemisphere in ('S', 'W') else coordinate
+
+    @staticmethod
+    def _parse_float(value):
+        return float(value) if value else None
+
+    def feed(self, data):
+        """受信データ（bytes）を投入し、確定したfixのリストを返す"""
+        self._partial += data
+        *lines, self._partial = self._partial.split(b"\n")
+
+        fixes = []
+        for line in lines:
+            fix = self.feed_line(line.decode('ascii', errors='ignore'))
+            if fix:
+                fixes.append(fix)
+        return fixes
+
+    def feed_line(self, line):
+        """NMEA 1行を投入し、エポックが確定した場合はfixを返す"""
+        sentence = line.strip()
+        if not sentence.startswith('$') or not self.verify_checksum(sentence):
+            return None
+
+        fields = sentence[1:].split('*')[0].split(',')
+        sentence_type = fields[0][-3:]
+
+        try:
+            if sentence_type == 'GGA':
+                return self._handle_timed(fields[1], 'GGA', self._parse_gga(fields))
+            if sentence_type == 'RMC':
+                return self._handle_timed(fields[1], 'RMC', self._parse_rmc(fields))
+            if sentence_type == 'VTG' and 'utc_time' in self._epoch:
+                self._epoch.update(self._parse_vtg(fields))
+        except (IndexError, ValueError):
+            # 途中で切れた文や不正な値は読み飛ばす
+            return None
+        return None
+
+    def flush(self):
+        """未確定のエポックを強制的にfixとして確定"""
+        fix = self._build_fix()
+        self._epoch = {}
+        self._epoch_sentences = set()
+        return fix
+
+    def reset(self):
+        """読みかけの行とエポックを捨てる（デバイスを開き直したとき）"""
+        self._partial = b""
+        self._epoch = {}
+        self._epoch_sentences = set()
+
+    def _handle_timed(self, utc_time, sentence_type, values):
+        """時刻付きの文をエポックにまとめる"""
+        fix = None
+        if self._epoch.get('utc_time') not in (None, utc_time):
+            # 時刻が変わったら前のエポックを確定
+            fix = self.flush()
+
+        self._epoch['utc_time'] = utc_time
+        self._epoch.update(values)
+        self._epoch_sentences.add(sentence_type)
+
+        if fix is None and self._epoch_sentences >= {'GGA', 'RMC'}:
+            fix = self.flush()
+        return fix
+
+    def _parse_gga(self, fields):
+        quality = int(fields[6] or 0)
+        values = {
+            'fix_quality': quality,
+            'satellites': int(fields[7] or 0),
+            'hdop': self._parse_float(fields[8]),
+            'altitude': self._parse_float(fields[9]),
+        }
+        if quality > 0:
+            values['latitude'] = self._parse_coordinate(fields[2], fields[3])
+            values['longitude'] = self._parse_coordinate(fields[4], fields[5])
+        return values
+
+    def _parse_rmc(self, fields):
+        values = {}
+        if fields[9]:
+            self._date = fields[9]
+        if fields[2] == 'A':
+            values['latitude'] = self._parse_coordinate(fields[3], fields[4])
+            values['longitude'] = self._parse_coordinate(fields[5], fields[6])
+            if fields[7]:
+                values['speed'] = float(fields[7]) * KNOTS_TO_KMH
+            if fields[8]:
+                values['heading'] = float(fields[8])
+        return values
+
+    def _parse_vtg(self, fields):
+        values = {}
+        if fields[1]:
+            values['heading'] = float(fields[1])
+        if fields[7]:
+            values['speed'] = float(fields[7])
+        elif fields[5]:
+            values['speed'] = float(fields[5]) * KNOTS_TO_KMH
+        return values
+
+    def _build_fix(self):
+        if self._epoch.get('latitude') is None or self._epoch.get('longitude') is None:
+            return None
+
+        fix = dict(self._epoch)
+        fix['timestamp'] = self._epoch_timestamp(fix.pop('utc_time', None))
+        return fix
+
+    def _epoch_timestamp(self, utc_time):
+        """NMEAの日付・時刻からUNIX時刻を算出"""
+        now = datetime.now(timezone.utc)
+        if not utc_time:
+            return now.timestamp()
+
+        if self._date:
+            day, month, year = int(self._date[0:2]), int(self._date[2:4]), 2000 + int(self._date[4:6])
+        else:
+            day, month, year = now.day, now.month, now.year
+
+        seconds = float(utc_time[4:])
+        stamp = datetime(year, month, day, int(utc_time[0:2]), int(utc_time[2:4]), int(seconds),
+                         int((seconds % 1) * 1_000_000), tzinfo=timezone.utc)
+        return stamp.timestamp()
+
+
+class GPSRingBuffer:
+    """配列ベースの固定長リングバッファ（最新fixをO(1)で取得）"""
+
+    FIELDS = ('timestamp', 'latitude', 'longitude', 'altitude', 'speed',
+              'heading', 'satellites', 'fix_quality', 'hdop')
+
+    def __init__(self, capacity=600):
+        self.capacity = capacity
+        self._width = len(self.FIELDS)
+        self._data = array('d', [math.nan]) * (capacity * self._width)
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, fix):
+        """fixを書き込む（古いものから上書き）"""
+        row = [fix.get(field) for field in self.FIELDS]
+        offset = self._head * self._width
+        with self._lock:
+            for i, value in enumerate(row):
+                self._data[offset + i] = math.nan if value is None else value
+            self._head = (self._head + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def _row(self, index):
+        offset = index * self._width
+        fix = {}
+        for i, field in enumerate(self.FIELDS):
+            value = self._data[offset + i]
+            fix[field] = None if math.isnan(value) else value
+        for field in ('satellites', 'fix_quality'):
+            if fix[field] is not None:
+                fix[field] = int(fix[field])
+        return fix
+
+    def latest(self):
+        """最新のfixを取得"""
+        with self._lock:
+            if self._count == 0:
+                return None
+            return self._row((self._head - 1) % self.capacity)
+
+    def recent(self, n):
+        """新しい順に最大n件のfixを取得"""
+        with self._lock:
+            n = min(n, self._count)
+            return [self._row((self._head - 1 - i) % self.capacity) for i in range(n)]
+
 
 class GPSReader:
-    """GPS読み取りクラス（ダミー実装）"""
+    """GPS読み取りクラス
+
+    device_path のシリアル / pty、または replay_path のNMEAログを
+    バックグラウンドスレッドで読み取り、リングバッファに蓄積する。
+    """
 
-    def __init__(self, device_path="/dev/ttyUSB0"):
+    def __init__(self, device_path="/dev/ttyUSB0", baudrate=9600, buffer_size=600,
+                 replay_path=None, replay_speed=1.0, replay_loop=True, municipality_index=None):
         """初期化"""
         self.device_path = device_path
+        self.baudrate = baudrate
+        self.replay_path = replay_path
+        self.replay_speed = replay_speed
+        self.replay_loop = replay_loop
+        self.buffer = GPSRingBuffer(buffer_size)
+        self.municipality_index = municipality_index
+        self._last_municipality = None
+        self.parser = NMEAParser()
         self.is_connected = False
-        self.current_location = None
-        print(f"[DUMMY] GPSReader initialized for device: {device_path}")
+        self._source = None
+        self._reader_thread = None
+        self._stop_event = threading.Event()
+        self._callbacks = []
+        self.reconnect_delay = 1.0
+        self.max_reconnect_delay = 30.0
+        source = f"replay: {replay_path}" if replay_path else f"device: {device_path}"
+        print(f"[INFO] GPSReader initialized for {source}")
 
     def connect(self):
-        """GPS デバイスに接続（ダミー実装）"""
-        print("[DUMMY] Connecting to GPS device...")
-        # 実際の実装では serial ポートを開く
-        self.is_connected = True
-        print("[DUMMY] GPS device connected successfully")
-        return True
+        """GPS デバイス（またはリプレイログ）を開く"""
+        try:
+            if self.replay_path:
+                self._source = open(self.replay_path, 'rb')
+            else:
+                try:
+                    import serial
+                    self._source = serial.Serial(self.device_path, self.baudrate, timeout=1)
+                except ImportError:
+                    # pyserialがない環境ではptyなどを直接開く
+                    self._source = open(self.device_path, 'rb', buffering=0)
+            self.is_connected = True
+            print("[INFO] GPS source opened successfully")
+            return True
+        except Exception as e:
+            print(f"[ERROR] Failed to open GPS source: {e}")
+            self.is_connected = False
+            return False
 
     def disconnect(self):
         """GPS デバイスから切断"""
-        print("[DUMMY] Disconnecting from GPS device...")
+        self._stop_event.set()
+        if self._reader_thread and self._reader_thread is not threading.current_thread():
+            self._reader_thread.join(timeout=2)
+        self._reader_thread = None
+        if self._source:
+            try:
+                self._source.close()
+            except Exception:
+                pass
+            self._source = None
         self.is_connected = False
-        print("[DUMMY] GPS device disconnected")
+        print("[INFO] GPS device disconnected")
+
+    def start(self):
+        """バックグラウンド読み取りスレッドを開始"""
+        if self._reader_thread and self._reader_thread.is_alive():
+            return True
+        if not self.is_connected and not self.connect():
+            return False
+
+        self._stop_event.clear()
+        self._reader_thread = threading.Thread(target=self._reader_loop, name="gps-reader", daemon=True)
+        self._reader_thread.start()
+        return True
+
+    def add_listener(self, callback):
+        """新しいfixを受け取るコールバックを登録（読み取りスレッドから呼ばれる）"""
+        self._callbacks.append(callback)
+
+    def _reopen(self):
+        """読み取りエラー・EOF（デバイスが抜けた、ptyの書き手が閉じた）の後に開き直す
+
+        開けるまで待ち時間を倍にしながら繰り返す。停止されたら False を返す。
+        """
+        delay = self.reconnect_delay
+        while not self._stop_event.is_set():
+            if self._source:
+                try:
+                    self._source.close()
+                except Exception:
+                    pass
+                self._source = None
+            self.is_connected = False
+            self.parser.reset()
+            if self._stop_event.wait(delay):
+                break
+            if self.connect():
+                return True
+            delay = min(delay * 2, self.max_reconnect_delay)
+        return False
+
+    def _reader_loop(self):
+        """NMEAストリームを読み続けてリングバッファに書き込む"""
+        last_fix_time = None
+        while not self._stop_event.is_set():
+            try:
+                line = self._source.readline()
+            except Exception as e:
+                print(f"[ERROR] GPS read error: {e}")
+                if not self._reopen():
+                    break
+                continue
+
+            if not line:
+                if self.replay_path:
+                    # ログ末尾の改行なし行とエポックを確定
+                    for fix in self.parser.feed(b"\n"):
+                        self._on_fix(fix)
+                    self._on_fix(self.parser.flush())
+                    if not self.replay_loop:
+                        break
+                    self._source.seek(0)
+                    last_fix_time = None
+                elif getattr(self._source, 'timeout', None) is None:
+                    # pyserial はタイムアウトでも空を返すが、直接開いたデバイスの空はEOF
+                    print("[WARNING] GPS source reached EOF, reopening")
+                    if not self._reopen():
+                        break
+                continue
+
+            for fix in self.parser.feed(line):
+                if self.replay_path and self.replay_speed > 0 and last_fix_time is not None:
+                    # 記録時の時間間隔を再現
+                    delay = (fix['timestamp'] - last_fix_time) / self.replay_speed
+                    if 0 < delay < 60:
+                        self._stop_event.wait(delay)
+                last_fix_time = fix['timestamp']
+                self._on_fix(fix)
+
+    def _on_fix(self, fix):
+        if not fix:
+            return
+        self.buffer.append(fix)
+        for callback in self._callbacks:
+            try:
+                callback(fix)
+            except Exception as e:
+                print(f"[ERROR] GPS callback error: {e}")
+
+    def seed_fix(self, fix):
+        """前回終了時の最終fixをリングバッファに書き込む（リスナーには通知しない）"""
+        if len(self.buffer) == 0:
+            self.buffer.append(fix)
 
     def read_position(self):
-        """現在位置を読み取り（ダミー実装）"""
-        if not self.is_connected:
-            print("[ERROR] GPS device not connected")
+        """最新の位置を取得（リングバッファの先頭をO(1)で参照）"""
+        latest = self.buffer.latest()
+        if latest is None:
             return None
 
-        # ダミーデータ（東京駅周辺の座標をランダムに生成）
-        base_lat = 35.6812
-        base_lon = 139.7671
-
-        # 少しランダムに変動させる
-        lat = base_lat + random.uniform(-0.001, 0.001)
-        lon = base_lon + random.uniform(-0.001, 0.001)
-
-        position_data = {
-            "timestamp": datetime.now().isoformat(),
-            "latitude": lat,
-            "longitude": lon,
-            "altitude": random.uniform(0, 50),  # 高度（メートル）
-            "speed": random.uniform(0, 60),     # 速度（km/h）
-            "heading": random.uniform(0, 360),  # 方位角
-            "satellites": random.randint(4, 12), # 衛星数
-            "quality": "good"  # GPS品質
+        return {
+            "timestamp": datetime.fromtimestamp(latest["timestamp"], timezone.utc).isoformat(),
+            "latitude": latest["latitude"],
+            "longitude": latest["longitude"],
+            "altitude": latest["altitude"],    # 高度（メートル）
+            "speed": latest["speed"],          # 速度（km/h）
+            "heading": latest["heading"],      # 方位角
+            "satellites": latest["satellites"],  # 衛星数
+            "quality": "good" if (latest["fix_quality"] or 0) > 0 else "unknown"  # GPS品質
         }
 
-        self.current_location = position_data
-        print(f"[DUMMY] GPS Position: {lat:.6f}, {lon:.6f}")
-        return position_data
-
     def get_current_location(self):
         """現在位置を取得"""
-        return self.current_location
+        return self.read_position()
 
     def reverse_geocode(self, lat, lon):
-        """逆ジオコーディング（ダミー実装）"""
+        """逆ジオコーディング（市区町村索引があればオフラインで検索）"""
+        if self.municipality_index is not None:
+            municipality = self.municipality_index.locate(lat, lon, hint=self._last_municipality)
+            if municipality is None:
+                return {"country": "日本", "prefecture": None, "city": None, "district": None,
+                        "postal_code": None, "formatted_address": "不明"}
+            self._last_municipality = municipality
+            return municipality.to_address()
+
         print(f"[DUMMY] Reverse geocoding: {lat}, {lon}")
 
         # ダミーの住所データ
@@ -85,38 +436,35 @@ class GPSReader:
         return dummy_address
 
     def start_monitoring(self, callback=None, interval=1):
-        """位置監視を開始"""
-        print(f"[DUMMY] Starting GPS monitoring (interval: {interval}s)")
+        """位置監視を開始（読み取りスレッドからcallbackを呼ぶ。呼び出し元はブロックしない）"""
+        print("[INFO] Starting GPS monitoring")
+        if callback:
+            self.add_listener(callback)
+        return self.start()
 
-        try:
-            while self.is_connected:
-                position = self.read_position()
-                if position and callback:
-                    callback(position)
-                time.sleep(interval)
-        except KeyboardInterrupt:
-            print("[INFO] GPS monitoring stopped by user")
-        except Exception as e:
-            print(f"[ERROR] GPS monitoring error: {e}")
 
 def main():
     """メイン関数"""
-    gps = GPSReader()
+    replay_path = sys.argv[1] if len(sys.argv) > 1 else None
+    gps = GPSReader(replay_path=replay_path, replay_speed=0, replay_loop=False)
 
     try:
-        gps.connect()
+        gps.start_monitoring(
+            callback=lambda fix: print(f"[INFO] GPS Position: {fix['latitude']:.6f}, {fix['longitude']:.6f}")
+        )
+        if gps._reader_thread:
+            gps._reader_thread.join()
 
-        # 単発で位置を取得
         position = gps.read_position()
         if position:
             print(f"Current position: {json.dumps(position, indent=2, ensure_ascii=False)}")
+            print(f"Buffered fixes: {len(gps.buffer)}")
 
-            # 逆ジオコーディング
-            address = gps.reverse_geocode(position['latitude'], position['longitude'])
-            print(f"Address: {json.dumps(address, indent=2, ensure_ascii=False)}")
-
+    except KeyboardInterrupt:
+        print("[INFO] GPS monitoring stopped by user")
     finally:
         gps.disconnect()
 
+
 if __name__ == "__main__":
     main()
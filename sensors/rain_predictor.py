@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+雨到達予測エンジン
+格子状の降水予報（ナウキャスト）をエリア・時刻単位でキャッシュし、
+車の進行方向・速度から将来位置を推定して雨の到達時刻を算出する。
+"""
+
+import json
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import requests
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class ForecastTile:
+    """1エリア分の格子降水予報（precip[時刻, 緯度, 経度] mm/h）"""
+
+    def __init__(self, key, south, west, step_deg, times, precip, ttl):
+        self.key = key
+        self.south = south
+        self.west = west
+        self.step_deg = step_deg
+        self.times = np.asarray(times, dtype=np.float64)
+        self.precip = np.asarray(precip, dtype=np.float32)
+        self.expires_at = time.time() + ttl
+
+    def is_expired(self, now=None):
+        return (now or time.time()) >= self.expires_at
+
+    def sample(self, lats, lons, timestamps):
+        """各点・各時刻の降水量を最近傍格子で取得（ベクトル化）"""
+        n_times, n_lat, n_lon = self.precip.shape
+        iy = np.clip(np.rint((lats - self.south) / self.step_deg).astype(np.intp), 0, n_lat - 1)
+        ix = np.clip(np.rint((lons - self.west) / self.step_deg).astype(np.intp), 0, n_lon - 1)
+        it = np.clip(np.searchsorted(self.times, timestamps, side='right') - 1, 0, n_times - 1)
+        values = self.precip[it, iy, ix]
+        # 予報期間外は雨なし扱い
+        values[(timestamps < self.times[0]) | (timestamps > self.times[-1] + self._time_step())] = 0.0
+        return values
+
+    def _time_step(self):
+        return float(self.times[1] - self.times[0]) if len(self.times) > 1 else 0.0
+
+
+class OpenMeteoTileSource:
+    """Open-Meteo互換APIから15分間隔の格子降水予報を取得"""
+
+    def __init__(self, base_url="https://api.open-meteo.com", timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def fetch(self, south, west, step_deg, size, hours):
+        """size×size格子の降水予報を取得し (times, precip[t, y, x]) を返す"""
+        lats = [south + step_deg * iy for iy in range(size) for _ in range(size)]
+        lons = [west + step_deg * ix for _ in range(size) for ix in range(size)]
+
+        response = requests.get(
+            f"{self.base_url}/v1/forecast",
+            params={
+                "latitude": ",".join(f"{lat:.4f}" for lat in lats),
+                "longitude": ",".join(f"{lon:.4f}" for lon in lons),
+                "minutely_15": "precipitation",
+                "forecast_minutely_15": int(hours * 4),
+                "timeformat": "unixtime"
+            },
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        results = response.json()
+        if isinstance(results, dict):
+            results = [results]
+
+        times = results[0]["minutely_15"]["time"]
+        precip = np.array(
+            [[v if v is not None else 0.0 for v in r["minutely_15"]["precipitation"]] for r in results],
+            dtype=np.float32
+        )
+        # (地点, 時刻) → (時刻, 緯度, 経度)
+        return times, precip.T.reshape(len(times), size, size)
+
+
+class RainArrivalPredictor:
+    """進行方向に沿った雨到達予測
+
+    予報はtile_size_deg四方のタイル単位でキャッシュし、
+    車がタイルの外に出るかデータの有効期限が切れた時だけ再取得する。
+    """
+
+    def __init__(self, source, tile_size_deg=1.0, grid_step_deg=0.1, ttl=600,
+                 threshold_mm=0.5, horizon_hours=3, step_minutes=5, max_tiles=8):
+        self.source = source
+        self.tile_size_deg = tile_size_deg
+        self.grid_step_deg = grid_step_deg
+        self.ttl = ttl
+        self.threshold_mm = threshold_mm
+        self.horizon_hours = horizon_hours
+        self.step_minutes = step_minutes
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.fetch_count = 0
+
+    def get_tile(self, key):
+        """キャッシュ済みタイルを取得（なければ・期限切れなら取得）"""
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile and not tile.is_expired():
+                self._tiles.move_to_end(key)
+                return tile
+
+        south = key[0] * self.tile_size_deg
+        west = key[1] * self.tile_size_deg
+        size = int(round(self.tile_size_deg / self.grid_step_deg)) + 1
+        times, precip = self.source.fetch(south, west, self.grid_step_deg, size, self.horizon_hours)
+        tile = ForecastTile(key, south, west, self.grid_step_deg, times, precip, self.ttl)
+
+        with self._lock:
+            self.fetch_count += 1
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def project_route(self, lat, lon, heading, speed_kmh, offsets_s):
+        """等速直進を仮定して各時刻オフセットの位置を推定"""
+        distance_km = (speed_kmh or 0.0) * offsets_s / 3600.0
+        bearing = math.radians(heading or 0.0)
+        lats = lat + np.degrees(distance_km * math.cos(bearing) / EARTH_RADIUS_KM)
+        lons = lon + np.degrees(distance_km * math.sin(bearing) /
+                                (EARTH_RADIUS_KM * math.cos(math.radians(lat))))
+        return lats, lons
+
+    def predict(self, lat, lon, heading=None, speed_kmh=None, now=None):
+        """雨の到達予測を計算"""
+        now = now or time.time()
+        offsets = np.arange(0, self.horizon_hours * 3600 + 1, self.step_minutes * 60, dtype=np.float64)
+        lats, lons = self.project_route(lat, lon, heading, speed_kmh, offsets)
+        timestamps = now + offsets
+
+        # 経路上の点をタイルごとにまとめて降水量を引く
+        tile_lat = np.floor(lats / self.tile_size_deg).astype(np.int64)
+        tile_lon = np.floor(lons / self.tile_size_deg).astype(np.int64)
+        precip = np.zeros_like(offsets, dtype=np.float32)
+        for key_lat, key_lon in np.unique(np.stack([tile_lat, tile_lon], axis=1), axis=0).tolist():
+            key = (key_lat, key_lon)
+            mask = (tile_lat == key_lat) & (tile_lon == key_lon)
+            try:
+                tile = self.get_tile(key)
+            except Exception as e:
+                print(f"[ERROR] Forecast tile fetch failed {key}: {e}")
+                continue
+            precip[mask] = tile.sample(lats[mask], lons[mask], timestamps[mask])
+
+        rainy = precip >= self.threshold_mm
+        if not rainy.any():
+            return {
+                "is_rain_expected": False,
+                "hours_until_rain": None,
+                "intensity": None,
+                "duration_hours": None,
+                "precipitation": 0.0,
+                "probability": None
+            }
+
+        first = int(np.argmax(rainy))
+        # 到達後に連続して雨が続く区間
+        dry_after = np.flatnonzero(~rainy[first:])
+        rainy_steps = int(dry_after[0]) if dry_after.size else len(rainy) - first
+        peak = float(precip[first:first + rainy_steps].max())
+
+        return {
+            "is_rain_expected": True,
+            "hours_until_rain": float(offsets[first] / 3600.0),
+            "intensity": self.classify_intensity(peak),
+            "duration_hours": rainy_steps * self.step_minutes / 60.0,
+            "precipitation": peak,
+            "probability": None,
+            "arrival_position": {"latitude": float(lats[first]), "longitude": float(lons[first])}
+        }
+
+    @staticmethod
+    def classify_intensity(precip_mm):
+        """降水量（mm/h）から強さを分類"""
+        if precip_mm < 3:
+            return "light"
+        if precip_mm < 10:
+            return "moderate"
+        return "heavy"
+
+
+def main():
+    """メイン関数"""
+    base_url = sys.argv[1] if len(sys.argv) > 1 else "https://api.open-meteo.com"
+    predictor = RainArrivalPredictor(OpenMeteoTileSource(base_url))
+
+    # 東京駅から東へ時速40kmで走行中と仮定
+    result = predictor.predict(35.6812, 139.7671, heading=90, speed_kmh=40)
+    print(f"[{datetime.now()}] Rain arrival: {json.dumps(result, indent=2, ensure_ascii=False)}")
+    print(f"Tiles fetched: {predictor.fetch_count}")
+
+
+if __name__ == "__main__":
+    main()
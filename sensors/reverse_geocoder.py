@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+オフライン逆ジオコーダー
+ローカルの市区町村ポリゴン（GeoJSON）をグリッド索引で検索し、
+市区町村の出入りをヒステリシス付きで検出する。
+"""
+
+import json
+import math
+import sys
+import threading
+from pathlib import Path
+
+# 国土数値情報 行政区域データ（N03）のプロパティ名
+N03_PREFECTURE = "N03_001"
+N03_COUNTY = "N03_003"
+N03_CITY = "N03_004"
+N03_CODE = "N03_007"
+
+
+def _point_in_ring(x, y, xs, ys):
+    """レイキャスティング法による点の内外判定"""
+    inside = False
+    j = len(xs) - 1
+    for i in range(len(xs)):
+        xi, yi = xs[i], ys[i]
+        xj, yj = xs[j], ys[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class Municipality:
+    """市区町村ポリゴン（MultiPolygon・穴あき対応）"""
+
+    def __init__(self, index, properties, polygons):
+        self.index = index
+        self.prefecture = properties.get(N03_PREFECTURE) or properties.get("prefecture", "")
+        city_parts = [properties.get(N03_COUNTY), properties.get(N03_CITY)]
+        self.city = "".join(p for p in city_parts if p) or properties.get("city", "")
+        self.code = properties.get(N03_CODE) or properties.get("code")
+
+        # [(外周(xs, ys), [穴(xs, ys), ...]), ...]
+        self.parts = []
+        min_x = min_y = math.inf
+        max_x = max_y = -math.inf
+        for polygon in polygons:
+            rings = []
+            for ring in polygon:
+                xs = tuple(point[0] for point in ring)
+                ys = tuple(point[1] for point in ring)
+                rings.append((xs, ys))
+            outer, holes = rings[0], rings[1:]
+            self.parts.append((outer, holes))
+            min_x, max_x = min(min_x, min(outer[0])), max(max_x, max(outer[0]))
+            min_y, max_y = min(min_y, min(outer[1])), max(max_y, max(outer[1]))
+        self.bbox = (min_x, min_y, max_x, max_y)
+
+    @property
+    def name(self):
+        return f"{self.prefecture}{self.city}"
+
+    def contains(self, lon, lat):
+        """点がポリゴン内にあるか判定"""
+        min_x, min_y, max_x, max_y = self.bbox
+        if not (min_x <= lon <= max_x and min_y <= lat <= max_y):
+            return False
+        for outer, holes in self.parts:
+            if _point_in_ring(lon, lat, *outer) and not any(_point_in_ring(lon, lat, *hole) for hole in holes):
+                return True
+        return False
+
+    def to_address(self):
+        """GPSReader.reverse_geocode 互換の住所辞書に変換"""
+        return {
+            "country": "日本",
+            "prefecture": self.prefecture,
+            "city": self.city,
+            "district": None,
+            "postal_code": None,
+            "code": self.code,
+            "formatted_address": self.name
+        }
+
+
+class MunicipalityIndex:
+    """市区町村ポリゴンのグリッド空間索引"""
+
+    def __init__(self, municipalities, cell_size=0.05):
+        self.municipalities = municipalities
+        self.cell_size = cell_size
+        self.grid = {}
+
+        for municipality in municipalities:
+            min_x, min_y, max_x, max_y = municipality.bbox
+            for cx in range(self._cell(min_x), self._cell(max_x) + 1):
+                for cy in range(self._cell(min_y), self._cell(max_y) + 1):
+                    self.grid.setdefault((cx, cy), []).append(municipality)
+
+    @classmethod
+    def from_geojson(cls, path, cell_size=0.05):
+        """GeoJSON FeatureCollection から索引を構築"""
+        with open(path, 'r', encoding='utf-8') as f:
+            collection = json.load(f)
+
+        # N03 は飛び地や島ごとに別の地物になっているため、行政区域コードが同じ地物は1つの市区町村にまとめる
+        features = {}
+        for feature in collection.get("features", []):
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+            properties = feature.get("properties") or {}
+            code = properties.get(N03_CODE) or properties.get("code")
+            key = code if code else len(features)
+            if key in features:
+                features[key][1].extend(polygons)
+            else:
+                features[key] = (properties, list(polygons))
+
+        municipalities = [
+            Municipality(index, properties, polygons)
+            for index, (properties, polygons) in enumerate(features.values())
+        ]
+        print(f"[INFO] Loaded {len(municipalities)} municipalities from {path}")
+        return cls(municipalities, cell_size)
+
+    def _cell(self, value):
+        return math.floor(value / self.cell_size)
+
+    def locate(self, lat, lon, hint=None):
+        """座標を含む市区町村を検索（hintを最初に判定する高速パス付き）"""
+        if hint is not None and hint.contains(lon, lat):
+            return hint
+
+        for municipality in self.grid.get((self._cell(lon), self._cell(lat)), ()):
+            if municipality is not hint and municipality.contains(lon, lat):
+                return municipality
+        return None
+
+
+def same_municipality(a, b):
+    """同じ市区町村か（行政区域コードがあればコードで比較する）"""
+    if a is None or b is None:
+        return a is b
+    if a.code and b.code:
+        return a.code == b.code
+    return a is b
+
+
+class MunicipalityTracker:
+    """市区町村の出入りをヒステリシス付きで検出
+
+    新しい市区町村（または範囲外）が confirm_count 回連続した時点で
+    境界を越えたとみなし、exit / enter イベントを通知する。
+    """
+
+    def __init__(self, index, confirm_count=3):
+        self.index = index
+        self.confirm_count = confirm_count
+        self.current = None
+        self._initialized = False
+        self._last_seen = None
+        self._candidate = None
+        self._candidate_count = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """境界越えイベントのコールバックを登録"""
+        self._listeners.append(callback)
+
+    def update(self, lat, lon):
+        """新しい位置を投入し、発生したイベントのリストを返す"""
+        with self._lock:
+            hint = self._last_seen or self.current
+            municipality = self.index.locate(lat, lon, hint=hint)
+            self._last_seen = municipality
+
+            if self._initialized and same_municipality(municipality, self.current):
+                self._candidate = None
+                self._candidate_count = 0
+                return []
+
+            if not same_municipality(municipality, self._candidate):
+                self._candidate = municipality
+                self._candidate_count = 0
+            self._candidate_count += 1
+
+            # 最初の測位は即座に確定、それ以外は連続回数で確定
+            if self._initialized and self._candidate_count < self.confirm_count:
+                return []
+
+            # initial: 起動直後の最初の確定（境界を越えたわけではない）
+            initial = not self._initialized
+            events = []
+            if self.current is not None:
+                events.append({"type": "exit", "municipality": self.current.to_address(), "initial": False})
+            if municipality is not None:
+                events.append({"type": "enter", "municipality": municipality.to_address(), "initial": initial})
+
+            self.current = municipality
+            self._initialized = True
+            self._candidate = None
+            self._candidate_count = 0
+
+        for event in events:
+            for callback in self._listeners:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"[ERROR] Municipality event callback error: {e}")
+        return events
+
+
+def main():
+    """メイン関数"""
+    if len(sys.argv) < 4:
+        print("Usage: python reverse_geocoder.py <municipalities.geojson> <lat> <lon>")
+        sys.exit(1)
+
+    index = MunicipalityIndex.from_geojson(Path(sys.argv[1]))
+    municipality = index.locate(float(sys.argv[2]), float(sys.argv[3]))
+    if municipality:
+        print(json.dumps(municipality.to_address(), indent=2, ensure_ascii=False))
+    else:
+        print("[INFO] No municipality found")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""sensors のテスト共通設定（モジュールを sensors 直下から import する）"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,85 @@
+"""SimulatedGpioChip / EdgeShutdownMonitor のテスト"""
+
+import threading
+import time
+
+from gpio_shutdown import EdgeShutdownMonitor, SimulatedGpioChip
+
+DEBOUNCE = 0.05
+
+
+def chatter(request, levels, interval=0.005):
+    """debounce より短い間隔で入力を切り替える"""
+    for level in levels:
+        request.set_input(level)
+        time.sleep(interval)
+
+
+def test_chatter_within_debounce_produces_no_event():
+    request = SimulatedGpioChip().request_lines(18, 24, DEBOUNCE)
+    # 押されかけて戻る（最後は High）
+    chatter(request, [False, True, False, True, False, True])
+    assert not request.wait_edge_events(DEBOUNCE * 4)
+    assert request.read_edge_events() == []
+    request.release()
+
+
+def test_bouncing_press_produces_one_falling_edge():
+    request = SimulatedGpioChip().request_lines(18, 24, DEBOUNCE)
+    chatter(request, [False, True, False, True, False])
+    assert request.wait_edge_events(DEBOUNCE * 10)
+    time.sleep(DEBOUNCE * 2)
+    events = request.read_edge_events()
+    assert [(event.line_offset, event.event_type) for event in events] == [(18, "FALLING_EDGE")]
+    request.release()
+
+
+def test_falling_edge_calls_callback_exactly_once():
+    chip = SimulatedGpioChip()
+    monitor = EdgeShutdownMonitor(chip, debounce=DEBOUNCE, stop_check_interval=0.02)
+    calls = []
+    thread = threading.Thread(target=monitor.start_monitoring, args=(lambda: calls.append(time.monotonic()),),
+                              daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + 2
+    while monitor.request is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    request = chip.request
+    assert request is not None
+
+    # チャタリングしながら押して離す
+    chatter(request, [False, True, False])
+    time.sleep(DEBOUNCE * 3)
+    request.set_input(True)
+    thread.join(timeout=2)
+
+    assert not thread.is_alive()
+    assert len(calls) == 1
+    # 監視終了時にラインは解放される
+    assert monitor.request is None
+
+
+def test_stop_monitoring_without_edge():
+    chip = SimulatedGpioChip()
+    monitor = EdgeShutdownMonitor(chip, debounce=DEBOUNCE, stop_check_interval=0.02)
+    calls = []
+    thread = threading.Thread(target=monitor.start_monitoring, args=(lambda: calls.append(1),), daemon=True)
+    thread.start()
+    time.sleep(0.1)
+    monitor.stop_monitoring()
+    thread.join(timeout=2)
+
+    assert not thread.is_alive()
+    assert calls == []
+
+
+def test_release_stops_debounce_timer():
+    request = SimulatedGpioChip().request_lines(18, 24, DEBOUNCE)
+    request.set_input(False)
+    timer = request._timer
+    request.release()
+    timer.join(timeout=1)
+
+    assert not timer.is_alive()
+    assert not request.wait_edge_events(DEBOUNCE * 3)
@@ -0,0 +1,72 @@
+"""NMEAParser / GPSReader のテスト"""
+
+import time
+
+from gps_reader import GPSReader, NMEAParser
+
+
+def sentence(body):
+    checksum = 0
+    for char in body:
+        checksum ^= ord(char)
+    return f"${body}*{checksum:02X}"
+
+
+def gga(utc_time):
+    return sentence(f"GPGGA,{utc_time},3540.8010,N,13945.9230,E,1,08,0.9,10.0,M,39.0,M,,")
+
+
+def rmc(utc_time):
+    return sentence(f"GPRMC,{utc_time},A,3540.8010,N,13945.9230,E,10.0,90.0,191026,,,A")
+
+
+VTG_STOPPED = sentence("GPVTG,270.0,T,,M,0.0,N,0.0,K,A")
+
+
+def test_epoch_from_gga_and_rmc():
+    parser = NMEAParser()
+    assert parser.feed_line(gga("120000.00")) is None
+    fix = parser.feed_line(rmc("120000.00"))
+    assert round(fix['latitude'], 4) == 35.6800
+    assert round(fix['speed'], 2) == round(10.0 * 1.852, 2)
+    assert fix['heading'] == 90.0
+
+
+def test_vtg_after_completed_epoch_is_not_merged_into_next_fix():
+    parser = NMEAParser()
+    parser.feed_line(gga("120000.00"))
+    assert parser.feed_line(rmc("120000.00")) is not None
+    # 確定後に来た前のエポックの VTG
+    parser.feed_line(VTG_STOPPED)
+    parser.feed_line(gga("120001.00"))
+    fix = parser.flush()
+    assert 'speed' not in fix and 'heading' not in fix
+
+
+def test_vtg_inside_epoch_is_merged():
+    parser = NMEAParser()
+    parser.feed_line(gga("120000.00"))
+    parser.feed_line(VTG_STOPPED)
+    fix = parser.flush()
+    assert fix['heading'] == 270.0 and fix['speed'] == 0.0
+
+
+def test_eof_reopens_device_with_backoff(tmp_path):
+    device = tmp_path / "gps.nmea"
+    device.write_text(gga("120000.00") + "\n" + rmc("120000.00") + "\n")
+
+    reader = GPSReader(device_path=str(device))
+    reader.reconnect_delay = 0.05
+    reader.max_reconnect_delay = 0.1
+    opened = []
+    connect = reader.connect
+    reader.connect = lambda: opened.append(time.monotonic()) or connect()
+
+    assert reader.start()
+    time.sleep(0.5)
+    reader.disconnect()
+
+    # EOF のたびに待ってから開き直す（空読みで回り続けない）
+    assert 2 <= len(opened) <= 12
+    assert len(reader.buffer) >= 2
+    assert not reader.is_connected
@@ -0,0 +1,106 @@
+"""OpenMeteoTileSource / RainArrivalPredictor をフィクスチャサーバー（fixtures/weather_fixture_server.py）で動かすテスト"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+pytest.importorskip('requests')
+
+from fixtures.weather_fixture_server import FixtureWeather, make_handler
+from rain_predictor import OpenMeteoTileSource, RainArrivalPredictor
+
+# 東京駅付近（タイル (35, 139)）
+LAT = 35.6812
+KM_PER_DEG_LON = 111.32 * math.cos(math.radians(LAT))
+
+
+@contextmanager
+def fixture_server(weather):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(weather))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def slot_start():
+    """フィクスチャの予報の先頭時刻（15分単位）"""
+    return time.time() // 900 * 900
+
+
+def test_tile_source_returns_time_lat_lon_grid():
+    weather = FixtureWeather(rain_lon=139.5, speed_kmh=0, intensity_mm=5.0)
+    with fixture_server(weather) as base_url:
+        times, precip = OpenMeteoTileSource(base_url).fetch(35.0, 139.0, 0.1, 11, hours=1)
+
+    assert len(times) == 4
+    assert precip.shape == (4, 11, 11)
+    # 経度 139.5 から東が雨（緯度方向にはどこも同じ）
+    assert (precip[:, :, :5] == 0).all()
+    assert (precip[:, :, 5:] == 5.0).all()
+
+
+def test_rain_arrival_time():
+    start = slot_start()
+    # 雨域の西端は東京駅の格子点（139.8）から 9km 東、時速 30km で西へ移動
+    rain_lon = 139.8 + 9.0 / KM_PER_DEG_LON
+    weather = FixtureWeather(rain_lon=rain_lon, speed_kmh=30, intensity_mm=5.0, start_time=start)
+    with fixture_server(weather) as base_url:
+        predictor = RainArrivalPredictor(OpenMeteoTileSource(base_url))
+        result = predictor.predict(LAT, 139.7671, now=start)
+
+    # 9km / 30km/h = 18分後。予報は15分間隔なので 30分後の枠から雨
+    assert result["is_rain_expected"]
+    assert result["hours_until_rain"] == 0.5
+    assert result["intensity"] == "moderate"
+    assert result["precipitation"] == 5.0
+    assert predictor.fetch_count == 1
+
+
+def test_no_rain_within_horizon():
+    start = slot_start()
+    # 3時間で 90km しか進まないので届かない
+    weather = FixtureWeather(rain_lon=141.5, speed_kmh=30, intensity_mm=5.0, start_time=start)
+    with fixture_server(weather) as base_url:
+        predictor = RainArrivalPredictor(OpenMeteoTileSource(base_url))
+        result = predictor.predict(LAT, 139.7671, now=start)
+
+    assert not result["is_rain_expected"]
+    assert result["hours_until_rain"] is None
+    assert result["precipitation"] == 0.0
+
+
+def test_route_crossing_tile_boundary():
+    start = slot_start()
+    # 止まっている雨域（経度 140.3 から東）に向かって東へ走る。経路はタイル (35, 139) から (35, 140) へまたがる
+    weather = FixtureWeather(rain_lon=140.3, speed_kmh=0, intensity_mm=12.0, start_time=start)
+    speed_kmh = 0.4 * KM_PER_DEG_LON
+    with fixture_server(weather) as base_url:
+        predictor = RainArrivalPredictor(OpenMeteoTileSource(base_url), horizon_hours=2)
+        result = predictor.predict(LAT, 139.9, heading=90, speed_kmh=speed_kmh, now=start)
+        fetched = predictor.fetch_count
+        # タイルはキャッシュされ、同じ経路では取り直さない
+        predictor.predict(LAT, 139.9, heading=90, speed_kmh=speed_kmh, now=start)
+
+    # 2時間で経度 140.7 付近まで
+    assert set(predictor._tiles) == {(35, 139), (35, 140)}
+    assert fetched == 2 and predictor.fetch_count == 2
+
+    # 格子点 140.3 に最も近くなるのは経度 140.25 を越えたところ（約 0.875 時間後）
+    assert result["is_rain_expected"]
+    assert 0.8 <= result["hours_until_rain"] <= 1.0
+    assert 140.25 <= result["arrival_position"]["longitude"] <= 140.35
+    assert result["intensity"] == "heavy"
+
+    # タイルの境界（経度 140.0）と雨域の端は、東側のタイルの格子で引く
+    tile = predictor._tiles[(35, 140)]
+    values = tile.sample(np.array([LAT, LAT, LAT]), np.array([140.0, 140.24, 140.3]), np.full(3, start))
+    assert values.tolist() == [0.0, 0.0, 12.0]
@@ -0,0 +1,65 @@
+"""MunicipalityIndex / MunicipalityTracker のテスト（複数の地物に分かれた市区町村）"""
+
+import json
+
+from reverse_geocoder import Municipality, MunicipalityIndex, MunicipalityTracker
+
+
+def square(min_x, min_y, size=0.1):
+    return [[[min_x, min_y], [min_x + size, min_y], [min_x + size, min_y + size],
+             [min_x, min_y + size], [min_x, min_y]]]
+
+
+def properties(city, code):
+    return {"N03_001": "東京都", "N03_004": city, "N03_007": code}
+
+
+def feature(city, code, *polygons):
+    return {
+        "type": "Feature",
+        "properties": properties(city, code),
+        "geometry": {"type": "Polygon", "coordinates": polygons[0]} if len(polygons) == 1
+        else {"type": "MultiPolygon", "coordinates": list(polygons)}
+    }
+
+
+def drive(tracker, points, repeat=3):
+    """各地点で confirm_count 回測位し、発生したイベントを (種類, 市区町村) で返す"""
+    events = []
+    for lon, lat in points:
+        for _ in range(repeat):
+            events.extend((event["type"], event["municipality"]["city"]) for event in tracker.update(lat, lon))
+    return events
+
+
+def test_features_with_same_code_are_merged(tmp_path):
+    # 隣り合う2つの地物と、離れた島（MultiPolygon）に分かれた同じ市
+    path = tmp_path / "n03.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": [
+        feature("千代田区", "13101", square(139.0, 35.0)),
+        feature("千代田区", "13101", square(139.1, 35.0), square(139.5, 35.0)),
+        feature("中央区", "13102", square(139.2, 35.0)),
+    ]}), encoding="utf-8")
+
+    index = MunicipalityIndex.from_geojson(path)
+    assert [municipality.city for municipality in index.municipalities] == ["千代田区", "中央区"]
+    assert index.locate(35.05, 139.05) is index.locate(35.05, 139.55)
+
+    tracker = MunicipalityTracker(index)
+    events = drive(tracker, [(139.05, 35.05), (139.15, 35.05), (139.25, 35.05), (139.55, 35.05)])
+    assert events == [
+        ("enter", "千代田区"),
+        ("exit", "千代田区"), ("enter", "中央区"),
+        ("exit", "中央区"), ("enter", "千代田区"),
+    ]
+
+
+def test_tracker_compares_by_code():
+    # 読み込み時にまとめていない地物でも、同じコードなら境界を越えたとみなさない
+    index = MunicipalityIndex([
+        Municipality(0, properties("千代田区", "13101"), [square(139.0, 35.0)]),
+        Municipality(1, properties("千代田区", "13101"), [square(139.1, 35.0)]),
+    ])
+    tracker = MunicipalityTracker(index)
+    assert drive(tracker, [(139.05, 35.05), (139.15, 35.05), (139.05, 35.05)]) == [("enter", "千代田区")]
+    assert tracker.current is index.municipalities[0]
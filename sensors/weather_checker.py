@@ -13,10 +13,15 @@ from datetime import datetime, timedelta
 class WeatherChecker:
     """天気予報チェッククラス（ダミー実装）"""
 
-    def __init__(self, api_key=None):
-        """初期化"""
+    def __init__(self, api_key=None, rain_predictor=None):
+        """初期化
+
+        rain_predictor に RainArrivalPredictor を渡すと、雨アラートは
+        格子降水予報と進行方向から算出した到達予測になる
+        """
         self.api_key = api_key or "dummy_api_key"
         self.base_url = "https://api.openweathermap.org/data/2.5"
+        self.rain_predictor = rain_predictor
         print(f"[DUMMY] WeatherChecker initialized")
 
     def get_current_weather(self, lat, lon):
@@ -81,11 +86,22 @@ class WeatherChecker:
         print(f"[DUMMY] Forecast retrieved for {days} days")
         return forecast_data
 
-    def check_rain_alert(self, lat, lon, hours_ahead=3):
-        """雨アラートをチェック（ダミー実装）"""
+    def check_rain_alert(self, lat, lon, hours_ahead=3, heading=None, speed=None):
+        """雨アラートをチェック（rain_predictorがなければダミー実装）"""
+        if self.rain_predictor:
+            return {
+                "timestamp": datetime.now().isoformat(),
+                "location": {
+                    "latitude": lat,
+                    "longitude": lon
+                },
+                "alert": self.rain_predictor.predict(lat, lon, heading=heading, speed_kmh=speed)
+            }
+
         print(f"[DUMMY] Checking rain alert for next {hours_ahead} hours")
 
-        # ダミーの雨予報データ
+        # ダミーの雨予報データ（雨が降る場合のみ到達時刻を持つ）
+        is_rain_expected = random.choice([True, False])
         rain_alert = {
             "timestamp": datetime.now().isoformat(),
             "location": {
@@ -93,8 +109,8 @@ class WeatherChecker:
                 "longitude": lon
             },
             "alert": {
-                "is_rain_expected": random.choice([True, False]),
-                "hours_until_rain": random.uniform(0.5, hours_ahead) if random.random() > 0.5 else None,
+                "is_rain_expected": is_rain_expected,
+                "hours_until_rain": random.uniform(0.5, hours_ahead) if is_rain_expected else None,
                 "intensity": random.choice(["light", "moderate", "heavy"]),
                 "duration_hours": random.uniform(0.5, 3),
                 "probability": random.uniform(60, 95)
@@ -114,7 +130,10 @@ class WeatherChecker:
         """天気サマリーを取得"""
         current = self.get_current_weather(lat, lon)
         rain_alert = self.check_rain_alert(lat, lon)
+        return self.summarize(current, rain_alert)
 
+    def summarize(self, current, rain_alert):
+        """取得済みの現在の天気と雨アラートからサマリーを作成"""
         summary = {
             "current_condition": current["current"]["condition"],
             "current_temperature": current["current"]["temperature"],
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+天気データサービス
+座標を丸めたセル単位で現在の天気・予報・雨アラートを1つのスナップショットにまとめてキャッシュする。
+同じセルへの同時リクエストは1回の取得にまとめ（重複排除）、期限切れのデータは
+バックグラウンドで再取得しながらそのまま返す（stale-while-revalidate）。
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WeatherDataService:
+    """WeatherChecker の取得結果をセル単位でキャッシュするサービス"""
+
+    def __init__(self, checker, cell_deg=0.05, fresh_ttl=300, stale_ttl=3600,
+                 forecast_days=5, rain_alert_hours=3, max_workers=2):
+        self.checker = checker
+        self.cell_deg = cell_deg
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.forecast_days = forecast_days
+        self.rain_alert_hours = rain_alert_hours
+        self._snapshots = {}
+        self._inflight = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="weather")
+
+    def cell_key(self, lat, lon):
+        """座標を丸めたセルキー"""
+        return (round(lat / self.cell_deg), round(lon / self.cell_deg))
+
+    def add_listener(self, callback):
+        """スナップショット更新時のコールバックを登録（取得スレッドから呼ばれる）"""
+        self._listeners.append(callback)
+
+    def get_snapshot(self, lat, lon, heading=None, speed=None, block=False, timeout=None):
+        """
+        スナップショットを取得
+
+        新鮮なデータはそのまま返し、期限切れ（stale_ttl以内）のデータは
+        再取得を開始した上で返す。データがない場合は block=True なら取得完了を待つ。
+        """
+        key = self.cell_key(lat, lon)
+        now = time.time()
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+
+        if snapshot:
+            age = now - snapshot["fetched_at"]
+            if age < self.fresh_ttl:
+                return snapshot
+            if age < self.stale_ttl:
+                self.refresh(lat, lon, heading, speed)
+                return {**snapshot, "stale": True}
+
+        future = self.refresh(lat, lon, heading, speed)
+        if block:
+            return future.result(timeout=timeout)
+        return None
+
+    def refresh(self, lat, lon, heading=None, speed=None):
+        """セルの再取得を開始（同じセルの取得中リクエストがあればそれを共有）"""
+        key = self.cell_key(lat, lon)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._fetch, key, lat, lon, heading, speed)
+                self._inflight[key] = future
+        return future
+
+    def _fetch(self, key, lat, lon, heading, speed):
+        """現在の天気・予報・雨アラートをまとめて取得"""
+        try:
+            current = self.checker.get_current_weather(lat, lon)
+            forecast = self.checker.get_forecast(lat, lon, self.forecast_days)
+            rain_alert = self.checker.check_rain_alert(lat, lon, self.rain_alert_hours,
+                                                       heading=heading, speed=speed)
+            snapshot = {
+                "cell": list(key),
+                "fetched_at": time.time(),
+                "stale": False,
+                "current": current,
+                "forecast": forecast,
+                "rain_alert": rain_alert,
+                "summary": self.checker.summarize(current, rain_alert)
+            }
+            with self._lock:
+                self._snapshots[key] = snapshot
+                # stale_ttlを過ぎたセルは破棄
+                expired = [k for k, s in self._snapshots.items()
+                           if snapshot["fetched_at"] - s["fetched_at"] >= self.stale_ttl]
+                for k in expired:
+                    del self._snapshots[k]
+        except Exception as e:
+            print(f"[ERROR] Weather fetch failed for cell {key}: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"[ERROR] Weather listener error: {e}")
+        return snapshot
+
+    def shutdown(self):
+        """取得スレッドを停止"""
+        self._executor.shutdown(wait=False)
@@ -10,6 +10,12 @@ import sys
 import os
 from pathlib import Path
 
+class _ScriptParams(dict):
+    """未指定のプレースホルダーは空文字にする"""
+
+    def __missing__(self, key):
+        return ""
+
 class ZundamonSpeaker:
     """ずんだもん音声出力クラス（ダミー実装）"""
 
@@ -41,17 +47,22 @@ class ZundamonSpeaker:
 
         return True
 
-    def speak_script(self, script_key, animation=None):
-        """定型文を音声出力"""
+    def format_script(self, script_key, **params):
+        """定型文を取得し、{city} などのプレースホルダーを埋める"""
         scripts = self.config.get('scripts', {})
-        if script_key in scripts:
-            text = scripts[script_key]
-            if animation is None:
-                animation = "speaking"
-            return self.speak(text, animation)
-        else:
+        if script_key not in scripts:
             print(f"[ERROR] Script key not found: {script_key}")
+            return None
+        return scripts[script_key].format_map(_ScriptParams(params))
+
+    def speak_script(self, script_key, animation=None, **params):
+        """定型文を音声出力"""
+        text = self.format_script(script_key, **params)
+        if text is None:
             return False
+        if animation is None:
+            animation = "speaking"
+        return self.speak(text, animation)
 
     def get_available_scripts(self):
         """利用可能な定型文一覧を取得"""